@@ -3,7 +3,7 @@ from django.urls import reverse
 from django.utils import timezone
 from django.utils.html import format_html
 
-from .models import TemporaryFile
+from .models import TemporaryFile, UploadSession
 
 
 @admin.register(TemporaryFile)
@@ -38,6 +38,7 @@ class TemporaryFileAdmin(admin.ModelAdmin):
         "full_file_path",
         "is_expired",
         "file_exists",
+        "blob",
     ]
 
     ordering = ["-uploaded_at"]
@@ -126,9 +127,28 @@ class TemporaryFileAdmin(admin.ModelAdmin):
                     "full_file_path",
                     "file_size_display",
                     "mime_type",
+                    "blob",
                 )
             },
         ),
         ("Timestamps", {"fields": ("uploaded_at", "expires_at")}),
         ("Status", {"fields": ("is_expired", "file_exists")}),
     )
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = [
+        "original_filename",
+        "file_size",
+        "mime_type",
+        "created_at",
+        "expires_at",
+        "temporary_file",
+    ]
+
+    search_fields = ["original_filename", "id"]
+
+    readonly_fields = ["id", "created_at", "partial_file_path"]
+
+    ordering = ["-created_at"]
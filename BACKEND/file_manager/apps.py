@@ -1,6 +1,13 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class FileManagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'file_manager'
+
+    def ready(self):
+        # Uploads are spooled here; Django requires the directory to exist
+        os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
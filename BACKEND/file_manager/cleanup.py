@@ -0,0 +1,90 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import FileBlob, StorageCounter, TemporaryFile, remove_file
+from .signals import temporary_files_deleted
+
+
+def bulk_delete_files(queryset, batch_size=None, workers=None, on_batch=None):
+    """
+    Delete the TemporaryFile rows of a queryset together with their files.
+
+    Rows are taken in batches ordered by expires_at (indexed). For each
+    batch, files not backed by a blob are unlinked on a small thread pool
+    and then the rows are deleted and blob references released in one
+    short transaction. `on_batch` is called with the running stats after
+    every batch.
+
+    Returns dict with throughput stats
+    """
+    batch_size = batch_size or settings.FILE_CLEANUP_BATCH_SIZE
+    workers = workers or settings.FILE_CLEANUP_WORKERS
+
+    stats = {
+        "deleted": 0,
+        "bytes": 0,
+        "files_removed": 0,
+        "blobs_removed": 0,
+        "batches": 0,
+        "elapsed_seconds": 0.0,
+        "files_per_second": 0.0,
+    }
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(
+                queryset.order_by("expires_at").values_list(
+                    "id", "file_path", "file_size", "blob_id"
+                )[:batch_size]
+            )
+            if not batch:
+                break
+
+            paths = [
+                os.path.join(settings.MEDIA_ROOT, file_path)
+                for _, file_path, _, blob_id in batch
+                if blob_id is None
+            ]
+            stats["files_removed"] += sum(pool.map(remove_file, paths))
+
+            with transaction.atomic():
+                # Only release blob references for rows this run really deletes
+                rows = list(
+                    TemporaryFile.objects.select_for_update()
+                    .filter(id__in=[row[0] for row in batch])
+                    .values_list("id", "file_size", "blob_id", "expires_at")
+                )
+                TemporaryFile.objects.filter(id__in=[row[0] for row in rows]).delete()
+                StorageCounter.remove_files([(row[1], row[3]) for row in rows])
+                blob_refs = Counter(row[2] for row in rows if row[2] is not None)
+                stats["blobs_removed"] += FileBlob.release_many(
+                    blob_refs, unlink=pool.map
+                )
+
+            if not rows:
+                # Another cleanup run took this batch
+                continue
+
+            temporary_files_deleted.send(
+                sender=TemporaryFile, file_ids=[row[0] for row in rows]
+            )
+
+            stats["deleted"] += len(rows)
+            stats["bytes"] += sum(row[1] for row in rows)
+            stats["batches"] += 1
+
+            elapsed = time.monotonic() - started
+            stats["elapsed_seconds"] = round(elapsed, 3)
+            if elapsed:
+                stats["files_per_second"] = round(stats["deleted"] / elapsed, 1)
+
+            if on_batch:
+                on_batch(stats)
+
+    return stats
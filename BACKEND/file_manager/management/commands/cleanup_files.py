@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
-from file_manager.models import TemporaryFile
+from file_manager.cleanup import bulk_delete_files
+from file_manager.models import TemporaryFile, UploadSession
 
 
 class Command(BaseCommand):
@@ -18,6 +19,18 @@ class Command(BaseCommand):
             help="Delete all files regardless of expiration",
         )
 
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Rows deleted per transaction (default: FILE_CLEANUP_BATCH_SIZE)",
+        )
+
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Threads unlinking files (default: FILE_CLEANUP_WORKERS)",
+        )
+
     def handle(self, *args, **options):
         dry_run = options["dry_run"]
         force = options["force"]
@@ -32,6 +45,8 @@ class Command(BaseCommand):
                 expires_at__lt=timezone.now()
             )
 
+        self.cleanup_upload_sessions(dry_run)
+
         count = files_to_delete.count()
 
         if count == 0:
@@ -42,25 +57,52 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.WARNING(f"DRY RUN: Would delete {count} files:")
             )
-            for file_obj in files_to_delete:
-                self.stdout.write(f"  - {file_obj.original_filename} ({file_obj.id})")
-        else:
-            self.stdout.write(f"Deleting {count} files...")
-
-            deleted_count = 0
-            for file_obj in files_to_delete:
-                try:
-                    filename = file_obj.original_filename
-                    file_obj.delete()
-                    deleted_count += 1
-                    self.stdout.write(f"  ✓ Deleted: {filename}")
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f"  ✗ Failed to delete {file_obj.original_filename}: {e}"
-                        )
-                    )
+            for file_id, filename in files_to_delete.values_list(
+                "id", "original_filename"
+            ).iterator():
+                self.stdout.write(f"  - {filename} ({file_id})")
+            return
+
+        self.stdout.write(f"Deleting {count} files...")
+
+        def report_batch(stats):
+            if options["verbosity"] >= 2:
+                self.stdout.write(
+                    f"  ✓ Batch {stats['batches']}: {stats['deleted']}/{count} files "
+                    f"({stats['files_per_second']} files/s)"
+                )
+
+        stats = bulk_delete_files(
+            files_to_delete,
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            on_batch=report_batch,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully deleted {stats['deleted']} files "
+                f"({stats['bytes'] / (1024 * 1024):.1f} MB, "
+                f"{stats['files_removed']} files and {stats['blobs_removed']} blobs "
+                f"unlinked) in {stats['elapsed_seconds']:.2f}s "
+                f"({stats['files_per_second']} files/s)"
+            )
+        )
+
+    def cleanup_upload_sessions(self, dry_run):
+        """Remove expired chunked upload sessions and their partial files"""
+        if dry_run:
+            from django.utils import timezone
+
+            count = UploadSession.objects.filter(expires_at__lt=timezone.now()).count()
+            if count:
+                self.stdout.write(
+                    self.style.WARNING(f"DRY RUN: Would delete {count} upload sessions")
+                )
+            return
 
+        count = UploadSession.cleanup_expired_sessions()
+        if count:
             self.stdout.write(
-                self.style.SUCCESS(f"Successfully deleted {deleted_count} files")
+                self.style.SUCCESS(f"Deleted {count} expired upload sessions")
             )
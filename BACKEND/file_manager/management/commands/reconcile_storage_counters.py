@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from file_manager.models import StorageCounter
+
+
+class Command(BaseCommand):
+    help = "Recompute the storage counters from the temporary files table"
+
+    def handle(self, *args, **options):
+        previous, current = StorageCounter.reconcile()
+
+        if previous is None:
+            self.stdout.write(
+                self.style.WARNING("Storage counters were missing and have been created")
+            )
+        else:
+            drift = {name: current[name] - previous[name] for name in current}
+            if any(drift.values()):
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Fixed drift: files {drift['files']:+d}, "
+                        f"bytes {drift['bytes']:+d}, "
+                        f"expired files {drift['expired_files']:+d}, "
+                        f"expired bytes {drift['expired_bytes']:+d}"
+                    )
+                )
+            else:
+                self.stdout.write("Storage counters were already correct")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Storage counters: {current['files']} files "
+                f"({current['expired_files']} expired), "
+                f"{current['bytes'] / (1024 * 1024):.2f} MB"
+            )
+        )
@@ -0,0 +1,29 @@
+from ilovepdf_clone.metrics import REGISTRY, Counter
+
+from .utils import get_storage_stats
+
+UPLOAD_BYTES = Counter("file_upload_bytes_total", "Bytes received in file uploads")
+DOWNLOAD_BYTES = Counter("file_download_bytes_total", "Bytes sent in file downloads")
+
+
+@REGISTRY.register_collector
+def collect_storage_totals():
+    """Temporary file totals, read from the storage counters on each scrape"""
+    stats = get_storage_stats()
+    return [
+        (
+            "temporary_files",
+            "gauge",
+            "Temporary files stored, by state",
+            [
+                ({"state": "active"}, stats["active_files"]),
+                ({"state": "expired"}, stats["expired_files"]),
+            ],
+        ),
+        (
+            "temporary_files_bytes",
+            "gauge",
+            "Bytes of the active temporary files",
+            [({}, stats["total_storage_bytes"])],
+        ),
+    ]
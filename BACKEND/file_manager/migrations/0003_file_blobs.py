@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_manager', '0002_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file_path', models.CharField(max_length=500)),
+                ('file_size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'file_blobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='temporaryfile',
+            name='blob',
+            field=models.ForeignKey(blank=True, help_text='Shared content, file_path points at it when set', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='file_manager.fileblob'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_manager', '0003_file_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='temporaryfile',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:31
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def seed_counters(apps, schema_editor):
+    TemporaryFile = apps.get_model("file_manager", "TemporaryFile")
+    StorageCounter = apps.get_model("file_manager", "StorageCounter")
+    totals = TemporaryFile.objects.aggregate(
+        files=Count("id"), bytes=Coalesce(Sum("file_size"), 0)
+    )
+    for name, value in totals.items():
+        StorageCounter.objects.create(name=name, value=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_manager', '0004_temporaryfile_expires_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'storage_counters',
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
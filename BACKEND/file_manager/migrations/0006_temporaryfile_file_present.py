@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_manager', '0005_storage_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='temporaryfile',
+            name='file_present',
+            field=models.BooleanField(default=True, help_text='Whether the file was on storage when last checked'),
+        ),
+        migrations.AddIndex(
+            model_name='temporaryfile',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='temp_files_uploaded_id_idx'),
+        ),
+    ]
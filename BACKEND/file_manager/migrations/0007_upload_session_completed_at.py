@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:44
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_completed_sessions(apps, schema_editor):
+    UploadSession = apps.get_model("file_manager", "UploadSession")
+    UploadSession.objects.filter(temporary_file__isnull=False).update(
+        completed_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_manager', '0006_temporaryfile_file_present'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, help_text='When the upload was completed', null=True),
+        ),
+        migrations.RunPython(mark_completed_sessions, migrations.RunPython.noop),
+    ]
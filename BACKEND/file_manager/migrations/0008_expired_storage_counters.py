@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:12
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def seed_expired_counters(apps, schema_editor):
+    TemporaryFile = apps.get_model("file_manager", "TemporaryFile")
+    StorageCounter = apps.get_model("file_manager", "StorageCounter")
+    now = timezone.now()
+    expired = Q(expires_at__lte=now)
+    totals = TemporaryFile.objects.aggregate(
+        expired_files=Count("id", filter=expired),
+        expired_bytes=Coalesce(Sum("file_size", filter=expired), 0),
+    )
+    totals["expired_through"] = int(now.timestamp() * 1_000_000)
+    for name, value in totals.items():
+        StorageCounter.objects.update_or_create(name=name, defaults={"value": value})
+
+
+def remove_expired_counters(apps, schema_editor):
+    StorageCounter = apps.get_model("file_manager", "StorageCounter")
+    StorageCounter.objects.filter(
+        name__in=["expired_files", "expired_bytes", "expired_through"]
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_manager', '0007_upload_session_completed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_expired_counters, remove_expired_counters),
+    ]
@@ -1,11 +1,298 @@
 import os
 import uuid
-from datetime import timedelta
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
 
 from django.conf import settings
-from django.db import models
+from django.core.files.move import file_move_safe
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from .signals import temporary_files_deleted
+
+
+def remove_file(path):
+    """Remove a file, returning False if it could not be removed"""
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+class FileBlob(models.Model):
+    """
+    Content-addressed file stored once under blobs/ and shared, with a
+    reference count, by every TemporaryFile holding the same bytes
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file_path = models.CharField(max_length=500)
+    file_size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "file_blobs"
+
+    @staticmethod
+    def blob_path(sha256):
+        """Relative storage path for a digest, fanned out by its first bytes"""
+        return os.path.join("blobs", sha256[:2], sha256[2:4], sha256)
+
+    @property
+    def full_file_path(self):
+        """Returns the absolute path to the blob"""
+        return os.path.join(settings.MEDIA_ROOT, self.file_path)
+
+    @classmethod
+    def store(cls, source_path, sha256):
+        """
+        Take a reference on the blob with this digest. source_path is moved
+        into the store when the content is new and removed otherwise.
+        Returns FileBlob instance
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(sha256=sha256).first()
+
+            if blob is not None and os.path.exists(blob.full_file_path):
+                try:
+                    os.remove(source_path)
+                except OSError:
+                    # Upload temp files still open on Windows remove themselves
+                    pass
+            else:
+                file_path = cls.blob_path(sha256)
+                full_path = os.path.join(settings.MEDIA_ROOT, file_path)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                file_move_safe(source_path, full_path, allow_overwrite=True)
+                if settings.FILE_UPLOAD_PERMISSIONS is not None:
+                    os.chmod(full_path, settings.FILE_UPLOAD_PERMISSIONS)
+
+                if blob is None:
+                    blob, _ = cls.objects.get_or_create(
+                        sha256=sha256,
+                        defaults={
+                            "file_path": file_path,
+                            "file_size": os.path.getsize(full_path),
+                        },
+                    )
+
+            cls.objects.filter(sha256=sha256).update(ref_count=F("ref_count") + 1)
+
+        blob.refresh_from_db()
+        return blob
+
+    @classmethod
+    def release(cls, sha256, count=1):
+        """
+        Drop references to a blob, unlinking its file when the last one
+        goes away. Returns True if the blob was removed.
+        """
+        return cls.release_many({sha256: count}) > 0
+
+    @classmethod
+    def release_many(cls, counts, unlink=None):
+        """
+        Drop references for several blobs at once from a {sha256: count}
+        mapping. Blobs left without references are deleted and their files
+        unlinked (with `unlink`, which maps over paths, if given) before the
+        transaction commits so a concurrent store() cannot lose its file.
+        A blob still used by a TemporaryFile is kept whatever its count says,
+        and files are only unlinked once their rows are deleted.
+        Returns the number of blobs removed.
+        """
+        if not counts:
+            return 0
+
+        with transaction.atomic():
+            # One UPDATE per distinct decrement (almost always just 1)
+            by_count = {}
+            for sha256, count in counts.items():
+                by_count.setdefault(count, []).append(sha256)
+            for count, digests in by_count.items():
+                cls.objects.filter(sha256__in=digests).update(
+                    ref_count=F("ref_count") - count
+                )
+            orphans = list(
+                cls.objects.select_for_update()
+                .filter(sha256__in=counts, ref_count__lte=0)
+                # A drifted count must not take the file from a remaining row
+                .exclude(files__isnull=False)
+                .values_list("sha256", "file_path")
+            )
+            if not orphans:
+                return 0
+
+            cls.objects.filter(sha256__in=[sha256 for sha256, _ in orphans]).delete()
+            paths = [os.path.join(settings.MEDIA_ROOT, path) for _, path in orphans]
+            list((unlink or map)(remove_file, paths))
+
+        return len(orphans)
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} refs)"
+
+
+class StorageCounter(models.Model):
+    """
+    Running totals of the temporary_files table (row count and bytes), kept
+    up to date on create and delete so storage stats do not scan the table.
+    The expired_* counters hold the part of them already expired: rows are
+    moved into them by move_expired(), which only reads the rows that
+    expired since its last call (expired_through, in microseconds since the
+    epoch). Rows are seeded by a migration and rebuilt by
+    reconcile_storage_counters.
+    """
+
+    FILES = "files"
+    BYTES = "bytes"
+    EXPIRED_FILES = "expired_files"
+    EXPIRED_BYTES = "expired_bytes"
+    EXPIRED_THROUGH = "expired_through"
+    TOTALS = (FILES, BYTES, EXPIRED_FILES, EXPIRED_BYTES)
+
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "storage_counters"
+
+    @staticmethod
+    def timestamp(moment):
+        """Microseconds since the epoch, the unit of EXPIRED_THROUGH"""
+        return int(moment.timestamp() * 1_000_000)
+
+    @classmethod
+    def add(cls, **deltas):
+        """
+        Apply deltas by counter name, e.g. add(files=1, bytes=size)
+        (no-op when FILE_STORAGE_COUNTERS is off)
+        """
+        if not settings.FILE_STORAGE_COUNTERS:
+            return
+        for name, delta in deltas.items():
+            if delta:
+                cls.objects.filter(name=name).update(
+                    value=F("value") + delta, updated_at=timezone.now()
+                )
+
+    @classmethod
+    def _expired_through(cls):
+        """Locked EXPIRED_THROUGH value, or None if it is missing"""
+        return (
+            cls.objects.select_for_update()
+            .filter(name=cls.EXPIRED_THROUGH)
+            .values_list("value", flat=True)
+            .first()
+        )
+
+    @classmethod
+    def add_files(cls, rows):
+        """Count new files given as (file_size, expires_at) pairs"""
+        cls._apply(rows, 1)
+
+    @classmethod
+    def remove_files(cls, rows):
+        """Take deleted files given as (file_size, expires_at) pairs off"""
+        cls._apply(rows, -1)
+
+    @classmethod
+    def _apply(cls, rows, sign):
+        if not settings.FILE_STORAGE_COUNTERS or not rows:
+            return
+        expired_sizes = []
+        now = timezone.now()
+        if any(expires_at <= now for _, expires_at in rows):
+            # Only rows move_expired() has already counted as expired
+            expired_through = cls._expired_through()
+            if expired_through is not None:
+                expired_sizes = [
+                    size
+                    for size, expires_at in rows
+                    if cls.timestamp(expires_at) <= expired_through
+                ]
+        cls.add(
+            files=sign * len(rows),
+            bytes=sign * sum(size for size, _ in rows),
+            expired_files=sign * len(expired_sizes),
+            expired_bytes=sign * sum(expired_sizes),
+        )
+
+    @classmethod
+    def move_expired(cls, now=None):
+        """Add the files that expired since the last call to expired_*"""
+        if not settings.FILE_STORAGE_COUNTERS:
+            return
+        now = now or timezone.now()
+        with transaction.atomic():
+            expired_through = cls._expired_through()
+            if expired_through is None or cls.timestamp(now) <= expired_through:
+                return
+            since = datetime.fromtimestamp(
+                expired_through / 1_000_000, tz=dt_timezone.utc
+            )
+            expired = TemporaryFile.objects.filter(
+                expires_at__gt=since, expires_at__lte=now
+            ).aggregate(files=Count("id"), bytes=Coalesce(Sum("file_size"), 0))
+            if not expired["files"]:
+                # Nothing to move; the next call looks at the same range again
+                return
+            cls.add(expired_files=expired["files"], expired_bytes=expired["bytes"])
+            cls.objects.filter(name=cls.EXPIRED_THROUGH).update(
+                value=cls.timestamp(now), updated_at=timezone.now()
+            )
+
+    @classmethod
+    def totals(cls):
+        """
+        Return {"files": ..., "bytes": ..., "expired_files": ...,
+        "expired_bytes": ...} from the counters, or None when they are
+        disabled or have not been initialised
+        """
+        if not settings.FILE_STORAGE_COUNTERS:
+            return None
+        values = dict(
+            cls.objects.filter(name__in=cls.TOTALS).values_list("name", "value")
+        )
+        if len(values) < len(cls.TOTALS):
+            return None
+        return values
+
+    @classmethod
+    def reconcile(cls):
+        """
+        Recompute the counters from the temporary_files table.
+        Returns (previous totals or None, current totals).
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            # Lock the counters so concurrent creates/deletes wait for us
+            previous = dict(
+                cls.objects.select_for_update().values_list("name", "value")
+            )
+            expired = Q(expires_at__lte=now)
+            actual = TemporaryFile.objects.aggregate(
+                files=Count("id"),
+                bytes=Coalesce(Sum("file_size"), 0),
+                expired_files=Count("id", filter=expired),
+                expired_bytes=Coalesce(Sum("file_size", filter=expired), 0),
+            )
+            for name, value in actual.items():
+                cls.objects.update_or_create(name=name, defaults={"value": value})
+            cls.objects.update_or_create(
+                name=cls.EXPIRED_THROUGH, defaults={"value": cls.timestamp(now)}
+            )
+
+        previous = {name: previous[name] for name in actual if name in previous}
+        return (previous if len(previous) == len(actual) else None), actual
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
 
 class TemporaryFile(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -14,17 +301,40 @@ class TemporaryFile(models.Model):
     file_size = models.BigIntegerField()
     mime_type = models.CharField(max_length=100)
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    blob = models.ForeignKey(
+        FileBlob,
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        related_name="files",
+        help_text="Shared content, file_path points at it when set",
+    )
+    file_present = models.BooleanField(
+        default=True,
+        help_text="Whether the file was on storage when last checked",
+    )
 
     class Meta:
         db_table = "temporary_files"
         ordering = ["-uploaded_at"]
+        indexes = [
+            # Keyset pagination of list_files
+            models.Index(
+                fields=["-uploaded_at", "-id"], name="temp_files_uploaded_id_idx"
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.expires_at:
             # Files expire after 1 hour by default
             self.expires_at = timezone.now() + timedelta(hours=1)
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            StorageCounter.add_files([(self.file_size, self.expires_at)])
 
     @property
     def is_expired(self):
@@ -40,9 +350,17 @@ class TemporaryFile(models.Model):
         """Check if the physical file still exists"""
         return os.path.exists(self.full_file_path)
 
+    def refresh_file_present(self):
+        """Stat the file and persist the result when it changed"""
+        exists = self.file_exists
+        if exists != self.file_present:
+            self.file_present = exists
+            TemporaryFile.objects.filter(id=self.id).update(file_present=exists)
+        return exists
+
     def delete_file(self):
-        """Delete the physical file from storage"""
-        if self.file_exists:
+        """Delete the physical file from storage (blob-backed files are released on delete)"""
+        if self.blob_id is None and self.file_exists:
             try:
                 os.remove(self.full_file_path)
                 return True
@@ -52,18 +370,163 @@ class TemporaryFile(models.Model):
 
     def delete(self, *args, **kwargs):
         """Override delete to also remove physical file"""
+        file_id, blob_id = self.id, self.blob_id
         self.delete_file()
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            StorageCounter.remove_files([(self.file_size, self.expires_at)])
+        if blob_id is not None:
+            # The blob is only unlinked when this was its last reference
+            FileBlob.release(blob_id)
+        temporary_files_deleted.send(sender=TemporaryFile, file_ids=[file_id])
+        return result
 
     @classmethod
     def cleanup_expired_files(cls):
         """Class method to clean up expired files"""
+        from .cleanup import bulk_delete_files
+
         expired_files = cls.objects.filter(expires_at__lt=timezone.now())
+        return bulk_delete_files(expired_files)["deleted"]
+
+    def __str__(self):
+        return f"{self.original_filename} ({self.id})"
+
+
+class UploadSession(models.Model):
+    """Resumable chunked upload whose bytes are assembled on disk"""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    original_filename = models.CharField(max_length=255)
+    file_size = models.BigIntegerField()
+    mime_type = models.CharField(max_length=100, blank=True)
+    temporary_file = models.ForeignKey(
+        TemporaryFile,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        help_text="File created when the upload was completed",
+    )
+    # Kept when temporary_file expires or is deleted: a completed session
+    # never accepts chunks again
+    completed_at = models.DateTimeField(
+        blank=True, null=True, help_text="When the upload was completed"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "upload_sessions"
+        ordering = ["-created_at"]
+
+    def save(self, *args, **kwargs):
+        if not self.expires_at:
+            # Unfinished uploads are kept for 24 hours so clients can resume
+            self.expires_at = timezone.now() + timedelta(hours=24)
+        super().save(*args, **kwargs)
+
+    @property
+    def is_expired(self):
+        return timezone.now() > self.expires_at
+
+    @property
+    def is_completed(self):
+        return self.completed_at is not None
+
+    @property
+    def partial_file_path(self):
+        """Returns the absolute path to the partially received file"""
+        return os.path.join(settings.FILE_UPLOAD_TEMP_DIR, "chunked", f"{self.id}.part")
+
+    def create_partial_file(self):
+        """Create the sparse file that chunks are written into"""
+        os.makedirs(os.path.dirname(self.partial_file_path), exist_ok=True)
+        with open(self.partial_file_path, "wb") as partial_file:
+            partial_file.truncate(self.file_size)
+
+    def write_chunk(self, offset, stream, length, buffer_size=64 * 1024):
+        """
+        Copy `length` bytes from stream into the partial file at offset.
+        The chunk is only recorded once all of its bytes have been written,
+        so an interrupted request can simply be sent again.
+        """
+        written = 0
+        with open(self.partial_file_path, "r+b") as partial_file:
+            partial_file.seek(offset)
+            while written < length:
+                data = stream.read(min(buffer_size, length - written))
+                if not data:
+                    break
+                partial_file.write(data)
+                written += len(data)
+
+        if written != length:
+            raise ValueError(f"Incomplete chunk: received {written} of {length} bytes")
+
+        self.chunks.create(offset=offset, length=length)
+
+    @property
+    def received_ranges(self):
+        """Merged list of received [start, end) byte ranges"""
+        ranges = []
+        for offset, length in self.chunks.order_by("offset").values_list(
+            "offset", "length"
+        ):
+            end = offset + length
+            if ranges and offset <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([offset, end])
+        return ranges
+
+    def get_progress(self):
+        """Summary of the received bytes, used to resume the upload"""
+        ranges = self.received_ranges
+        received_offset = ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+        return {
+            "received_ranges": ranges,
+            "received_offset": received_offset,
+            "received_bytes": sum(end - start for start, end in ranges),
+            "is_complete": received_offset == self.file_size,
+        }
+
+    def delete_partial_file(self):
+        """Delete the partially received file from disk"""
+        try:
+            os.remove(self.partial_file_path)
+            return True
+        except OSError:
+            return False
+
+    def delete(self, *args, **kwargs):
+        """Override delete to also remove the partial file"""
+        self.delete_partial_file()
+        super().delete(*args, **kwargs)
+
+    @classmethod
+    def cleanup_expired_sessions(cls):
+        """Class method to clean up expired upload sessions"""
+        expired_sessions = cls.objects.filter(expires_at__lt=timezone.now())
         count = 0
-        for file_obj in expired_files:
-            file_obj.delete()
+        for session in expired_sessions:
+            session.delete()
             count += 1
         return count
 
     def __str__(self):
-        return f"{self.original_filename} ({self.id})"
+        return f"{self.original_filename} upload ({self.id})"
+
+
+class UploadChunk(models.Model):
+    """Byte range received for an UploadSession"""
+
+    session = models.ForeignKey(
+        UploadSession, on_delete=models.CASCADE, related_name="chunks"
+    )
+    offset = models.BigIntegerField()
+    length = models.BigIntegerField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "upload_chunks"
+        ordering = ["offset"]
@@ -0,0 +1,48 @@
+import base64
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(temp_file):
+    """Opaque cursor pointing just after the given row"""
+    raw = f"{temp_file.uploaded_at.isoformat()}|{temp_file.id.hex}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (uploaded_at, id) from a cursor, raising ValueError if invalid"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        uploaded_at, file_id = (
+            base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        )
+        uploaded_at = parse_datetime(uploaded_at)
+        file_id = uuid.UUID(file_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if uploaded_at is None:
+        raise ValueError("Invalid cursor")
+    return uploaded_at, file_id
+
+
+def paginate_by_keyset(queryset, cursor=None, limit=50):
+    """
+    Return (rows, next_cursor) for the page of queryset after cursor, newest
+    first. Pages are located with a (uploaded_at, id) seek instead of an
+    OFFSET, so every page costs the same however deep it is.
+    """
+    queryset = queryset.order_by("-uploaded_at", "-id")
+    if cursor:
+        uploaded_at, file_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=file_id)
+        )
+
+    # One extra row tells whether there is another page
+    rows = list(queryset[: limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
@@ -1,12 +1,14 @@
+import os
+
 from rest_framework import serializers
 
-from .models import TemporaryFile
+from .models import TemporaryFile, UploadSession
 
 
 class TemporaryFileSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     is_expired = serializers.ReadOnlyField()
-    file_exists = serializers.ReadOnlyField()
+    file_exists = serializers.SerializerMethodField()
 
     class Meta:
         model = TemporaryFile
@@ -23,6 +25,10 @@ class TemporaryFileSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "uploaded_at", "expires_at"]
 
+    def get_file_exists(self, obj):
+        """Persisted flag; views that need a fresh check refresh it first"""
+        return obj.file_present
+
     def get_file_url(self, obj):
         """Generate download URL for the file"""
         request = self.context.get("request")
@@ -31,72 +37,119 @@ class TemporaryFileSerializer(serializers.ModelSerializer):
         return f"/api/files/download/{obj.id}/"
 
 
+# Check file type - PDF, images, and Microsoft Office documents
+ALLOWED_FILE_TYPES = [
+    # PDF files
+    "application/pdf",
+    # Image files
+    "image/jpeg",
+    "image/jpg",
+    "image/png",
+    "image/gif",
+    "image/bmp",
+    "image/tiff",
+    # Microsoft Office documents
+    "application/msword",  # .doc
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # .docx
+    "application/vnd.ms-excel",  # .xls
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # .xlsx
+    "application/vnd.ms-powerpoint",  # .ppt
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",  # .pptx
+    # Sometimes Office files are detected as octet-stream, so we'll check by extension too
+    "application/octet-stream",
+]
+
+ALLOWED_EXTENSIONS = [
+    ".pdf",
+    ".doc",
+    ".docx",
+    ".xls",
+    ".xlsx",
+    ".ppt",
+    ".pptx",
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".bmp",
+    ".tiff",
+]
+
+MAX_UPLOAD_SIZE = 200 * 1024 * 1024  # 50MB
+
+
+def validate_file_type(content_type, filename):
+    """Validate a declared content type, falling back to the extension for octet-stream"""
+    # If content_type is octet-stream, validate by file extension
+    if content_type == "application/octet-stream":
+        file_extension = None
+        if filename:
+            file_extension = os.path.splitext(filename.lower())[1]
+
+        if not file_extension or file_extension not in ALLOWED_EXTENSIONS:
+            raise serializers.ValidationError(
+                f"File extension '{file_extension}' is not supported. "
+                f"Allowed extensions: {', '.join(ALLOWED_EXTENSIONS)}"
+            )
+
+    elif content_type not in ALLOWED_FILE_TYPES:
+        raise serializers.ValidationError(
+            f"File type '{content_type}' is not supported. "
+            f"Allowed types: PDF, Word, Excel, PowerPoint, JPEG, PNG, GIF, BMP, TIFF"
+        )
+
+
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
 
     def validate_file(self, value):
         """Validate uploaded file"""
         # Check file size (50MB limit)
-        max_size = 200 * 1024 * 1024  # 50MB
-        if value.size > max_size:
+        if value.size > MAX_UPLOAD_SIZE:
             raise serializers.ValidationError("File size cannot exceed 50MB")
 
-        # Check file type - PDF, images, and Microsoft Office documents
-        allowed_types = [
-            # PDF files
-            "application/pdf",
-            # Image files
-            "image/jpeg",
-            "image/jpg",
-            "image/png",
-            "image/gif",
-            "image/bmp",
-            "image/tiff",
-            # Microsoft Office documents
-            "application/msword",  # .doc
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # .docx
-            "application/vnd.ms-excel",  # .xls
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # .xlsx
-            "application/vnd.ms-powerpoint",  # .ppt
-            "application/vnd.openxmlformats-officedocument.presentationml.presentation",  # .pptx
-            # Sometimes Office files are detected as octet-stream, so we'll check by extension too
-            "application/octet-stream",
+        validate_file_type(value.content_type, getattr(value, "name", None))
+
+        return value
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    is_expired = serializers.ReadOnlyField()
+    file_id = serializers.UUIDField(source="temporary_file_id", read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            "id",
+            "original_filename",
+            "file_size",
+            "mime_type",
+            "created_at",
+            "expires_at",
+            "is_expired",
+            "completed_at",
+            "file_id",
         ]
 
-        # If content_type is octet-stream, validate by file extension
-        if value.content_type == "application/octet-stream":
-            allowed_extensions = [
-                ".pdf",
-                ".doc",
-                ".docx",
-                ".xls",
-                ".xlsx",
-                ".ppt",
-                ".pptx",
-                ".jpg",
-                ".jpeg",
-                ".png",
-                ".gif",
-                ".bmp",
-                ".tiff",
-            ]
-
-            file_extension = None
-            if hasattr(value, "name") and value.name:
-                import os
-
-                file_extension = os.path.splitext(value.name.lower())[1]
-
-            if not file_extension or file_extension not in allowed_extensions:
-                raise serializers.ValidationError(
-                    f"File extension '{file_extension}' is not supported. "
-                    f"Allowed extensions: {', '.join(allowed_extensions)}"
-                )
-
-        elif value.content_type not in allowed_types:
-            raise serializers.ValidationError(
-                f"File type '{value.content_type}' is not supported. "
-                f"Allowed types: PDF, Word, Excel, PowerPoint, JPEG, PNG, GIF, BMP, TIFF"
-            )
+    def to_representation(self, instance):
+        """Add received ranges and offsets to the session data"""
+        data = super().to_representation(instance)
+        data.update(instance.get_progress())
+        return data
 
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    file_size = serializers.IntegerField(min_value=1)
+    mime_type = serializers.CharField(
+        max_length=100, required=False, default="application/octet-stream"
+    )
+
+    def validate_file_size(self, value):
+        if value > MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError("File size cannot exceed 50MB")
         return value
+
+    def validate(self, data):
+        validate_file_type(data["mime_type"], data["filename"])
+        return data
@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# Sent with file_ids (list of UUIDs) once TemporaryFile rows have been
+# deleted, one at a time (TemporaryFile.delete) or in bulk (cleanup), so
+# other apps can drop state about those files without a post_delete
+# receiver slowing bulk deletes down
+temporary_files_deleted = Signal()
+
+# Sent with temp_file once a user upload has been stored (a direct upload or
+# a completed chunked upload), not for files produced by operations
+temporary_file_uploaded = Signal()
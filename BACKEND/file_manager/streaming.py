@@ -0,0 +1,284 @@
+import io
+import os
+import re
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_SPEC_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+# Requests with more ranges than this are answered with the whole file
+MAX_RANGES = 20
+
+DOWNLOAD_MODES = ["stream", "sendfile", "x-accel-redirect", "x-sendfile"]
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range: bytes=...`` header into sorted, coalesced (start, end)
+    pairs with inclusive ends. Returns None when the header should be
+    ignored (malformed or not a byte range) and an empty list when no
+    range can be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+
+    ranges = []
+    for spec in header[len("bytes=") :].split(","):
+        match = RANGE_SPEC_RE.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+            if start >= size:
+                continue
+            end = min(end, size - 1)
+        elif last:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start = max(size - length, 0)
+            end = size - 1
+        else:
+            return None
+
+        ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # Merge overlapping and adjacent ranges
+    coalesced = []
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(coalesced[-1][1], end))
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+
+def file_etag(stat):
+    """Strong validator derived from the file size and modification time"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether a Range request may be honoured according to its If-Range header"""
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and if_range_date == int(last_modified)
+
+
+def iter_file_range(path, start, length, chunk_size):
+    """Yield `length` bytes of the file at path starting at offset start"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def iter_multipart_ranges(path, ranges, part_headers, closing, chunk_size):
+    """Yield a multipart/byteranges body for the given ranges"""
+    for (start, end), header in zip(ranges, part_headers):
+        yield header
+        yield from iter_file_range(path, start, end - start + 1, chunk_size)
+    yield closing
+
+
+def multipart_headers(ranges, size, content_type, boundary):
+    """Return the per-part headers and the closing delimiter of a byteranges body"""
+    part_headers = [
+        (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    return part_headers, closing
+
+
+class FileSlice:
+    """
+    Read-only view of bytes [start, start + length) of an open file.
+
+    Exposes fileno() so that a WSGI server's wsgi.file_wrapper can send the
+    slice with os.sendfile: the underlying descriptor is kept positioned at
+    the slice offset and the server bounds the transfer by Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.position = 0
+        self.file.seek(start)
+
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self.file.read(size)
+        self.position += len(data)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.length
+        self.position = min(max(offset, 0), self.length)
+        self.file.seek(self.start + self.position)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def build_offload_response(temp_file, mode):
+    """
+    Hand the transfer over to the front proxy with an internal redirect
+    header. The proxy serves the file (and any Range) straight from disk.
+    """
+    response = HttpResponse(content_type=temp_file.mime_type)
+
+    if mode == "x-accel-redirect":
+        # nginx: location <prefix> { internal; alias <MEDIA_ROOT>/; }
+        file_path = temp_file.file_path.replace(os.sep, "/")
+        response["X-Accel-Redirect"] = settings.FILE_DOWNLOAD_ACCEL_PREFIX + quote(
+            file_path
+        )
+    else:
+        # Apache mod_xsendfile / lighttpd
+        response["X-Sendfile"] = temp_file.full_file_path
+
+    response["Content-Disposition"] = (
+        f'attachment; filename="{temp_file.original_filename}"'
+    )
+    return response
+
+
+def _set_download_headers(response, temp_file, etag, last_modified):
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if "Content-Disposition" not in response:
+        response["Content-Disposition"] = (
+            f'attachment; filename="{temp_file.original_filename}"'
+        )
+
+
+def build_download_response(request, temp_file):
+    """
+    Stream a TemporaryFile in chunks, honouring single and multiple byte
+    ranges (206 Partial Content) and If-Range.
+
+    FILE_DOWNLOAD_MODE selects how the bytes leave the process:
+    - "stream": read and yield chunks from Python
+    - "sendfile": whole files and single ranges are returned as FileResponse
+      so the WSGI server's wsgi.file_wrapper can use os.sendfile
+    - "x-accel-redirect" / "x-sendfile": the front proxy serves the file
+    """
+    mode = settings.FILE_DOWNLOAD_MODE
+    if mode not in DOWNLOAD_MODES:
+        raise ImproperlyConfigured(
+            f"FILE_DOWNLOAD_MODE must be one of: {', '.join(DOWNLOAD_MODES)}"
+        )
+
+    if mode in ("x-accel-redirect", "x-sendfile"):
+        return build_offload_response(temp_file, mode)
+
+    path = temp_file.full_file_path
+    chunk_size = settings.FILE_DOWNLOAD_CHUNK_SIZE
+
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    last_modified = stat.st_mtime
+
+    ranges = None
+    if request.method in ("GET", "HEAD") and if_range_matches(
+        request, etag, last_modified
+    ):
+        ranges = parse_range_header(request.META.get("HTTP_RANGE"), size)
+
+    if ranges is None:
+        # Whole file
+        response = FileResponse(
+            open(path, "rb"),
+            as_attachment=True,
+            filename=temp_file.original_filename,
+            content_type=temp_file.mime_type,
+        )
+        response.block_size = chunk_size
+
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        if mode == "sendfile":
+            response = FileResponse(
+                FileSlice(open(path, "rb"), start, end - start + 1),
+                status=206,
+                content_type=temp_file.mime_type,
+            )
+            response.block_size = chunk_size
+        else:
+            response = StreamingHttpResponse(
+                iter_file_range(path, start, end - start + 1, chunk_size),
+                status=206,
+                content_type=temp_file.mime_type,
+            )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+
+    else:
+        boundary = uuid.uuid4().hex
+        part_headers, closing = multipart_headers(
+            ranges, size, temp_file.mime_type, boundary
+        )
+        response = StreamingHttpResponse(
+            iter_multipart_ranges(path, ranges, part_headers, closing, chunk_size),
+            status=206,
+            content_type=f"multipart/byteranges; boundary={boundary}",
+        )
+        response["Content-Length"] = (
+            sum(len(header) for header in part_headers)
+            + sum(end - start + 1 for start, end in ranges)
+            + len(closing)
+        )
+
+    _set_download_headers(response, temp_file, etag, last_modified)
+    return response
@@ -1,3 +1,507 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .cleanup import bulk_delete_files
+from .models import FileBlob, StorageCounter, TemporaryFile, UploadSession
+from .streaming import build_download_response, if_range_matches, parse_range_header
+from .utils import (finalize_upload_session, get_storage_stats, hash_file,
+                    save_uploaded_file)
+
+
+class MediaRootTestCase(TestCase):
+    """Runs each test against an empty temporary MEDIA_ROOT"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        os.makedirs(os.path.join(self.media_root, "tmp"))
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            FILE_UPLOAD_TEMP_DIR=os.path.join(self.media_root, "tmp"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(FILE_STORAGE_DEDUPLICATE=True)
+class FileBlobTests(MediaRootTestCase):
+    """Content-addressed storage shared by identical uploads"""
+
+    def upload(self, data, name="notes.txt"):
+        return save_uploaded_file(SimpleUploadedFile(name, data, "text/plain"))
+
+    def store(self, data):
+        source_path = os.path.join(self.media_root, "tmp", "source")
+        with open(source_path, "wb") as source:
+            source.write(data)
+        return FileBlob.store(source_path, hash_file(source_path))
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(b"same bytes", "a.txt")
+        second = self.upload(b"same bytes", "b.txt")
+        other = self.upload(b"other bytes")
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file_path, second.file_path)
+        self.assertNotEqual(first.blob_id, other.blob_id)
+        self.assertEqual(FileBlob.objects.count(), 2)
+        self.assertEqual(FileBlob.objects.get(sha256=first.blob_id).ref_count, 2)
+        with open(second.full_file_path, "rb") as stored:
+            self.assertEqual(stored.read(), b"same bytes")
+        # The second copy was dropped from the upload directory
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "tmp")), [])
+
+    def test_reference_count_follows_files(self):
+        first = self.upload(b"shared")
+        second = self.upload(b"shared")
+        third = self.upload(b"shared")
+        blob = FileBlob.objects.get(sha256=first.blob_id)
+        self.assertEqual(blob.ref_count, 3)
+
+        second.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+
+        third.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+
+    def test_file_survives_until_last_reference(self):
+        first = self.upload(b"shared")
+        second = self.upload(b"shared")
+        path = first.full_file_path
+
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(second.file_exists)
+
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(FileBlob.objects.exists())
+
+    def test_drifted_count_keeps_file_of_remaining_row(self):
+        first = self.upload(b"shared")
+        second = self.upload(b"shared")
+        FileBlob.objects.filter(sha256=first.blob_id).update(ref_count=1)
+
+        first.delete()
+
+        self.assertTrue(FileBlob.objects.filter(sha256=first.blob_id).exists())
+        self.assertTrue(second.file_exists)
+
+    def test_store_restores_missing_file(self):
+        blob = self.store(b"content")
+        os.remove(blob.full_file_path)
+
+        blob = self.store(b"content")
+
+        self.assertEqual(blob.ref_count, 2)
+        with open(blob.full_file_path, "rb") as stored:
+            self.assertEqual(stored.read(), b"content")
+
+    def test_release_many(self):
+        kept = self.store(b"kept")
+        self.store(b"kept")
+        dropped = self.store(b"dropped")
+        self.store(b"dropped")
+        single = self.store(b"single")
+
+        removed = FileBlob.release_many(
+            {kept.sha256: 1, dropped.sha256: 2, single.sha256: 1}
+        )
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(
+            list(FileBlob.objects.values_list("sha256", "ref_count")),
+            [(kept.sha256, 1)],
+        )
+        self.assertTrue(os.path.exists(kept.full_file_path))
+        self.assertFalse(os.path.exists(dropped.full_file_path))
+        self.assertFalse(os.path.exists(single.full_file_path))
+
+    def test_bulk_delete_releases_shared_blobs(self):
+        expired = [self.upload(b"shared") for _ in range(3)]
+        remaining = self.upload(b"shared")
+        alone = self.upload(b"alone")
+        TemporaryFile.objects.filter(
+            id__in=[temp_file.id for temp_file in expired] + [alone.id]
+        ).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        stats = bulk_delete_files(
+            TemporaryFile.objects.filter(expires_at__lt=timezone.now()), batch_size=2
+        )
+
+        self.assertEqual(stats["deleted"], 4)
+        self.assertEqual(stats["blobs_removed"], 1)
+        self.assertEqual(FileBlob.objects.get(sha256=remaining.blob_id).ref_count, 1)
+        self.assertTrue(remaining.file_exists)
+        self.assertFalse(os.path.exists(alone.full_file_path))
+
+
+class ParseRangeHeaderTests(SimpleTestCase):
+    """Range header parsing against a 100 byte file"""
+
+    def test_single_range(self):
+        self.assertEqual(parse_range_header("bytes=0-9", 100), [(0, 9)])
+
+    def test_open_ended_range(self):
+        self.assertEqual(parse_range_header("bytes=90-", 100), [(90, 99)])
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range_header("bytes=-10", 100), [(90, 99)])
+        self.assertEqual(parse_range_header("bytes=-500", 100), [(0, 99)])
+
+    def test_end_past_file_is_clamped(self):
+        self.assertEqual(parse_range_header("bytes=50-500", 100), [(50, 99)])
+
+    def test_multiple_ranges_are_sorted_and_coalesced(self):
+        self.assertEqual(
+            parse_range_header("bytes=50-59, 0-9, 5-19, 20-29, -5", 100),
+            [(0, 29), (50, 59), (95, 99)],
+        )
+
+    def test_unsatisfiable_ranges(self):
+        self.assertEqual(parse_range_header("bytes=100-", 100), [])
+        self.assertEqual(parse_range_header("bytes=200-300, -0", 100), [])
+
+    def test_ignored_headers(self):
+        for header in (None, "", "items=0-9", "bytes=9-0", "bytes=-", "bytes=a-b"):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range_header(header, 100))
+
+    def test_too_many_ranges_are_ignored(self):
+        header = "bytes=" + ",".join(f"{i * 2}-{i * 2}" for i in range(21))
+        self.assertIsNone(parse_range_header(header, 100))
+
+
+class IfRangeTests(SimpleTestCase):
+    """If-Range against a file with this ETag and modification time"""
+
+    etag = '"64-1"'
+    last_modified = 1_700_000_000
+
+    def matches(self, **headers):
+        request = RequestFactory().get("/", **headers)
+        return if_range_matches(request, self.etag, self.last_modified)
+
+    def test_without_if_range(self):
+        self.assertTrue(self.matches())
+
+    def test_etag(self):
+        self.assertTrue(self.matches(HTTP_IF_RANGE=self.etag))
+        self.assertFalse(self.matches(HTTP_IF_RANGE='"64-0"'))
+
+    def test_date(self):
+        self.assertTrue(self.matches(HTTP_IF_RANGE=http_date(self.last_modified)))
+        self.assertFalse(self.matches(HTTP_IF_RANGE=http_date(self.last_modified - 60)))
+        self.assertFalse(self.matches(HTTP_IF_RANGE="not a date"))
+
+
+@override_settings(FILE_DOWNLOAD_MODE="stream", FILE_DOWNLOAD_CHUNK_SIZE=7)
+class DownloadResponseTests(MediaRootTestCase):
+    """build_download_response on a 100 byte file"""
+
+    content = bytes(range(100))
+
+    def setUp(self):
+        super().setUp()
+        self.temp_file = save_uploaded_file(
+            SimpleUploadedFile("data.bin", self.content, "application/octet-stream")
+        )
+
+    def download(self, **headers):
+        request = RequestFactory().get("/", **headers)
+        response = build_download_response(request, self.temp_file)
+        if response.streaming:
+            body = b"".join(response.streaming_content)
+        else:
+            body = response.content
+        response.close()
+        return response, body
+
+    def test_whole_file(self):
+        response, body = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("attachment", response["Content-Disposition"])
+
+    def test_single_range(self):
+        for mode in ("stream", "sendfile"):
+            with self.subTest(mode=mode), self.settings(FILE_DOWNLOAD_MODE=mode):
+                response, body = self.download(HTTP_RANGE="bytes=10-29")
+
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(body, self.content[10:30])
+                self.assertEqual(response["Content-Range"], "bytes 10-29/100")
+                self.assertEqual(response["Content-Length"], "20")
+
+    def test_suffix_and_open_ended_ranges(self):
+        response, body = self.download(HTTP_RANGE="bytes=-15")
+        self.assertEqual(body, self.content[85:])
+        self.assertEqual(response["Content-Range"], "bytes 85-99/100")
+
+        response, body = self.download(HTTP_RANGE="bytes=95-")
+        self.assertEqual(body, self.content[95:])
+        self.assertEqual(response["Content-Range"], "bytes 95-99/100")
+
+    def test_multiple_ranges(self):
+        response, body = self.download(HTTP_RANGE="bytes=0-4,50-59")
+
+        self.assertEqual(response.status_code, 206)
+        content_type, boundary = response["Content-Type"].split("; boundary=")
+        self.assertEqual(content_type, "multipart/byteranges")
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        delimiter = f"\r\n--{boundary}".encode()
+        self.assertTrue(body.endswith(delimiter + b"--\r\n"))
+
+        parts = body.split(delimiter)[1:-1]
+        self.assertEqual(len(parts), 2)
+        for part, (start, end) in zip(parts, [(0, 4), (50, 59)]):
+            headers, data = part.split(b"\r\n\r\n", 1)
+            self.assertIn(f"Content-Range: bytes {start}-{end}/100".encode(), headers)
+            self.assertIn(b"Content-Type: application/octet-stream", headers)
+            self.assertEqual(data, self.content[start : end + 1])
+
+    def test_unsatisfiable_range(self):
+        response, body = self.download(HTTP_RANGE="bytes=100-200")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+        self.assertEqual(body, b"")
+
+    def test_if_range(self):
+        response, _ = self.download()
+        etag = response["ETag"]
+
+        response, body = self.download(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[:10])
+
+        # The file changed since the client got its ETag: send all of it
+        response, body = self.download(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"0-0"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+
+class ChunkedUploadTests(MediaRootTestCase):
+    """Resumable upload endpoints (/api/files/uploads/)"""
+
+    content = os.urandom(1000)
+    chunk_size = 300
+
+    def create_session(self):
+        response = self.client.post(
+            "/api/files/uploads/",
+            {
+                "filename": "image.png",
+                "file_size": len(self.content),
+                "mime_type": "image/png",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["session"]["id"]
+
+    def put_chunk(self, session_id, offset):
+        data = self.content[offset : offset + self.chunk_size]
+        return self.client.put(
+            f"/api/files/uploads/{session_id}/",
+            data,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=(
+                f"bytes {offset}-{offset + len(data) - 1}/{len(self.content)}"
+            ),
+        )
+
+    def complete(self, session_id):
+        return self.client.post(f"/api/files/uploads/{session_id}/complete/")
+
+    def stored_content(self, file_id):
+        with open(TemporaryFile.objects.get(id=file_id).full_file_path, "rb") as f:
+            return f.read()
+
+    def test_out_of_order_chunks(self):
+        session_id = self.create_session()
+
+        session = self.put_chunk(session_id, 600).json()["session"]
+        self.assertEqual(session["received_ranges"], [[600, 900]])
+        self.assertEqual(session["received_offset"], 0)
+        self.put_chunk(session_id, 0)
+        self.put_chunk(session_id, 900)
+        session = self.put_chunk(session_id, 300).json()["session"]
+        self.assertEqual(session["received_ranges"], [[0, 1000]])
+        self.assertTrue(session["is_complete"])
+
+        response = self.complete(session_id)
+
+        self.assertEqual(response.status_code, 201)
+        file_id = response.json()["file"]["id"]
+        self.assertEqual(self.stored_content(file_id), self.content)
+        session = UploadSession.objects.get(id=session_id)
+        self.assertFalse(os.path.exists(session.partial_file_path))
+
+    def test_duplicate_chunks(self):
+        session_id = self.create_session()
+        for offset in (0, 300, 300, 0, 600, 900, 900):
+            self.assertEqual(self.put_chunk(session_id, offset).status_code, 200)
+
+        session = self.client.get(f"/api/files/uploads/{session_id}/").json()["session"]
+        self.assertEqual(session["received_bytes"], len(self.content))
+
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 201)
+        file_id = response.json()["file"]["id"]
+        self.assertEqual(self.stored_content(file_id), self.content)
+
+    def test_complete_with_missing_chunks(self):
+        session_id = self.create_session()
+        for offset in (0, 600, 900):
+            self.put_chunk(session_id, offset)
+
+        response = self.complete(session_id)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            response.json()["session"]["received_ranges"], [[0, 300], [600, 1000]]
+        )
+        self.assertFalse(TemporaryFile.objects.exists())
+
+        # The missing chunk can still be sent
+        self.put_chunk(session_id, 300)
+        self.assertEqual(self.complete(session_id).status_code, 201)
+
+    def test_chunk_outside_the_file(self):
+        session_id = self.create_session()
+        response = self.client.put(
+            f"/api/files/uploads/{session_id}/",
+            b"x" * 10,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes 995-1004/{len(self.content)}",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_completed_session(self):
+        session_id = self.create_session()
+        for offset in range(0, len(self.content), self.chunk_size):
+            self.put_chunk(session_id, offset)
+        file_id = self.complete(session_id).json()["file"]["id"]
+
+        self.assertEqual(self.put_chunk(session_id, 0).status_code, 409)
+        # Completing again answers with the same file
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["file"]["id"], file_id)
+
+        TemporaryFile.objects.get(id=file_id).delete()
+        self.assertEqual(self.put_chunk(session_id, 0).status_code, 409)
+        self.assertEqual(self.complete(session_id).status_code, 410)
+
+    def test_concurrent_finalize_creates_one_file(self):
+        session_id = self.create_session()
+        for offset in range(0, len(self.content), self.chunk_size):
+            self.put_chunk(session_id, offset)
+        # Both requests loaded the session before either finalized it
+        first = UploadSession.objects.get(id=session_id)
+        second = UploadSession.objects.get(id=session_id)
+
+        first_file = finalize_upload_session(first)
+        second_file = finalize_upload_session(second)
+
+        self.assertEqual(first_file.id, second_file.id)
+        self.assertEqual(TemporaryFile.objects.count(), 1)
+        self.assertEqual(FileBlob.objects.get().ref_count, 1)
+        self.assertEqual(self.stored_content(first_file.id), self.content)
+
+
+
+@override_settings(FILE_STORAGE_COUNTERS=True)
+class StorageStatsTests(MediaRootTestCase):
+    """Storage stats read from the counters, expired files included"""
+
+    def upload(self, size):
+        return save_uploaded_file(
+            SimpleUploadedFile(f"{size}.png", os.urandom(size), "image/png")
+        )
+
+    def expire(self, *temp_files):
+        """Make the files expire in a minute and move the clock past it"""
+        TemporaryFile.objects.filter(
+            id__in=[temp_file.id for temp_file in temp_files]
+        ).update(expires_at=timezone.now() + timedelta(minutes=1))
+        later = timezone.now() + timedelta(minutes=2)
+        clock = mock.patch("django.utils.timezone.now", return_value=later)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def assertCountersAreExact(self):
+        previous, current = StorageCounter.reconcile()
+        self.assertEqual(previous, current)
+
+    def test_expired_files_move_between_counters(self):
+        small, medium, large = self.upload(10), self.upload(20), self.upload(30)
+        stats = get_storage_stats()
+        self.assertEqual(stats["source"], "counters")
+        self.assertEqual((stats["active_files"], stats["expired_files"]), (3, 0))
+        self.assertEqual(stats["total_storage_bytes"], 60)
+
+        self.expire(small, medium)
+        stats = get_storage_stats()
+        self.assertEqual((stats["active_files"], stats["expired_files"]), (1, 2))
+        self.assertEqual(stats["total_storage_bytes"], 30)
+        self.assertCountersAreExact()
+
+        TemporaryFile.objects.get(id=small.id).delete()
+        large.delete()
+        stats = get_storage_stats()
+        self.assertEqual((stats["active_files"], stats["expired_files"]), (0, 1))
+        self.assertEqual(stats["total_storage_bytes"], 0)
+        self.assertCountersAreExact()
+
+    def test_cleanup_takes_expired_files_off(self):
+        expired = [self.upload(size) for size in (10, 20, 30)]
+        self.upload(40)
+        self.expire(*expired)
+        get_storage_stats()
+
+        TemporaryFile.cleanup_expired_files()
+
+        stats = get_storage_stats()
+        self.assertEqual((stats["active_files"], stats["expired_files"]), (1, 0))
+        self.assertEqual(stats["total_storage_bytes"], 40)
+        self.assertCountersAreExact()
+
+    def test_files_created_expired(self):
+        get_storage_stats()
+        TemporaryFile.objects.create(
+            original_filename="old.png",
+            file_path="uploads/old.png",
+            file_size=50,
+            mime_type="image/png",
+            expires_at=timezone.now() - timedelta(hours=1),
+        )
+
+        stats = get_storage_stats()
+        self.assertEqual((stats["active_files"], stats["expired_files"]), (0, 1))
+        self.assertEqual(stats["total_storage_bytes"], 0)
+        self.assertCountersAreExact()
+
+    def test_stats_without_counters(self):
+        self.expire(self.upload(10))
+        self.upload(20)
+
+        with self.settings(FILE_STORAGE_COUNTERS=False):
+            stats = get_storage_stats()
+
+        self.assertEqual(stats["source"], "aggregate")
+        self.assertEqual((stats["active_files"], stats["expired_files"]), (1, 1))
+        self.assertEqual(stats["total_storage_bytes"], 20)
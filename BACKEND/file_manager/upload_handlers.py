@@ -0,0 +1,33 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from .utils import detect_mime_type
+
+
+class SpooledFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploads into FILE_UPLOAD_TEMP_DIR, which lives inside MEDIA_ROOT so
+    the spooled file can later be renamed into place instead of copied.
+    The SHA-256 digest and MIME signature are computed while it is written.
+    """
+
+    def new_file(self, *args, **kwargs):
+        os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+        super().new_file(*args, **kwargs)
+        self.detected_mime_type = None
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0:
+            self.detected_mime_type = detect_mime_type(raw_data)
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.detected_mime_type = self.detected_mime_type
+        uploaded_file.sha256 = self.digest.hexdigest()
+        return uploaded_file
@@ -5,6 +5,16 @@ from . import views
 urlpatterns = [
     # File upload
     path("upload/", views.upload_file, name="upload_file"),
+    # Resumable chunked upload
+    path("uploads/", views.create_upload_session, name="create_upload_session"),
+    path(
+        "uploads/<uuid:session_id>/", views.upload_session, name="upload_session"
+    ),
+    path(
+        "uploads/<uuid:session_id>/complete/",
+        views.complete_upload_session,
+        name="complete_upload_session",
+    ),
     # File download
     path("download/<uuid:file_id>/", views.download_file, name="download_file"),
     # File management
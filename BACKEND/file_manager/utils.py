@@ -1,12 +1,54 @@
+import hashlib
 import mimetypes
 import os
+import shutil
+import tempfile
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+from django.core.files.move import file_move_safe
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from .models import TemporaryFile
+from .models import (FileBlob, StorageCounter, TemporaryFile, UploadSession,
+                     remove_file)
+from .signals import temporary_file_uploaded
+
+EXTENSION_MIME_TYPES = {
+    ".doc": "application/msword",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".xls": "application/vnd.ms-excel",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".ppt": "application/vnd.ms-powerpoint",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".pdf": "application/pdf",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+    ".tiff": "image/tiff",
+}
+
+# Only unambiguous signatures; ZIP/OLE containers (Office files) are left to
+# the extension-based detection.
+FILE_SIGNATURES = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+SIGNATURE_LENGTH = 8
+
+HASH_CHUNK_SIZE = 1024 * 1024
 
 
 def generate_unique_filename(original_filename):
@@ -16,61 +58,259 @@ def generate_unique_filename(original_filename):
     return f"{unique_id}{ext}"
 
 
+def detect_mime_type(header):
+    """Detect a MIME type from the leading bytes of a file, None if unknown"""
+    for signature, mime_type in FILE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    return None
+
+
+def guess_mime_type(filename):
+    """Guess a MIME type from the filename with improved detection for Office files"""
+    mime_type, _ = mimetypes.guess_type(filename)
+
+    # Fallback for Office files if mimetypes doesn't detect correctly
+    if not mime_type and filename:
+        ext = os.path.splitext(filename.lower())[1]
+        mime_type = EXTENSION_MIME_TYPES.get(ext, "application/octet-stream")
+
+    return mime_type or "application/octet-stream"
+
+
+def build_storage_path(directory, filename):
+    """Build a unique, date-organized storage path such as uploads/YYYY/MM/DD/<uuid>.pdf"""
+    date_path = datetime.now().strftime("%Y/%m/%d")
+    return os.path.join(directory, date_path, generate_unique_filename(filename))
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(chunk_size), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def spool_chunks(chunks):
+    """
+    Write an iterable of bytes to a new file in FILE_UPLOAD_TEMP_DIR,
+    hashing it on the way. Returns (path, sha256, size)
+    """
+    os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(
+        dir=settings.FILE_UPLOAD_TEMP_DIR, suffix=".spool", delete=False
+    ) as spool_file:
+        try:
+            for data in chunks:
+                spool_file.write(data)
+                digest.update(data)
+                size += len(data)
+        except BaseException:
+            os.remove(spool_file.name)
+            raise
+    return spool_file.name, digest.hexdigest(), size
+
+
+def store_local_file(source_path, directory, filename, sha256=None):
+    """
+    Move a local file (in FILE_UPLOAD_TEMP_DIR, same filesystem as
+    MEDIA_ROOT) into storage with a rename. With FILE_STORAGE_DEDUPLICATE
+    the content goes to the blob store and identical files share one copy.
+    Returns (file_path, blob)
+    """
+    if settings.FILE_STORAGE_DEDUPLICATE:
+        blob = FileBlob.store(source_path, sha256 or hash_file(source_path))
+        return blob.file_path, blob
+
+    file_path = build_storage_path(directory, filename)
+    full_path = os.path.join(settings.MEDIA_ROOT, file_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    file_move_safe(source_path, full_path)
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(full_path, settings.FILE_UPLOAD_PERMISSIONS)
+    return file_path, None
+
+
 def save_uploaded_file(uploaded_file):
     """
     Save uploaded file to storage and create TemporaryFile record
     Returns TemporaryFile instance
-    """
-    # Generate unique filename
-    unique_filename = generate_unique_filename(uploaded_file.name)
 
-    # Create directory path (organize by date)
-    from datetime import datetime
+    Files spooled to disk by SpooledFileUploadHandler (already hashed and
+    sniffed) are renamed into place; in-memory uploads are spooled first.
+    """
+    if hasattr(uploaded_file, "temporary_file_path"):
+        source_path = uploaded_file.temporary_file_path()
+        sha256 = getattr(uploaded_file, "sha256", None)
+    else:
+        uploaded_file.seek(0)
+        source_path, sha256, _ = spool_chunks(uploaded_file.chunks())
 
-    date_path = datetime.now().strftime("%Y/%m/%d")
-    file_path = os.path.join("uploads", date_path, unique_filename)
+    # Sniff the signature if the upload handler did not
+    if hasattr(uploaded_file, "detected_mime_type"):
+        detected_mime_type = uploaded_file.detected_mime_type
+    else:
+        with open(source_path, "rb") as f:
+            detected_mime_type = detect_mime_type(f.read(SIGNATURE_LENGTH))
 
-    # Save file to storage
-    saved_path = default_storage.save(file_path, ContentFile(uploaded_file.read()))
+    # Save file to storage without loading it into memory
+    file_path, blob = store_local_file(
+        source_path, "uploads", uploaded_file.name, sha256
+    )
 
-    # Get or detect MIME type with improved detection for Office files
+    # Prefer the declared type, then the sniffed signature, then the extension
     mime_type = uploaded_file.content_type
     if not mime_type or mime_type == "application/octet-stream":
-        mime_type, _ = mimetypes.guess_type(uploaded_file.name)
-
-        # Fallback for Office files if mimetypes doesn't detect correctly
-        if not mime_type and uploaded_file.name:
-            ext = os.path.splitext(uploaded_file.name.lower())[1]
-            office_mime_types = {
-                ".doc": "application/msword",
-                ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                ".xls": "application/vnd.ms-excel",
-                ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                ".ppt": "application/vnd.ms-powerpoint",
-                ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
-                ".pdf": "application/pdf",
-                ".jpg": "image/jpeg",
-                ".jpeg": "image/jpeg",
-                ".png": "image/png",
-                ".gif": "image/gif",
-                ".bmp": "image/bmp",
-                ".tiff": "image/tiff",
-            }
-            mime_type = office_mime_types.get(ext, "application/octet-stream")
-
-    mime_type = mime_type or "application/octet-stream"
+        mime_type = detected_mime_type or guess_mime_type(uploaded_file.name)
 
     # Create TemporaryFile record
     temp_file = TemporaryFile.objects.create(
         original_filename=uploaded_file.name,
-        file_path=saved_path,
+        file_path=file_path,
         file_size=uploaded_file.size,
         mime_type=mime_type,
+        blob=blob,
     )
+    temporary_file_uploaded.send(sender=TemporaryFile, temp_file=temp_file)
+
+    return temp_file
+
+
+def finalize_upload_session(session):
+    """
+    Move a fully received chunked upload into storage and create its
+    TemporaryFile record. The partial file is renamed, never copied.
+    Concurrent calls for one session are serialized on its row: the first
+    finalizes it and the others return its file. Raises FileNotFoundError
+    if the session was completed but its file has expired or was deleted.
+    Returns TemporaryFile instance
+    """
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(id=session.id)
+        # Another request may have completed it while this one waited
+        session.temporary_file = locked.temporary_file
+        session.completed_at = locked.completed_at
+        if session.is_completed:
+            if session.temporary_file is None:
+                raise FileNotFoundError("The uploaded file has expired or was deleted")
+            return session.temporary_file
+
+        if not session.get_progress()["is_complete"]:
+            raise ValueError("Upload is not complete")
+
+        with open(session.partial_file_path, "rb") as partial_file:
+            detected_mime_type = detect_mime_type(partial_file.read(SIGNATURE_LENGTH))
+
+        file_path, blob = store_local_file(
+            session.partial_file_path, "uploads", session.original_filename
+        )
+
+        mime_type = session.mime_type
+        if not mime_type or mime_type == "application/octet-stream":
+            mime_type = detected_mime_type or guess_mime_type(session.original_filename)
+
+        try:
+            # A savepoint, so that the cleanup below can still query
+            with transaction.atomic():
+                temp_file = TemporaryFile.objects.create(
+                    original_filename=session.original_filename,
+                    file_path=file_path,
+                    file_size=session.file_size,
+                    mime_type=mime_type,
+                    blob=blob,
+                )
+
+                session.temporary_file = temp_file
+                session.completed_at = timezone.now()
+                session.save(update_fields=["temporary_file", "completed_at"])
+                session.chunks.all().delete()
+            temporary_file_uploaded.send(sender=TemporaryFile, temp_file=temp_file)
+        except BaseException:
+            # Do not leak the stored content
+            session.temporary_file = None
+            session.completed_at = None
+            if blob is not None:
+                FileBlob.release(blob.sha256)
+            else:
+                remove_file(os.path.join(settings.MEDIA_ROOT, file_path))
+            raise
 
     return temp_file
 
 
+class DownloadFileWriter:
+    """
+    Context manager that writes a processed file straight to disk:
+
+        with open_download_file("merged.pdf") as output:
+            pdf_writer.write(output.file)
+        merged_file = output.temp_file
+
+    `file` is a scratch file (at `path`) in FILE_UPLOAD_TEMP_DIR. When the block exits
+    cleanly it is renamed into storage and recorded as a TemporaryFile with
+    its size and MIME type; if the block raises it is removed.
+    """
+
+    def __init__(self, filename, mime_type=None):
+        self.filename = filename
+        self.mime_type = mime_type
+        self.file = None
+        self.path = None
+        self.temp_file = None
+
+    def __enter__(self):
+        os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(
+            dir=settings.FILE_UPLOAD_TEMP_DIR, suffix=".spool"
+        )
+        self.file = os.fdopen(fd, "w+b")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is not None:
+            remove_file(self.path)
+            return False
+
+        try:
+            self.temp_file = self.commit()
+        except BaseException:
+            remove_file(self.path)
+            raise
+        return False
+
+    def commit(self):
+        """Move the written file into storage and create its TemporaryFile"""
+        file_size = os.path.getsize(self.path)
+        file_path, blob = store_local_file(self.path, "processed", self.filename)
+        mime_type = self.mime_type or guess_mime_type(self.filename)
+
+        try:
+            return TemporaryFile.objects.create(
+                original_filename=self.filename,
+                file_path=file_path,
+                file_size=file_size,
+                mime_type=mime_type,
+                blob=blob,
+            )
+        except BaseException:
+            # Do not leak the stored content
+            if blob is not None:
+                FileBlob.release(blob.sha256)
+            else:
+                remove_file(os.path.join(settings.MEDIA_ROOT, file_path))
+            raise
+
+
+def open_download_file(filename, mime_type=None):
+    """Return a DownloadFileWriter for a processed file called filename"""
+    return DownloadFileWriter(filename, mime_type)
+
+
 def create_download_file(file_content, filename, original_temp_file=None):
     """
     Create a new temporary file for download (for processed files)
@@ -78,39 +318,117 @@ def create_download_file(file_content, filename, original_temp_file=None):
     filename: desired filename
     original_temp_file: optional reference to original file for metadata
     """
-    # Generate unique filename
-    unique_filename = generate_unique_filename(filename)
+    with open_download_file(filename) as output:
+        if isinstance(file_content, (bytes, bytearray, memoryview)):
+            output.file.write(file_content)
+        else:
+            shutil.copyfileobj(file_content, output.file, HASH_CHUNK_SIZE)
 
-    # Create directory path
-    from datetime import datetime
+    return output.temp_file
 
-    date_path = datetime.now().strftime("%Y/%m/%d")
-    file_path = os.path.join("processed", date_path, unique_filename)
 
-    # Save file content
-    if isinstance(file_content, bytes):
-        content = ContentFile(file_content)
-    else:
-        content = file_content
+def share_temporary_file(temp_file):
+    """
+    Create another TemporaryFile with the contents of temp_file, so that
+    deleting or expiring either one leaves the other intact. Blob-backed
+    files take one more reference on their blob, other files are
+    hard-linked (copied where links are not supported).
+    Returns TemporaryFile instance
+    """
+    if temp_file.blob_id is not None:
+        with transaction.atomic():
+            referenced = FileBlob.objects.filter(
+                sha256=temp_file.blob_id, ref_count__gt=0
+            ).update(ref_count=F("ref_count") + 1)
+            if not referenced:
+                raise FileNotFoundError(f"Blob {temp_file.blob_id} was released")
+            return TemporaryFile.objects.create(
+                original_filename=temp_file.original_filename,
+                file_path=temp_file.file_path,
+                file_size=temp_file.file_size,
+                mime_type=temp_file.mime_type,
+                blob_id=temp_file.blob_id,
+            )
 
-    saved_path = default_storage.save(file_path, content)
+    file_path = build_storage_path("processed", temp_file.original_filename)
+    full_path = os.path.join(settings.MEDIA_ROOT, file_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    try:
+        os.link(temp_file.full_file_path, full_path)
+    except OSError:
+        shutil.copyfile(temp_file.full_file_path, full_path)
 
-    # Get MIME type
-    mime_type, _ = mimetypes.guess_type(filename)
-    mime_type = mime_type or "application/octet-stream"
+    try:
+        return TemporaryFile.objects.create(
+            original_filename=temp_file.original_filename,
+            file_path=file_path,
+            file_size=temp_file.file_size,
+            mime_type=temp_file.mime_type,
+        )
+    except BaseException:
+        remove_file(full_path)
+        raise
 
-    # Get file size
-    file_size = default_storage.size(saved_path)
 
-    # Create TemporaryFile record
-    temp_file = TemporaryFile.objects.create(
-        original_filename=filename,
-        file_path=saved_path,
-        file_size=file_size,
-        mime_type=mime_type,
+_exists_pool = None
+_exists_pool_lock = threading.Lock()
+
+
+def _paths_exist(paths):
+    """os.path.exists for each path, stat calls run on a shared thread pool"""
+    global _exists_pool
+    if len(paths) <= 1:
+        return [os.path.exists(path) for path in paths]
+    with _exists_pool_lock:
+        if _exists_pool is None:
+            _exists_pool = ThreadPoolExecutor(
+                max_workers=settings.FILE_EXISTS_CHECK_WORKERS,
+                thread_name_prefix="file-exists",
+            )
+    return list(_exists_pool.map(os.path.exists, paths))
+
+
+def resolve_temporary_files(file_ids, check=None, queryset=None):
+    """
+    Fetch the TemporaryFiles for file_ids with a single query and check that
+    their files exist concurrently. Files are checked in request order and
+    the first problem raises ValueError, with the same messages as checking
+    them one by one: not found, expired, missing on storage, then `check`
+    (called with each file, it raises ValueError to reject it).
+
+    Returns list of TemporaryFile objects in request order
+    """
+    queryset = TemporaryFile.objects.all() if queryset is None else queryset
+    found = {
+        str(file_id): temp_file
+        for file_id, temp_file in queryset.in_bulk(file_ids).items()
+    }
+
+    # One stat per distinct path (deduplicated files share their blob)
+    paths = list(
+        dict.fromkeys(temp_file.full_file_path for temp_file in found.values())
     )
+    existing = dict(zip(paths, _paths_exist(paths)))
 
-    return temp_file
+    files = []
+    for file_id in file_ids:
+        temp_file = found.get(str(file_id))
+        if temp_file is None:
+            raise ValueError(f"File with ID {file_id} not found")
+
+        if temp_file.is_expired:
+            raise ValueError(f"File {temp_file.original_filename} has expired")
+
+        if not existing[temp_file.full_file_path]:
+            raise ValueError(
+                f"Physical file {temp_file.original_filename} not found on storage"
+            )
+
+        if check is not None:
+            check(temp_file)
+
+        files.append(temp_file)
+    return files
 
 
 def cleanup_expired_files():
@@ -118,6 +436,44 @@ def cleanup_expired_files():
     return TemporaryFile.cleanup_expired_files()
 
 
+def get_storage_stats():
+    """
+    Totals of temporary files. With FILE_STORAGE_COUNTERS they are read from
+    the counter table, after moving the files that expired since the last
+    call to its expired_* counters; otherwise one aggregate query is used.
+    """
+    now = timezone.now()
+    StorageCounter.move_expired(now)
+    totals = StorageCounter.totals()
+
+    if totals is not None:
+        total_files = totals[StorageCounter.FILES]
+        expired_files = totals[StorageCounter.EXPIRED_FILES]
+        expired_size = totals[StorageCounter.EXPIRED_BYTES]
+        active_size = totals[StorageCounter.BYTES] - expired_size
+        source = "counters"
+    else:
+        active = Q(expires_at__gt=now)
+        aggregate = TemporaryFile.objects.aggregate(
+            total_files=Count("id"),
+            active_files=Count("id", filter=active),
+            active_size=Coalesce(Sum("file_size", filter=active), 0),
+        )
+        total_files = aggregate["total_files"]
+        expired_files = total_files - aggregate["active_files"]
+        active_size = aggregate["active_size"]
+        source = "aggregate"
+
+    return {
+        "total_files": total_files,
+        "active_files": total_files - expired_files,
+        "expired_files": expired_files,
+        "total_storage_bytes": active_size,
+        "total_storage_mb": round(active_size / (1024 * 1024), 2),
+        "source": source,
+    }
+
+
 def get_file_info(file_path):
     """Get basic file information with improved Office file detection"""
     if not os.path.exists(file_path):
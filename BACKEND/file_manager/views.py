@@ -1,17 +1,27 @@
 import os
+import re
 
-from django.core.files.storage import default_storage
-from django.http import Http404, HttpResponse, JsonResponse
+from django.conf import settings
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import status
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 
-from .models import TemporaryFile
-from .serializers import FileUploadSerializer, TemporaryFileSerializer
-from .utils import cleanup_expired_files, save_uploaded_file
+from .metrics import DOWNLOAD_BYTES, UPLOAD_BYTES
+from .models import TemporaryFile, UploadSession
+from .pagination import paginate_by_keyset
+from .serializers import (FileUploadSerializer, TemporaryFileSerializer,
+                          UploadSessionCreateSerializer,
+                          UploadSessionSerializer)
+from .streaming import build_download_response
+from .utils import (cleanup_expired_files, finalize_upload_session,
+                    get_storage_stats, save_uploaded_file)
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
 
 
 @api_view(["POST"])
@@ -28,6 +38,7 @@ def upload_file(request):
         try:
             # Save file and create record
             temp_file = save_uploaded_file(uploaded_file)
+            UPLOAD_BYTES.inc(temp_file.file_size)
 
             # Return file information
             file_serializer = TemporaryFileSerializer(
@@ -55,6 +66,175 @@ def upload_file(request):
     )
 
 
+@api_view(["POST"])
+def create_upload_session(request):
+    """
+    Start a resumable chunked upload
+    """
+    serializer = UploadSessionCreateSerializer(data=request.data)
+
+    if not serializer.is_valid():
+        return Response(
+            {
+                "success": False,
+                "message": "Invalid upload data",
+                "errors": serializer.errors,
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        session = UploadSession.objects.create(
+            original_filename=serializer.validated_data["filename"],
+            file_size=serializer.validated_data["file_size"],
+            mime_type=serializer.validated_data["mime_type"],
+        )
+        session.create_partial_file()
+
+        return Response(
+            {
+                "success": True,
+                "message": "Upload session created",
+                "session": UploadSessionSerializer(session).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    except Exception as e:
+        return Response(
+            {"success": False, "message": f"Error creating upload session: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
+def _parse_chunk_range(request, file_size):
+    """
+    Return (offset, length) for a chunk from its Content-Range header
+    (``bytes <start>-<end>/<total>``) or an ``offset`` query parameter
+    """
+    length = int(request.META.get("CONTENT_LENGTH") or 0)
+    content_range = request.META.get("HTTP_CONTENT_RANGE")
+
+    if content_range:
+        match = CONTENT_RANGE_RE.match(content_range.strip())
+        if not match:
+            raise ValueError("Invalid Content-Range header")
+        start, end, total = match.groups()
+        offset = int(start)
+        if total != "*" and int(total) != file_size:
+            raise ValueError(f"Content-Range total does not match file size {file_size}")
+        if int(end) - offset + 1 != length:
+            raise ValueError("Content-Range does not match Content-Length")
+    else:
+        try:
+            offset = int(request.query_params.get("offset", ""))
+        except ValueError:
+            raise ValueError("A Content-Range header or offset parameter is required")
+
+    if length <= 0:
+        raise ValueError("Empty chunk")
+    if length > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+        raise ValueError(
+            f"Chunk size cannot exceed {settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE} bytes"
+        )
+    if offset < 0 or offset + length > file_size:
+        raise ValueError(f"Chunk is outside the file (size {file_size})")
+
+    return offset, length
+
+
+@api_view(["GET", "PUT", "DELETE"])
+def upload_session(request, session_id):
+    """
+    Query the received offset (GET), send a chunk (PUT) or abort (DELETE)
+    """
+    session = get_object_or_404(UploadSession, id=session_id)
+
+    if request.method == "DELETE":
+        session.delete()
+        return Response({"success": True, "message": "Upload session deleted"})
+
+    if session.is_expired:
+        return Response(
+            {"success": False, "message": "Upload session has expired"},
+            status=status.HTTP_410_GONE,
+        )
+
+    if request.method == "PUT":
+        if session.is_completed:
+            return Response(
+                {"success": False, "message": "Upload session is already completed"},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            offset, length = _parse_chunk_range(request, session.file_size)
+            session.write_chunk(offset, request.stream, length)
+            UPLOAD_BYTES.inc(length)
+        except ValueError as ve:
+            return Response(
+                {"success": False, "message": str(ve)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except Exception as e:
+            return Response(
+                {"success": False, "message": f"Error writing chunk: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+    return Response({"success": True, "session": UploadSessionSerializer(session).data})
+
+
+@api_view(["POST"])
+def complete_upload_session(request, session_id):
+    """
+    Finalize a fully received upload into a regular temporary file
+    """
+    session = get_object_or_404(UploadSession, id=session_id)
+
+    if session.is_expired:
+        return Response(
+            {"success": False, "message": "Upload session has expired"},
+            status=status.HTTP_410_GONE,
+        )
+
+    try:
+        temp_file = finalize_upload_session(session)
+
+    except FileNotFoundError as e:
+        return Response(
+            {"success": False, "message": str(e)},
+            status=status.HTTP_410_GONE,
+        )
+
+    except ValueError as ve:
+        return Response(
+            {
+                "success": False,
+                "message": str(ve),
+                "session": UploadSessionSerializer(session).data,
+            },
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    except Exception as e:
+        return Response(
+            {"success": False, "message": f"Error completing upload: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    file_serializer = TemporaryFileSerializer(temp_file, context={"request": request})
+
+    return Response(
+        {
+            "success": True,
+            "message": "File uploaded successfully",
+            "file": file_serializer.data,
+        },
+        status=status.HTTP_201_CREATED,
+    )
+
+
 @api_view(["GET"])
 def download_file(request, file_id):
     """
@@ -71,21 +251,21 @@ def download_file(request, file_id):
             )
 
         # Check if physical file exists
-        if not temp_file.file_exists:
+        if not temp_file.refresh_file_present():
             return Response(
                 {"success": False, "message": "File not found on storage"},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        # Open and serve file
+        # Stream the file in chunks, honouring Range requests
         try:
-            with default_storage.open(temp_file.file_path, "rb") as file:
-                response = HttpResponse(file.read(), content_type=temp_file.mime_type)
-                response["Content-Disposition"] = (
-                    f'attachment; filename="{temp_file.original_filename}"'
-                )
-                response["Content-Length"] = temp_file.file_size
-                return response
+            response = build_download_response(request, temp_file)
+            if response.has_header("Content-Length"):
+                DOWNLOAD_BYTES.inc(int(response["Content-Length"]))
+            elif response.status_code == 200:
+                # Served by the front proxy
+                DOWNLOAD_BYTES.inc(temp_file.file_size)
+            return response
 
         except Exception as e:
             return Response(
@@ -106,6 +286,7 @@ def file_info(request, file_id):
     Get information about a specific file
     """
     temp_file = get_object_or_404(TemporaryFile, id=file_id)
+    temp_file.refresh_file_present()
 
     serializer = TemporaryFileSerializer(temp_file, context={"request": request})
 
@@ -141,9 +322,14 @@ def cleanup_files(request):
     """
     try:
         deleted_count = cleanup_expired_files()
+        deleted_sessions = UploadSession.cleanup_expired_sessions()
 
         return Response(
-            {"success": True, "message": f"Cleaned up {deleted_count} expired files"}
+            {
+                "success": True,
+                "message": f"Cleaned up {deleted_count} expired files",
+                "deleted_upload_sessions": deleted_sessions,
+            }
         )
 
     except Exception as e:
@@ -153,42 +339,79 @@ def cleanup_files(request):
         )
 
 
+def _parse_datetime_param(request, name):
+    """Parse an optional ISO 8601 query parameter, raising ValueError if invalid"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {name}, expected an ISO 8601 datetime")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 @api_view(["GET"])
 def list_files(request):
     """
-    List all current temporary files (for debugging/admin purposes)
+    List current temporary files, newest first, one page at a time
+    (for debugging/admin purposes)
     """
-    files = TemporaryFile.objects.filter(expires_at__gt=timezone.now())
-    serializer = TemporaryFileSerializer(files, many=True, context={"request": request})
-
-    return Response({"success": True, "count": files.count(), "files": serializer.data})
+    params = request.query_params
 
+    try:
+        limit = int(params.get("limit", settings.FILE_LIST_PAGE_SIZE))
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return Response(
+            {"success": False, "message": "limit must be a positive integer"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    limit = min(limit, settings.FILE_LIST_MAX_PAGE_SIZE)
 
-@api_view(["GET"])
-def storage_stats(request):
-    """
-    Get storage statistics
-    """
-    from django.utils import timezone
+    files = TemporaryFile.objects.all()
+    if params.get("include_expired", "").lower() not in ("1", "true", "yes"):
+        files = files.filter(expires_at__gt=timezone.now())
+    if params.get("mime_type"):
+        files = files.filter(mime_type__in=params["mime_type"].split(","))
 
-    total_files = TemporaryFile.objects.count()
-    active_files = TemporaryFile.objects.filter(expires_at__gt=timezone.now()).count()
-    expired_files = total_files - active_files
+    try:
+        expires_after = _parse_datetime_param(request, "expires_after")
+        expires_before = _parse_datetime_param(request, "expires_before")
+        if expires_after:
+            files = files.filter(expires_at__gt=expires_after)
+        if expires_before:
+            files = files.filter(expires_at__lt=expires_before)
+
+        page, next_cursor = paginate_by_keyset(files, params.get("cursor"), limit)
+    except ValueError as ve:
+        return Response(
+            {"success": False, "message": str(ve)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    # Calculate total storage used
-    total_size = sum(
-        f.file_size for f in TemporaryFile.objects.filter(expires_at__gt=timezone.now())
-    )
+    # Stat'ing every row is opt-in; by default the persisted flag is returned
+    if params.get("check_files", "").lower() in ("1", "true", "yes"):
+        for temp_file in page:
+            temp_file.refresh_file_present()
+    serializer = TemporaryFileSerializer(page, many=True, context={"request": request})
 
     return Response(
         {
             "success": True,
-            "stats": {
-                "total_files": total_files,
-                "active_files": active_files,
-                "expired_files": expired_files,
-                "total_storage_bytes": total_size,
-                "total_storage_mb": round(total_size / (1024 * 1024), 2),
-            },
+            "count": len(page),
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor,
+            "files": serializer.data,
         }
     )
+
+
+@api_view(["GET"])
+def storage_stats(request):
+    """
+    Get storage statistics
+    """
+    return Response({"success": True, "stats": get_storage_stats()})
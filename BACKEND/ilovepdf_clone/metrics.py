@@ -0,0 +1,407 @@
+"""
+Metrics registry exported in the Prometheus text format at /metrics.
+
+Counters, gauges and histograms are kept in memory by each process and
+written as a snapshot to METRICS_DIR/<pid>-<start time>.json by a
+background thread (every METRICS_FLUSH_INTERVAL seconds, when something
+changed) and on exit. /metrics is served by whichever gunicorn worker gets
+the request, so it adds up the snapshots of every process: counters and
+histograms of all of them, gauges only of processes still running. The
+counters and histograms of processes that have exited are folded into
+METRICS_DIR/exited.json and their snapshots removed, so the directory
+does not grow with every restarted worker. METRICS_DIR should be emptied
+when the service is (re)deployed; with METRICS_DIR = None only the
+serving process is reported.
+
+Values computed on each scrape (storage totals...) are added with
+register_collector.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Counters and histograms of processes that have exited
+EXITED_FILE = "exited.json"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def _process_start_time(pid):
+    """Start time of process pid in clock ticks since boot, None where unknown"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as stat:
+            # Fields after the command name, which may contain spaces
+            fields = stat.read().rsplit(b")", 1)[1].split()
+        return int(fields[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _process_alive(pid, start_time):
+    if os.name != "posix":
+        # os.kill(pid, 0) is not a liveness check on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # The pid may have been reused by a newer process
+    current = _process_start_time(pid)
+    return current is None or current == start_time
+
+
+def _snapshot_process(filename):
+    """(pid, start time) of a process snapshot file name, None for other files"""
+    stem, extension = os.path.splitext(filename)
+    pid, _, start_time = stem.partition("-")
+    if extension != ".json" or not pid.isdigit() or not start_time.isdigit():
+        return None
+    return int(pid), int(start_time)
+
+
+def _read_snapshot(path):
+    """Values of a snapshot file, None if it is missing or being rewritten"""
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)["values"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_snapshot(directory, filename, values):
+    """Atomically replace directory/filename with a snapshot of values"""
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as snapshot_file:
+            json.dump({"values": values}, snapshot_file)
+        os.replace(path, os.path.join(directory, filename))
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+@contextmanager
+def _directory_lock(directory):
+    """
+    Hold an exclusive lock on METRICS_DIR while the block runs. Yields False
+    where file locks are not available.
+    """
+    if fcntl is None:
+        yield False
+        return
+    with open(os.path.join(directory, ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes labels {', '.join(self.labelnames) or '(none)'}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self, self._key(labels), amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self, self._key(labels), amount)
+
+    def dec(self, amount=1, **labels):
+        self.registry.add(self, self._key(labels), -amount)
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        """Count the block as in progress while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None, registry=None):
+        self._buckets = tuple(buckets) if buckets else None
+        super().__init__(name, documentation, labelnames, registry)
+
+    @property
+    def buckets(self):
+        """Upper bounds of the buckets (METRICS_LATENCY_BUCKETS by default)"""
+        return self._buckets or tuple(settings.METRICS_LATENCY_BUCKETS)
+
+    def observe(self, value, **labels):
+        self.registry.observe(self, self._key(labels), value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._reset()
+        atexit.register(self.flush)
+        if hasattr(os, "register_at_fork"):
+            # A forked worker starts empty; its parent reports its own values
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.dirty = False
+        self.flusher = None
+        self._snapshot_name = None
+
+    @property
+    def snapshot_name(self):
+        """
+        File name of this process's snapshot. The start time keeps a later
+        process with the same pid from taking over its values; it is the
+        time this registry was set up where /proc is not available.
+        """
+        if self._snapshot_name is None:
+            pid = os.getpid()
+            start_time = _process_start_time(pid) or int(time.time() * 1000)
+            self._snapshot_name = f"{pid}-{start_time}.json"
+        return self._snapshot_name
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def register_collector(self, collector):
+        """
+        collector() returns [(name, kind, documentation, [(labels dict, value)])]
+        for metrics computed when /metrics is scraped
+        """
+        self.collectors.append(collector)
+        return collector
+
+    def add(self, metric, key, amount):
+        with self.lock:
+            values = self.values.setdefault(metric.name, {})
+            values[key] = values.get(key, 0) + amount
+            self._changed()
+
+    def observe(self, metric, key, value):
+        buckets = metric.buckets
+        with self.lock:
+            values = self.values.setdefault(metric.name, {})
+            entry = values.get(key)
+            if entry is None:
+                entry = values[key] = [[0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+            self._changed()
+
+    def _changed(self):
+        """Mark values as changed and start the flush thread (lock held)"""
+        self.dirty = True
+        if self.flusher is None and settings.METRICS_DIR:
+            self.flusher = threading.Thread(
+                target=self._flush_loop, name="metrics-flush", daemon=True
+            )
+            self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _snapshot(self):
+        with self.lock:
+            self.dirty = False
+            return {
+                name: [[list(key), value] for key, value in values.items()]
+                for name, values in self.values.items()
+            }
+
+    def flush(self):
+        """Write this process's values to METRICS_DIR if they changed"""
+        directory = settings.METRICS_DIR
+        if not directory or not self.dirty:
+            return
+        snapshot = self._snapshot()
+        os.makedirs(directory, exist_ok=True)
+        _write_snapshot(directory, self.snapshot_name, snapshot)
+
+    def _merge(self, merged, metric, key, value):
+        values = merged.setdefault(metric.name, {})
+        if metric.kind != "histogram":
+            values[key] = values.get(key, 0) + value
+            return
+        if len(value[0]) != len(metric.buckets):
+            # Written with other buckets, cannot be added up
+            return
+        entry = values.get(key)
+        if entry is None:
+            values[key] = [list(value[0]), value[1], value[2]]
+        else:
+            entry[0] = [a + b for a, b in zip(entry[0], value[0])]
+            entry[1] += value[1]
+            entry[2] += value[2]
+
+    def _merge_snapshot(self, merged, snapshot, gauges=True):
+        for name, entries in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.kind == "gauge" and not gauges):
+                continue
+            for key, value in entries:
+                self._merge(merged, metric, tuple(key), value)
+
+    def _collect_directory(self, directory, merged, fold):
+        """
+        Add the snapshots in directory to merged. With fold, those of
+        exited processes are added to EXITED_FILE and removed.
+        """
+        exited = {}
+        exited_files = []
+        for filename in os.listdir(directory):
+            process = _snapshot_process(filename)
+            if process is None or filename == self.snapshot_name:
+                continue
+            snapshot = _read_snapshot(os.path.join(directory, filename))
+            if snapshot is None:
+                continue
+            if _process_alive(*process):
+                self._merge_snapshot(merged, snapshot)
+            elif fold:
+                self._merge_snapshot(exited, snapshot, gauges=False)
+                exited_files.append(filename)
+            else:
+                self._merge_snapshot(merged, snapshot, gauges=False)
+
+        previous = _read_snapshot(os.path.join(directory, EXITED_FILE))
+        if previous is not None:
+            self._merge_snapshot(exited, previous, gauges=False)
+        if exited_files:
+            _write_snapshot(
+                directory,
+                EXITED_FILE,
+                {
+                    name: [[list(key), value] for key, value in values.items()]
+                    for name, values in exited.items()
+                },
+            )
+            for filename in exited_files:
+                os.remove(os.path.join(directory, filename))
+
+        for name, values in exited.items():
+            for key, value in values.items():
+                self._merge(merged, self.metrics[name], key, value)
+
+    def collect(self):
+        """Values of every process: {metric name: {label values: value}}"""
+        merged = {}
+        directory = settings.METRICS_DIR
+
+        if directory and os.path.isdir(directory):
+            # Serving processes fold exited snapshots one at a time, so
+            # that none is added to exited.json twice
+            with _directory_lock(directory) as locked:
+                self._collect_directory(directory, merged, fold=locked)
+
+        with self.lock:
+            own = {name: dict(values) for name, values in self.values.items()}
+        for name, values in own.items():
+            for key, value in values.items():
+                self._merge(merged, self.metrics[name], key, value)
+        return merged
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+
+        for name in sorted(self.metrics):
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = tuple(zip(metric.labelnames, key))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets, value[0]):
+                    cumulative += bucket_count
+                    le = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(le)} {cumulative}")
+                le = labels + (("le", "+Inf"),)
+                lines.append(f"{name}_bucket{_format_labels(le)} {value[2]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[2]}")
+
+        for collector in self.collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(
+                        f"{name}{_format_labels(tuple(labels.items()))} {_format_value(value)}"
+                    )
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -75,9 +75,139 @@ REST_FRAMEWORK = {
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
-FILE_UPLOAD_MAX_MEMORY_SIZE = 500 * 1024 * 1024
+# Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to FILE_UPLOAD_TEMP_DIR,
+# which must live on the same filesystem as MEDIA_ROOT so that saving them is
+# a rename rather than a copy.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2 * 1024 * 1024
+FILE_UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, "tmp")
+FILE_UPLOAD_HANDLERS = [
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "file_manager.upload_handlers.SpooledFileUploadHandler",
+]
 DATA_UPLOAD_MAX_MEMORY_SIZE = 500 * 1024 * 1024
 
+# Store file contents once under media/blobs/ keyed by SHA-256, shared by every
+# temporary file with identical bytes and removed with the last reference
+FILE_STORAGE_DEDUPLICATE = True
+
+# Keep running totals of temporary files (count and bytes) in the
+# storage_counters table so /api/files/stats/ does not scan temporary_files.
+# After turning this back on, run: python manage.py reconcile_storage_counters
+FILE_STORAGE_COUNTERS = True
+
+# Expired files are deleted in batches of FILE_CLEANUP_BATCH_SIZE rows (one short
+# transaction each) while FILE_CLEANUP_WORKERS threads unlink their files
+FILE_CLEANUP_BATCH_SIZE = 1000
+FILE_CLEANUP_WORKERS = 8
+
+# /metrics (Prometheus text format). Each process writes its values to
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds and /metrics adds up every
+# process (gunicorn workers, operation workers); counters of exited processes are
+# folded into METRICS_DIR/exited.json. Empty the directory on deploy; None
+# reports only the process serving /metrics
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(BASE_DIR, "metrics"))
+METRICS_FLUSH_INTERVAL = 1.0
+# Upper bounds (seconds) of the pdf_operation_duration_seconds buckets
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Threads that check input files exist on storage before an operation runs
+FILE_EXISTS_CHECK_WORKERS = 8
+
+# Page size of /api/files/list/ (?limit= may ask for up to the maximum)
+FILE_LIST_PAGE_SIZE = 50
+FILE_LIST_MAX_PAGE_SIZE = 200
+
+# Largest body accepted by a single PUT of the resumable upload API
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 32 * 1024 * 1024
+
+# Block size used when streaming downloads
+FILE_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# How downloads are sent:
+#   "stream"           - chunked reads from Python (default)
+#   "sendfile"         - whole files and single ranges go through wsgi.file_wrapper,
+#                        which gunicorn/uWSGI implement with os.sendfile
+#   "x-accel-redirect" - nginx serves FILE_DOWNLOAD_ACCEL_PREFIX + file path
+#   "x-sendfile"       - Apache (mod_xsendfile) / lighttpd serve the absolute path
+FILE_DOWNLOAD_MODE = os.getenv("FILE_DOWNLOAD_MODE", "stream")
+FILE_DOWNLOAD_ACCEL_PREFIX = "/protected-media/"
+
+# PDF operations requested with "async": true (or "Prefer: respond-async") are
+# answered with 202 and run by: python manage.py run_operation_workers
+# PDF_OPERATIONS_ASYNC_DEFAULT queues every operation unless "async": false
+PDF_OPERATIONS_ASYNC_DEFAULT = False
+PDF_WORKER_CONCURRENCY = int(os.getenv("PDF_WORKER_CONCURRENCY", "2"))
+# A worker extends its lease while it runs; if it dies the operation is
+# retried by another worker once the lease expires, up to MAX_ATTEMPTS times
+PDF_WORKER_LEASE_SECONDS = 300
+PDF_WORKER_POLL_INTERVAL = 1.0
+PDF_WORKER_MAX_ATTEMPTS = 3
+
+# convert_pdf_to_images renders ranges of PDF_RENDER_CHUNK_SIZE pages on a pool
+# of PDF_RENDER_WORKERS processes (1 = render serially in the request process).
+# Every process has its own pool: with N gunicorn workers up to N *
+# PDF_RENDER_WORKERS processes render at once. run_operation_workers runs its
+# workers with 1 (--render-workers), the pool already spreads them over the CPUs
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", min(2, os.cpu_count() or 1)))
+PDF_RENDER_CHUNK_SIZE = 4
+
+# Operations with the same input contents, type and parameters as an earlier one
+# are completed with its output file while that has not expired. Entries live
+# PDF_RESULT_CACHE_TTL seconds; the least recently used go above MAX_ENTRIES
+PDF_RESULT_CACHE = True
+PDF_RESULT_CACHE_TTL = 30 * 60
+PDF_RESULT_CACHE_MAX_ENTRIES = 1000
+
+# Page count, page sizes, encryption and metadata of each uploaded PDF are read
+# once (pdf_document_info) and reused by the validators. True reads them in the
+# background instead of before the response; both read in a separate process
+PDF_DOCUMENT_INFO_IN_BACKGROUND = False
+
+# Every read of that info (uploads, operation outputs used as inputs, files
+# uploaded before it existed) runs in one of PDF_INSPECT_WORKERS reader
+# processes per server process, which is killed when reading one file takes
+# more than PDF_INSPECT_TIMEOUT seconds. A validation gives up after
+# PDF_INSPECT_DEADLINE seconds in total, waiting for a free reader included
+PDF_INSPECT_TIMEOUT = 10
+PDF_INSPECT_WORKERS = 2
+PDF_INSPECT_DEADLINE = 30
+
+# Parsed PDFs are kept open per process so consecutive operations on the same
+# file (split, rotate, then to images...) do not parse it again. At most
+# PDF_DOCUMENT_CACHE_MAX_ENTRIES documents and PDF_DOCUMENT_CACHE_MAX_BYTES of
+# estimated memory (sum of their file sizes); a deleted file is dropped at once
+PDF_DOCUMENT_CACHE = True
+PDF_DOCUMENT_CACHE_MAX_ENTRIES = 16
+PDF_DOCUMENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Profiling of operations (cProfile + sampled stacks, attached to the operation as
+# an archive). Staff users ask for it per request with ?profile=1 or an
+# "X-Profile: 1" header; PDF_PROFILE_SAMPLE_RATE (0-1) profiles that share of all
+# operations. Stacks are sampled every PDF_PROFILE_SAMPLE_INTERVAL seconds and
+# profile.txt lists the PDF_PROFILE_TOP slowest functions
+PDF_PROFILE_SAMPLE_RATE = 0.0
+PDF_PROFILE_SAMPLE_INTERVAL = 0.005
+PDF_PROFILE_TOP = 50
+
+# Library that merges, splits and rotates PDFs, per operation: "pymupdf" (MuPDF,
+# native code) or "pypdf2" (pure Python). Compare with: python manage.py benchmark_pdf_engines
+PDF_ENGINES = {
+    "merge": "pymupdf",
+    "split": "pymupdf",
+    "rotate": "pymupdf",
+}
+
+# Archives built by split (several parts) and PDF to images:
+#   PDF_ARCHIVE_FORMAT        "zip", or "tar" (uncompressed, plain copy of the entries)
+#   PDF_ARCHIVE_COMPRESSION   "auto" deflates the ZIP entries that shrink and stores
+#                             the rest (JPEG/PNG/WEBP, most PDFs), "deflate" or "store"
+#   PDF_ARCHIVE_COMPRESSLEVEL zlib level (1-9) of deflated entries
+#   PDF_ARCHIVE_WORKERS       threads compressing ZIP entries in parallel
+PDF_ARCHIVE_FORMAT = os.getenv("PDF_ARCHIVE_FORMAT", "zip")
+PDF_ARCHIVE_COMPRESSION = os.getenv("PDF_ARCHIVE_COMPRESSION", "auto")
+PDF_ARCHIVE_COMPRESSLEVEL = 6
+PDF_ARCHIVE_WORKERS = min(4, os.cpu_count() or 1)
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -103,6 +233,10 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Several processes write at once when run_operation_workers is used:
+        # take the write lock when a transaction starts and wait for it,
+        # instead of failing with "database is locked" on lock upgrade
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
     }
 }
 
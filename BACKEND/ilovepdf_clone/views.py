@@ -0,0 +1,12 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from .metrics import REGISTRY
+
+
+@require_GET
+def metrics(request):
+    """Metrics of every process in the Prometheus text format"""
+    return HttpResponse(
+        REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,409 @@
+import io
+import os
+import struct
+import tarfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Archive format -> file extension and MIME type
+ARCHIVE_FORMATS = {
+    "zip": (".zip", "application/zip"),
+    "tar": (".tar", "application/x-tar"),
+}
+
+COMPRESSION_MODES = ("auto", "deflate", "store")
+
+# In auto mode an entry is stored rather than deflated if a level 1 pass
+# over its first SAMPLE_SIZE bytes does not save at least 10%, so already
+# compressed data (images, compressed PDF streams) is not deflated again.
+SAMPLE_SIZE = 64 * 1024
+MIN_SAVING_RATIO = 0.9
+
+# Central directory and end records, laid out as zipfile writes them
+CENTRAL_DIRECTORY_ENTRY = struct.Struct("<4s4B4HL2L5H2L")
+ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+ZIP64_END_LOCATOR = struct.Struct("<4sLQL")
+END_RECORD = struct.Struct("<4s4H2LH")
+
+
+class EntryStream:
+    """
+    Write-only stream for one archive entry. Adds the tell() that writers
+    such as PyPDF2's PdfWriter need, and batches their many small writes
+    before they reach the compressor. The entry is opened with the first
+    batch, open_entry(first_batch) returning an EntryWriter, so its
+    compression can be chosen from the beginning of the data without
+    holding the rest.
+    """
+
+    buffer_size = SAMPLE_SIZE
+
+    def __init__(self, open_entry):
+        self.open_entry = open_entry
+        self.raw = None
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        if self.raw is None:
+            self.raw = self.open_entry(bytes(self.buffer))
+        if self.buffer:
+            self.raw.write(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        self.raw.close()
+
+
+def shrinks(data):
+    """Whether a level 1 deflate of the beginning of data saves enough"""
+    sample = data[:SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) < len(sample) * MIN_SAVING_RATIO
+
+
+def choose_compress_type(compression, head):
+    """zipfile compression of an entry starting with head"""
+    if compression == "store":
+        return zipfile.ZIP_STORED
+    if compression == "deflate" or shrinks(head):
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+
+def encode_entry(data, compression, compresslevel):
+    """
+    Compress one ZIP entry. Runs on the compression threads (zlib releases
+    the GIL). Returns (compress_type, crc, payload).
+    """
+    crc = zlib.crc32(data)
+    compress_type = choose_compress_type(compression, data)
+    if compress_type == zipfile.ZIP_STORED:
+        return compress_type, crc, data
+
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    return compress_type, crc, compressor.compress(data) + compressor.flush()
+
+
+class EntryWriter:
+    """
+    Compresses a streamed entry into the archive as it is written. Its
+    local header is written first with the sizes left out and written
+    again, complete, on close.
+    """
+
+    def __init__(self, fileobj, zinfo, zip64, compresslevel):
+        self.fileobj = fileobj
+        self.zinfo = zinfo
+        self.zip64 = zip64
+        self.compressor = None
+        if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            self.compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        zinfo.CRC = zinfo.file_size = zinfo.compress_size = 0
+        fileobj.write(zinfo.FileHeader(zip64))
+
+    def write(self, data):
+        self.zinfo.CRC = zlib.crc32(data, self.zinfo.CRC)
+        self.zinfo.file_size += len(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self._write(data)
+
+    def _write(self, data):
+        self.zinfo.compress_size += len(data)
+        self.fileobj.write(data)
+
+    def close(self):
+        if self.compressor is not None:
+            self._write(self.compressor.flush())
+        zinfo = self.zinfo
+        largest = max(zinfo.file_size, zinfo.compress_size)
+        if not self.zip64 and largest > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(
+                f"Entry {zinfo.filename} is larger than 4GB, use force_zip64"
+            )
+        end = self.fileobj.tell()
+        self.fileobj.seek(zinfo.header_offset)
+        self.fileobj.write(zinfo.FileHeader(self.zip64))
+        self.fileobj.seek(end)
+
+
+class ArchiveBuilder:
+    """
+    Build a ZIP archive on an open, seekable file (normally the `file` of a
+    DownloadFileWriter) one entry at a time:
+
+        with open_download_file("pages.zip") as output:
+            with ArchiveBuilder(output.file) as archive:
+                for name, data in entries:
+                    archive.add(name, data)
+
+    compression is "auto" (deflate entries that shrink, store the rest),
+    "deflate" or "store"; in auto mode the choice is made from the first
+    SAMPLE_SIZE bytes of an entry. Entries given to add() are compressed on
+    up to `workers` threads and written in the order they were added, with
+    at most 2 * workers of them held in memory. Entries written through
+    open() stream into the archive.
+
+    The ZIP records are written here rather than by zipfile.ZipFile, which
+    can only compress an entry on the thread that writes it. ZIP64 records
+    are written when the archive needs them; force_zip64 is only needed for
+    a single entry above 4GB written through open().
+    """
+
+    format = "zip"
+
+    def __init__(
+        self, fileobj, compression="auto", compresslevel=6, workers=1, force_zip64=False
+    ):
+        if compression not in COMPRESSION_MODES:
+            raise ValueError(f"Unsupported archive compression: {compression}")
+        self.fileobj = fileobj
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.force_zip64 = force_zip64
+        self.entries = []
+        self.executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        self.max_pending = 2 * workers
+        self.pending = deque()
+
+    @property
+    def entry_count(self):
+        return len(self.entries)
+
+    def add(self, name, data):
+        """Add an entry whose content is already in memory"""
+        if self.executor is None:
+            self._write_entry(
+                name, data, encode_entry(data, self.compression, self.compresslevel)
+            )
+            return
+
+        future = self.executor.submit(
+            encode_entry, data, self.compression, self.compresslevel
+        )
+        self.pending.append((name, data, future))
+        while len(self.pending) >= self.max_pending:
+            self._write_next()
+
+    @contextmanager
+    def open(self, name):
+        """Yield a stream that writes an entry into the archive"""
+        self._flush_pending()
+        stream = EntryStream(lambda head: self._open_entry(name, head))
+        try:
+            yield stream
+        finally:
+            # The entry must be closed before anything else is written
+            stream.close()
+
+    def _new_entry(self, name, compress_type):
+        zinfo = zipfile.ZipInfo(name, time.localtime()[:6])
+        zinfo.external_attr = 0o600 << 16
+        zinfo.compress_type = compress_type
+        zinfo.header_offset = self.fileobj.tell()
+        self.entries.append(zinfo)
+        return zinfo
+
+    def _open_entry(self, name, head):
+        zinfo = self._new_entry(name, choose_compress_type(self.compression, head))
+        return EntryWriter(self.fileobj, zinfo, self.force_zip64, self.compresslevel)
+
+    def _write_entry(self, name, data, encoded):
+        """Append an entry compressed by encode_entry"""
+        compress_type, crc, payload = encoded
+        zinfo = self._new_entry(name, compress_type)
+        zinfo.CRC = crc
+        zinfo.file_size = len(data)
+        zinfo.compress_size = len(payload)
+        largest = max(zinfo.file_size, zinfo.compress_size)
+        zip64 = self.force_zip64 or largest > zipfile.ZIP64_LIMIT
+        self.fileobj.write(zinfo.FileHeader(zip64))
+        self.fileobj.write(payload)
+
+    def _write_next(self):
+        name, data, future = self.pending.popleft()
+        self._write_entry(name, data, future.result())
+
+    def _flush_pending(self):
+        while self.pending:
+            self._write_next()
+
+    def _write_central_directory(self):
+        start = self.fileobj.tell()
+        for zinfo in self.entries:
+            dt = zinfo.date_time
+            dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+            dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
+            file_size, compress_size = zinfo.file_size, zinfo.compress_size
+            header_offset = zinfo.header_offset
+            zip64_fields = []
+            if max(file_size, compress_size) > zipfile.ZIP64_LIMIT:
+                zip64_fields += [file_size, compress_size]
+                file_size = compress_size = 0xFFFFFFFF
+            if header_offset > zipfile.ZIP64_LIMIT:
+                zip64_fields.append(header_offset)
+                header_offset = 0xFFFFFFFF
+
+            extra = b""
+            min_version = 0
+            if zip64_fields:
+                extra = struct.pack(
+                    f"<HH{len(zip64_fields)}Q", 1, 8 * len(zip64_fields), *zip64_fields
+                )
+                min_version = zipfile.ZIP64_VERSION
+            try:
+                filename, flag_bits = zinfo.filename.encode("ascii"), 0
+            except UnicodeEncodeError:
+                filename, flag_bits = zinfo.filename.encode("utf-8"), 0x800
+
+            self.fileobj.write(
+                CENTRAL_DIRECTORY_ENTRY.pack(
+                    b"PK\x01\x02",
+                    max(min_version, zinfo.create_version),
+                    zinfo.create_system,
+                    max(min_version, zinfo.extract_version),
+                    0,
+                    flag_bits,
+                    zinfo.compress_type,
+                    dostime,
+                    dosdate,
+                    zinfo.CRC,
+                    compress_size,
+                    file_size,
+                    len(filename),
+                    len(extra),
+                    0,
+                    0,
+                    zinfo.internal_attr,
+                    zinfo.external_attr,
+                    header_offset,
+                )
+            )
+            self.fileobj.write(filename)
+            self.fileobj.write(extra)
+        return start, self.fileobj.tell()
+
+    def _write_end_records(self, start, end):
+        count, size, offset = len(self.entries), end - start, start
+        if (
+            count > zipfile.ZIP_FILECOUNT_LIMIT
+            or size > zipfile.ZIP64_LIMIT
+            or offset > zipfile.ZIP64_LIMIT
+        ):
+            self.fileobj.write(
+                ZIP64_END_RECORD.pack(
+                    b"PK\x06\x06", 44, 45, 45, 0, 0, count, count, size, offset
+                )
+            )
+            self.fileobj.write(ZIP64_END_LOCATOR.pack(b"PK\x06\x07", 0, end, 1))
+            count = min(count, 0xFFFF)
+            size = min(size, 0xFFFFFFFF)
+            offset = min(offset, 0xFFFFFFFF)
+        self.fileobj.write(
+            END_RECORD.pack(b"PK\x05\x06", 0, 0, count, count, size, offset, 0)
+        )
+
+    def close(self):
+        try:
+            self._flush_pending()
+            self._write_end_records(*self._write_central_directory())
+            self.fileobj.flush()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class TarArchiveBuilder:
+    """
+    Same interface as ArchiveBuilder for an uncompressed (POSIX pax) tar.
+    Entries are copied as they come, so building it costs plain I/O.
+    """
+
+    format = "tar"
+
+    def __init__(self, fileobj):
+        self.tar_file = tarfile.open(
+            fileobj=fileobj, mode="w", format=tarfile.PAX_FORMAT
+        )
+        self.entry_count = 0
+
+    def add(self, name, data):
+        """Add an entry whose content is already in memory"""
+        self._add_file(name, len(data), io.BytesIO(data))
+
+    @contextmanager
+    def open(self, name):
+        """Yield a stream for an entry; tar needs its size before the data"""
+        buffer = io.BytesIO()
+        yield buffer
+        size = buffer.tell()
+        buffer.seek(0)
+        self._add_file(name, size, buffer)
+
+    def _add_file(self, name, size, fileobj):
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.size = size
+        tarinfo.mtime = time.time()
+        tarinfo.mode = 0o600
+        self.tar_file.addfile(tarinfo, fileobj)
+        self.entry_count += 1
+
+    def close(self):
+        self.tar_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def archive_filename(filename, archive_format=None):
+    """Give filename the extension of the archive format ("x.zip" -> "x.tar")"""
+    archive_format = archive_format or settings.PDF_ARCHIVE_FORMAT
+    extension = ARCHIVE_FORMATS[archive_format][0]
+    base, current = os.path.splitext(filename)
+    if current.lower() in (".zip", ".tar"):
+        filename = base
+    return f"{filename}{extension}"
+
+
+def create_archive(fileobj, archive_format=None, force_zip64=False):
+    """Archive builder for fileobj configured from the PDF_ARCHIVE_* settings"""
+    archive_format = archive_format or settings.PDF_ARCHIVE_FORMAT
+    if archive_format == "tar":
+        return TarArchiveBuilder(fileobj)
+    if archive_format == "zip":
+        return ArchiveBuilder(
+            fileobj,
+            compression=settings.PDF_ARCHIVE_COMPRESSION,
+            compresslevel=settings.PDF_ARCHIVE_COMPRESSLEVEL,
+            workers=settings.PDF_ARCHIVE_WORKERS,
+            force_zip64=force_zip64,
+        )
+    raise ValueError(f"Unsupported archive format: {archive_format}")
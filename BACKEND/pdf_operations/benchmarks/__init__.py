@@ -0,0 +1,8 @@
+"""
+Benchmark suite of the PDF operations (python manage.py benchmark_operations).
+
+corpus.py generates the input files offline from a fixed seed, suite.py
+runs every operation with every engine on them and compares the results
+with a saved baseline. memory.py measures the peak memory of the
+operations on growing inputs instead (--memory).
+"""
@@ -0,0 +1,146 @@
+"""
+Synthetic benchmark corpus. Every file is generated from CORPUS_SEED, so
+the same corpus (byte for byte with the same PyMuPDF and Pillow) is built
+on every machine without downloading anything.
+"""
+
+import io
+import json
+import os
+import random
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+CORPUS_SEED = 20240601
+CORPUS_VERSION = 1
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud "
+    "exercitation ullamco laboris nisi aliquip ex ea commodo consequat duis aute irure "
+    "in reprehenderit voluptate velit esse cillum fugiat nulla pariatur excepteur sint"
+).split()
+
+# name: (kind, size). Sizes are pages for PDFs and (width, height) for images;
+# quick runs use the second size. New files go at the end: the position
+# seeds each file
+CORPUS = {
+    "small": ("pdf_text", (3, 3)),
+    "text_heavy": ("pdf_text", (60, 10)),
+    "image_heavy": ("pdf_images", (24, 4)),
+    "large": ("pdf_simple", (1200, 120)),
+    "photo_jpeg": ("jpeg", ((4000, 3000), (1200, 900))),
+    "scan_png": ("png", ((3000, 2000), (1000, 700))),
+    # Growing inputs of the memory benchmark, with large and photo_jpeg
+    "simple_100": ("pdf_simple", (100, 20)),
+    "simple_400": ("pdf_simple", (400, 60)),
+    "photo_small": ("jpeg", ((1000, 750), (400, 300))),
+    "photo_medium": ("jpeg", ((2000, 1500), (800, 600))),
+}
+
+EXTENSIONS = {"jpeg": ".jpg", "png": ".png"}
+
+
+def make_image(rng, width, height):
+    """A smooth, photo-like RGB image: gradients with blurred noise"""
+    noise = Image.frombytes("RGB", (64, 48), rng.randbytes(64 * 48 * 3))
+    noise = noise.resize((width, height), Image.Resampling.BICUBIC)
+    horizontal = Image.linear_gradient("L").resize((width, height)).rotate(90)
+    vertical = Image.linear_gradient("L").resize((width, height))
+    gradient = Image.merge("RGB", (horizontal, vertical, horizontal.rotate(180)))
+    return Image.blend(gradient, noise, 0.45)
+
+
+def paragraph(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def write_text_pdf(path, pages, rng):
+    with fitz.open() as document:
+        for page_num in range(pages):
+            page = document.new_page()
+            page.insert_text((72, 60), f"Section {page_num + 1}", fontsize=16)
+            page.insert_textbox(
+                fitz.Rect(72, 80, 540, 770), paragraph(rng, 450), fontsize=9
+            )
+        document.save(path, garbage=3, deflate=True, no_new_id=True)
+
+
+def write_image_pdf(path, pages, rng):
+    with fitz.open() as document:
+        for page_num in range(pages):
+            page = document.new_page()
+            image = io.BytesIO()
+            make_image(rng, 1600, 1200).save(image, "JPEG", quality=85)
+            page.insert_image(fitz.Rect(36, 72, 576, 477), stream=image.getvalue())
+            page.insert_text((36, 60), f"Figure {page_num + 1}", fontsize=12)
+            page.insert_textbox(
+                fitz.Rect(36, 500, 576, 760), paragraph(rng, 120), fontsize=9
+            )
+        document.save(path, garbage=3, deflate=True, no_new_id=True)
+
+
+def write_simple_pdf(path, pages, rng):
+    with fitz.open() as document:
+        for page_num in range(pages):
+            page = document.new_page()
+            page.insert_text((72, 72), f"Page {page_num + 1}", fontsize=14)
+            page.insert_text((72, 100), paragraph(rng, 12), fontsize=10)
+            page.draw_rect(
+                fitz.Rect(300, 600, 500, 750), color=(0, 0, 1), fill=(1, 0, 0)
+            )
+        document.save(path, garbage=3, deflate=True, no_new_id=True)
+
+
+WRITERS = {
+    "pdf_text": write_text_pdf,
+    "pdf_images": write_image_pdf,
+    "pdf_simple": write_simple_pdf,
+}
+
+
+def build_corpus(directory, quick=False, names=None):
+    """
+    Generate the corpus (or only the files in names) in directory, reusing
+    files already generated with the same version and size.
+    Returns {name: {"path", "kind", "size"}}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, "manifest.json")
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        manifest = {}
+
+    corpus = {}
+    for index, (name, (kind, sizes)) in enumerate(CORPUS.items()):
+        if names is not None and name not in names:
+            continue
+        size = sizes[1] if quick else sizes[0]
+        filename = name + EXTENSIONS.get(kind, ".pdf")
+        path = os.path.join(directory, filename)
+        spec = {
+            "version": CORPUS_VERSION,
+            "kind": kind,
+            # As stored in the JSON manifest
+            "size": list(size) if isinstance(size, tuple) else size,
+        }
+
+        if manifest.get(name) != spec or not os.path.exists(path):
+            # One generator per file, so files do not depend on each other
+            rng = random.Random(CORPUS_SEED + index)
+            if kind in WRITERS:
+                WRITERS[kind](path, size, rng)
+            elif kind == "jpeg":
+                make_image(rng, *size).save(path, "JPEG", quality=92)
+            else:
+                make_image(rng, *size).save(path, "PNG")
+            manifest[name] = spec
+
+        corpus[name] = {"path": path, "kind": kind, "size": size}
+
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return corpus
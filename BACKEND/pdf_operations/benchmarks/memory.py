@@ -0,0 +1,458 @@
+"""
+Memory benchmark of the PDF operations (benchmark_operations --memory).
+
+Each series runs one operation on growing inputs: more pages, bigger
+images or a higher rendering DPI. Every point runs twice, each time in a
+forked process so that memory kept by the allocator after earlier runs
+does not hide its peak:
+
+- with RSS sampling: the peak resident set of the process (the kernel's
+  VmHWM, reset before the run, and a thread sampling the current RSS)
+  minus the RSS before the run. This includes the MuPDF and Pillow
+  buffers, which tracemalloc does not see;
+- under tracemalloc: the peak of the Python heap.
+
+A least-squares line through the points of a series gives the memory
+per unit (page, megapixel of input image, DPI²) and the fixed overhead.
+The per unit figures of each point are its peak minus that overhead,
+divided by its units. Rendering
+runs in the measured process (PDF_RENDER_WORKERS = 1), so the
+pdf_to_images figures are those of one render worker.
+"""
+
+import gc
+import multiprocessing
+import os
+import statistics
+import threading
+import tracemalloc
+
+from django.db import connections
+from django.test import override_settings
+from django.utils import timezone
+
+from ..document_cache import document_cache
+from ..timing import collect_metrics
+from ..utils import (convert_images_to_pdf, convert_pdf_to_images,
+                     merge_pdf_files, rotate_pdf_file, split_pdf_by_pages)
+from .suite import (RESULTS_VERSION, Case, corpus_summary, engine_settings,
+                    environment, isolated_environment, register_inputs)
+
+MB = 1024 * 1024
+
+# Seconds between two samples of the RSS
+SAMPLE_INTERVAL = 0.002
+
+# Peak differences below this many bytes are noise, never regressions
+NOISE_FLOOR = 4 * MB
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss():
+    """Resident set size of this process in bytes, None without /proc"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+def peak_rss():
+    """Peak resident set size of this process (VmHWM) in bytes"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS; False where the kernel does not allow it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class RSSSampler(threading.Thread):
+    """Highest RSS of the process, sampled every interval seconds"""
+
+    def __init__(self, interval):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.interval = interval
+        self.peak = current_rss() or 0
+        self.finished = threading.Event()
+
+    def sample(self):
+        self.peak = max(self.peak, current_rss() or 0)
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+        self.sample()
+
+
+class Series:
+    """An operation measured on growing inputs, one Case per point"""
+
+    def __init__(self, name, unit, cases, scales=None):
+        self.name = name
+        # "page", "MP" (megapixels of the input images) or "dpi2"
+        self.unit = unit
+        self.cases = cases
+        # Units of each case when they are not read from its metrics
+        self.scales = scales
+
+    @property
+    def engines(self):
+        return self.cases[0].engines
+
+    def units(self, index, counts, corpus):
+        if self.scales is not None:
+            return self.scales[index]
+        if self.unit == "page":
+            return counts.get("input_pages", 0)
+        # Decoded images, not their compressed size, take the memory
+        return sum(
+            width * height / 1e6
+            for width, height in (
+                corpus[name]["size"] for name in self.cases[index].inputs
+            )
+        )
+
+
+PAGE_INPUTS = ["simple_100", "simple_400", "large"]
+IMAGE_INPUTS = ["photo_small", "photo_medium", "photo_jpeg"]
+RENDER_DPIS = [72, 150, 300]
+
+
+def render_pages(dpi):
+    return lambda ids: convert_pdf_to_images(
+        ids[0], "JPEG", quality=85, dpi=dpi, pages_range=(1, 4)
+    )
+
+
+SERIES = [
+    Series(
+        "merge/twice",
+        "page",
+        [
+            Case(
+                f"merge/twice/{name}",
+                "merge",
+                [name, name],
+                lambda ids: merge_pdf_files(ids, "benchmark_merged.pdf"),
+                engine_setting="merge",
+            )
+            for name in PAGE_INPUTS
+        ],
+    ),
+    Series(
+        "split/every_page",
+        "page",
+        [
+            Case(
+                f"split/every_page/{name}",
+                "split",
+                [name],
+                lambda ids: split_pdf_by_pages(ids[0], {"mode": "all_pages"})[0],
+                engine_setting="split",
+            )
+            for name in PAGE_INPUTS
+        ],
+    ),
+    Series(
+        "rotate/all",
+        "page",
+        [
+            Case(
+                f"rotate/all/{name}",
+                "rotate",
+                [name],
+                lambda ids: rotate_pdf_file(ids[0], 90, "all", "benchmark_rotated.pdf"),
+                engine_setting="rotate",
+            )
+            for name in PAGE_INPUTS
+        ],
+    ),
+    Series(
+        "pdf_to_images/4_pages_jpeg",
+        "dpi2",
+        [
+            Case(
+                f"pdf_to_images/4_pages_jpeg/{dpi}dpi",
+                "convert_to_image",
+                ["text_heavy"],
+                render_pages(dpi),
+                engine="pymupdf",
+            )
+            for dpi in RENDER_DPIS
+        ],
+        scales=[dpi * dpi for dpi in RENDER_DPIS],
+    ),
+    Series(
+        "images_to_pdf/photo",
+        "MP",
+        [
+            Case(
+                f"images_to_pdf/photo/{name}",
+                "convert_from_image",
+                [name],
+                lambda ids: convert_images_to_pdf(ids, "benchmark_photo.pdf"),
+                engine="pillow",
+            )
+            for name in IMAGE_INPUTS
+        ],
+    ),
+]
+
+
+def select_series(patterns=None, engines=None):
+    """
+    [(series, engine)] whose "name/engine", or that of one of its points,
+    contains one of patterns. Series are always measured whole.
+    """
+    selected = []
+    for series in SERIES:
+        for engine in series.engines:
+            if engines and engine not in engines:
+                continue
+            keys = [f"{case.name}/{engine}" for case in series.cases]
+            if patterns and not any(
+                pattern in key for pattern in patterns for key in keys
+            ):
+                continue
+            selected.append((series, engine))
+    return selected
+
+
+def measure(case, engine, file_ids, trace):
+    """
+    Run case once. Returns (peak bytes, metrics): the peak of the Python
+    heap with trace, else the peak RSS above the RSS before the run.
+    """
+    document_cache.clear()
+    gc.collect()
+    with override_settings(**engine_settings(case, engine)):
+        if trace:
+            tracemalloc.start()
+        else:
+            rss_before = current_rss()
+            kernel_peak = reset_peak_rss()
+            sampler = RSSSampler(SAMPLE_INTERVAL)
+            sampler.start()
+        try:
+            with collect_metrics() as metrics:
+                output = case.run(file_ids)
+        finally:
+            if trace:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                sampler.stop()
+                highest = max(sampler.peak, (kernel_peak and peak_rss()) or 0)
+                peak = highest - rss_before if rss_before is not None else None
+        output.delete()
+    return peak, metrics.as_dict()
+
+
+def _run_child(sender, function, args):
+    try:
+        sender.send(("ok", function(*args)))
+    except Exception as e:
+        sender.send(("error", f"{type(e).__name__}: {str(e)}"))
+    finally:
+        sender.close()
+
+
+def run_isolated(function, *args):
+    """
+    Call function(*args) in a forked process and return its result, or in
+    this process where fork is not available. Raises RuntimeError if the
+    call fails or the process dies (e.g. killed when out of memory).
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        try:
+            return function(*args)
+        except Exception as e:
+            raise RuntimeError(f"{type(e).__name__}: {str(e)}")
+
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    # The child opens its own database connections
+    connections.close_all()
+    process = context.Process(target=_run_child, args=(sender, function, args))
+    process.start()
+    sender.close()
+    try:
+        status, value = receiver.recv()
+    except EOFError:
+        status, value = "error", None
+    finally:
+        receiver.close()
+        process.join()
+
+    if status == "ok":
+        return value
+    if value is None:
+        if process.exitcode is not None and process.exitcode < 0:
+            value = f"Killed by signal {-process.exitcode}"
+        else:
+            value = f"Exited with code {process.exitcode}"
+    raise RuntimeError(value)
+
+
+def run_point(series, index, engine, corpus, inputs):
+    case = series.cases[index]
+    file_ids = [str(inputs[name].id) for name in case.inputs]
+    result = {
+        "case": case.name,
+        "series": series.name,
+        "operation": case.operation,
+        "engine": engine,
+        "inputs": case.inputs,
+        "unit": series.unit,
+    }
+    try:
+        peak_rss_bytes, metrics = run_isolated(measure, case, engine, file_ids, False)
+        peak_heap_bytes, _ = run_isolated(measure, case, engine, file_ids, True)
+    except RuntimeError as e:
+        result["error"] = str(e)
+        return result
+
+    counts = metrics["counts"]
+    units = series.units(index, counts, corpus)
+    result.update(
+        {
+            "units": round(units, 3),
+            "seconds": round(metrics["total_ms"] / 1000, 4),
+            "pages": counts.get("output_pages", 0),
+            "input_bytes": counts.get("input_bytes", 0),
+            "peak_rss_bytes": peak_rss_bytes,
+            "peak_heap_bytes": peak_heap_bytes,
+        }
+    )
+    return result
+
+
+def fit(points, metric):
+    """(bytes per unit, fixed bytes) of a least-squares line, or (None, None)"""
+    points = [(point["units"], point[metric]) for point in points if point.get(metric)]
+    if len({units for units, _ in points}) < 2:
+        return None, None
+    slope, intercept = statistics.linear_regression(*zip(*points))
+    return round(slope), round(intercept)
+
+
+def scaling(series, points):
+    rss_per_unit, rss_fixed = fit(points, "peak_rss_bytes")
+    heap_per_unit, heap_fixed = fit(points, "peak_heap_bytes")
+    return {
+        "unit": series.unit,
+        "points": len(points),
+        "rss_per_unit": rss_per_unit,
+        "rss_fixed_bytes": rss_fixed,
+        "heap_per_unit": heap_per_unit,
+        "heap_fixed_bytes": heap_fixed,
+    }
+
+
+def per_unit(point, metric, fixed):
+    """Peak of a point above the fixed bytes of its series, per unit"""
+    if fixed is None or not point["units"] or not point.get(metric):
+        return None
+    return round((point[metric] - fixed) / point["units"])
+
+
+def add_per_unit(points, scale):
+    """
+    Set rss_per_unit and heap_per_unit of each point from the fit of its
+    series, so that the fixed overhead is not spread over the units
+    """
+    for point in points:
+        point["rss_per_unit"] = per_unit(
+            point, "peak_rss_bytes", scale["rss_fixed_bytes"]
+        )
+        point["heap_per_unit"] = per_unit(
+            point, "peak_heap_bytes", scale["heap_fixed_bytes"]
+        )
+
+
+def warm_up(selected, inputs):
+    """
+    Run the smallest point of each series once in this process, so that
+    every measured process starts with the libraries loaded and their
+    pages resident, like a worker that has served requests.
+    """
+    for series, engine in selected:
+        case = series.cases[0]
+        file_ids = [str(inputs[name].id) for name in case.inputs]
+        try:
+            with override_settings(**engine_settings(case, engine)):
+                case.run(file_ids).delete()
+        except Exception:
+            # The measured runs report the error
+            pass
+    document_cache.clear()
+    gc.collect()
+
+
+def run_memory_suite(corpus, selected, on_result=None):
+    """
+    Measure the selected (series, engine) pairs on the corpus.
+    Returns the results document written by benchmark_operations --memory --output.
+    """
+    names = list(
+        dict.fromkeys(
+            name
+            for series, _ in selected
+            for case in series.cases
+            for name in case.inputs
+        )
+    )
+    results = {}
+    scales = {}
+
+    with isolated_environment(
+        PDF_RESULT_CACHE=False, PDF_PROFILE_SAMPLE_RATE=0.0, PDF_RENDER_WORKERS=1
+    ):
+        inputs = register_inputs(corpus, names)
+        try:
+            warm_up(selected, inputs)
+            for series, engine in selected:
+                series_results = [
+                    run_point(series, index, engine, corpus, inputs)
+                    for index in range(len(series.cases))
+                ]
+                points = [result for result in series_results if "error" not in result]
+                scale = scaling(series, points)
+                scales[f"{series.name}/{engine}"] = scale
+                # Reported once the fit is known
+                add_per_unit(points, scale)
+                for result in series_results:
+                    results[f"{result['case']}/{engine}"] = result
+                    if on_result is not None:
+                        on_result(result)
+        finally:
+            for temp_file in inputs.values():
+                temp_file.delete()
+
+    return {
+        "version": RESULTS_VERSION,
+        "kind": "memory",
+        "created_at": timezone.now().isoformat(),
+        "environment": environment(),
+        "corpus": corpus_summary(corpus, names),
+        "results": results,
+        "scaling": scales,
+    }
@@ -0,0 +1,294 @@
+"""
+Benchmark cases of the PDF operations and comparison with a baseline.
+
+Each case calls the operation's function in utils.py on corpus files
+registered as temporary files, with every engine that can run it, and
+takes its wall time and sizes from the stage metrics (timing.py). The
+result cache, profiling and the parsed document cache are kept out of
+the measurement, so every run parses and produces its output again.
+Runs use a test database and a temporary MEDIA_ROOT (isolated_environment),
+never the configured ones.
+"""
+
+import os
+import platform
+import statistics
+import sys
+import tempfile
+from contextlib import contextmanager
+from importlib import metadata
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+from file_manager.utils import create_download_file
+
+from ..document_cache import document_cache
+from ..engines import ENGINES
+from ..timing import collect_metrics
+from ..utils import (convert_images_to_pdf, convert_pdf_to_images,
+                     merge_pdf_files, rotate_pdf_file, split_pdf_by_pages)
+
+RESULTS_VERSION = 1
+
+# Differences below this many seconds are noise, never regressions
+NOISE_FLOOR = 0.005
+
+
+class Case:
+    def __init__(self, name, operation, inputs, run, engine_setting=None, engine=None):
+        self.name = name
+        self.operation = operation
+        self.inputs = inputs
+        self.run = run
+        # Key of settings.PDF_ENGINES the case is run with every engine for,
+        # else the single library doing the work
+        self.engine_setting = engine_setting
+        self.engine = engine
+
+    @property
+    def engines(self):
+        return list(ENGINES) if self.engine_setting else [self.engine]
+
+
+CASES = [
+    Case(
+        "merge/mixed",
+        "merge",
+        ["small", "text_heavy", "image_heavy"],
+        lambda ids: merge_pdf_files(ids, "benchmark_merged.pdf"),
+        engine_setting="merge",
+    ),
+    Case(
+        "merge/large_twice",
+        "merge",
+        ["large", "large"],
+        lambda ids: merge_pdf_files(ids, "benchmark_merged.pdf"),
+        engine_setting="merge",
+    ),
+    Case(
+        "split/text_heavy_every_page",
+        "split",
+        ["text_heavy"],
+        lambda ids: split_pdf_by_pages(ids[0], {"mode": "all_pages"})[0],
+        engine_setting="split",
+    ),
+    Case(
+        "split/large_every_10_pages",
+        "split",
+        ["large"],
+        lambda ids: split_pdf_by_pages(
+            ids[0], {"mode": "every_n_pages", "pages_per_split": 10}
+        )[0],
+        engine_setting="split",
+    ),
+    Case(
+        "rotate/large",
+        "rotate",
+        ["large"],
+        lambda ids: rotate_pdf_file(ids[0], 90, "all", "benchmark_rotated.pdf"),
+        engine_setting="rotate",
+    ),
+    Case(
+        "rotate/image_heavy",
+        "rotate",
+        ["image_heavy"],
+        lambda ids: rotate_pdf_file(ids[0], 90, "all", "benchmark_rotated.pdf"),
+        engine_setting="rotate",
+    ),
+    Case(
+        "pdf_to_images/text_heavy_png",
+        "convert_to_image",
+        ["text_heavy"],
+        lambda ids: convert_pdf_to_images(ids[0], "PNG", dpi=100, pages_range=(1, 10)),
+        engine="pymupdf",
+    ),
+    Case(
+        "pdf_to_images/image_heavy_jpeg",
+        "convert_to_image",
+        ["image_heavy"],
+        lambda ids: convert_pdf_to_images(
+            ids[0], "JPEG", quality=85, dpi=150, pages_range=(1, 4)
+        ),
+        engine="pymupdf",
+    ),
+    Case(
+        "images_to_pdf/photo_jpeg",
+        "convert_from_image",
+        ["photo_jpeg"],
+        lambda ids: convert_images_to_pdf(ids, "benchmark_photo.pdf"),
+        engine="pillow",
+    ),
+    Case(
+        "images_to_pdf/scan_png",
+        "convert_from_image",
+        ["scan_png"],
+        lambda ids: convert_images_to_pdf(ids, "benchmark_scan.pdf"),
+        engine="pillow",
+    ),
+]
+
+
+def select_cases(patterns=None, engines=None):
+    """[(case, engine)] whose "name/engine" contains one of patterns"""
+    selected = []
+    for case in CASES:
+        for engine in case.engines:
+            if engines and engine not in engines:
+                continue
+            key = f"{case.name}/{engine}"
+            if patterns and not any(pattern in key for pattern in patterns):
+                continue
+            selected.append((case, engine))
+    return selected
+
+
+def environment():
+    packages = {}
+    for package in ("Django", "PyMuPDF", "PyPDF2", "pillow"):
+        try:
+            packages[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            packages[package] = None
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": packages,
+        "render_workers": settings.PDF_RENDER_WORKERS,
+        "archive_format": settings.PDF_ARCHIVE_FORMAT,
+    }
+
+
+@contextmanager
+def isolated_environment(**overrides):
+    """
+    Run the block against test databases and a MEDIA_ROOT in a temporary
+    directory, as the test runner does, with overrides applied to the
+    settings. The rows, files and metrics of a benchmark never reach the
+    configured database, storage or METRICS_DIR.
+    """
+    with tempfile.TemporaryDirectory() as directory, override_settings(
+        MEDIA_ROOT=directory,
+        FILE_UPLOAD_TEMP_DIR=os.path.join(directory, "tmp"),
+        METRICS_DIR=None,
+        **overrides,
+    ):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+
+def register_inputs(corpus, names):
+    """Store the corpus files a run needs as temporary files: {name: TemporaryFile}"""
+    inputs = {}
+    for name in names:
+        path = corpus[name]["path"]
+        with open(path, "rb") as corpus_file:
+            inputs[name] = create_download_file(corpus_file, os.path.basename(path))
+    return inputs
+
+
+def corpus_summary(corpus, names):
+    return {
+        name: {
+            "kind": corpus[name]["kind"],
+            "size": corpus[name]["size"],
+            "bytes": os.path.getsize(corpus[name]["path"]),
+        }
+        for name in names
+    }
+
+
+def engine_settings(case, engine):
+    """Settings overridden to run case with engine"""
+    if not case.engine_setting:
+        return {}
+    return {"PDF_ENGINES": {**settings.PDF_ENGINES, case.engine_setting: engine}}
+
+
+def run_case(case, engine, inputs, repeat):
+    """Run a case repeat times; the fastest run is reported"""
+    file_ids = [str(inputs[name].id) for name in case.inputs]
+    runs = []
+    with override_settings(**engine_settings(case, engine)):
+        for _ in range(repeat):
+            document_cache.clear()
+            with collect_metrics() as metrics:
+                output = case.run(file_ids)
+            output.delete()
+            runs.append(metrics.as_dict())
+
+    best = min(runs, key=lambda run: run["total_ms"])
+    seconds = best["total_ms"] / 1000
+    counts = best["counts"]
+    pages = counts.get("output_pages", 0)
+    input_bytes = counts.get("input_bytes", 0)
+    return {
+        "case": case.name,
+        "operation": case.operation,
+        "engine": engine,
+        "inputs": case.inputs,
+        "repeat": repeat,
+        "seconds": round(seconds, 4),
+        "median_seconds": round(
+            statistics.median(run["total_ms"] for run in runs) / 1000, 4
+        ),
+        "pages": pages,
+        "pages_per_second": round(pages / seconds, 1) if seconds else None,
+        "input_bytes": input_bytes,
+        "output_bytes": counts.get("output_bytes", 0),
+        "bytes_per_second": round(input_bytes / seconds) if seconds else None,
+        "stages_ms": best["stages_ms"],
+    }
+
+
+def run_suite(corpus, selected, repeat=3, on_result=None):
+    """
+    Run the selected (case, engine) pairs on the corpus.
+    Returns the results document written by benchmark_operations --output.
+    """
+    names = list(dict.fromkeys(name for case, _ in selected for name in case.inputs))
+    results = {}
+
+    with isolated_environment(PDF_RESULT_CACHE=False, PDF_PROFILE_SAMPLE_RATE=0.0):
+        inputs = register_inputs(corpus, names)
+        try:
+            for case, engine in selected:
+                result = run_case(case, engine, inputs, repeat)
+                results[f"{case.name}/{engine}"] = result
+                if on_result is not None:
+                    on_result(result)
+        finally:
+            document_cache.clear()
+            for temp_file in inputs.values():
+                temp_file.delete()
+
+    return {
+        "version": RESULTS_VERSION,
+        "kind": "throughput",
+        "created_at": timezone.now().isoformat(),
+        "environment": environment(),
+        "corpus": corpus_summary(corpus, names),
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold, metric="seconds", noise_floor=NOISE_FLOOR):
+    """
+    Compare the results of a run with a baseline run on one metric.
+    Returns {key: (value, baseline value, relative change, regressed)}
+    for the cases present in both.
+    """
+    comparison = {}
+    for key, result in results["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if base is None or not base.get(metric) or result.get(metric) is None:
+            continue
+        change = result[metric] / base[metric] - 1
+        regressed = change > threshold and result[metric] - base[metric] > noise_floor
+        comparison[key] = (result[metric], base[metric], change, regressed)
+    return comparison
@@ -0,0 +1,174 @@
+"""
+Result cache for PDF operations.
+
+An operation whose inputs have the same contents (SHA-256), with the same
+operation type and parameters as an earlier completed one, is completed
+with the earlier output file instead of being run again. Entries live for
+PDF_RESULT_CACHE_TTL seconds (never past their output file's expiry); the
+least recently used are evicted above PDF_RESULT_CACHE_MAX_ENTRIES.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from file_manager.models import TemporaryFile
+from file_manager.utils import hash_file, share_temporary_file
+
+from .models import OperationCacheCounter, OperationCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+def input_digests(file_ids):
+    """
+    SHA-256 of each input file in order, or None if one is missing or
+    expired (the operation then runs and reports the problem itself)
+    """
+    files = {
+        str(file_id): temp_file
+        for file_id, temp_file in TemporaryFile.objects.in_bulk(file_ids).items()
+    }
+    digests = []
+    for file_id in file_ids:
+        temp_file = files.get(str(file_id))
+        if temp_file is None or temp_file.is_expired:
+            return None
+        if temp_file.blob_id is not None:
+            # Deduplicated files are stored under their digest
+            digests.append(temp_file.blob_id)
+        elif os.path.exists(temp_file.full_file_path):
+            digests.append(hash_file(temp_file.full_file_path))
+        else:
+            return None
+    return digests
+
+
+def normalize_parameters(parameters):
+    """Parameters without unset (None) values, as canonical JSON"""
+    return json.dumps(
+        {name: value for name, value in parameters.items() if value is not None},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+
+
+def cache_key(operation):
+    """Cache key of an operation, or None if its inputs cannot be hashed"""
+    digests = input_digests(operation.input_files)
+    if digests is None:
+        return None
+
+    key = {
+        "operation_type": operation.operation_type,
+        "inputs": digests,
+        "parameters": normalize_parameters(operation.parameters),
+        # Change the output file of split and pdf-to-images
+        "archive_format": settings.PDF_ARCHIVE_FORMAT,
+        "archive_compression": settings.PDF_ARCHIVE_COMPRESSION,
+        "archive_compresslevel": settings.PDF_ARCHIVE_COMPRESSLEVEL,
+    }
+    return hashlib.sha256(
+        json.dumps(key, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def lookup(operation):
+    """
+    Find a cached result for the operation.
+    Returns (key, (output TemporaryFile, result) or None); key is None when
+    the cache is disabled or the operation cannot be cached. The output is
+    a new TemporaryFile sharing the cached one's contents, so each
+    operation can delete its output without affecting the others.
+    """
+    if not settings.PDF_RESULT_CACHE:
+        return None, None
+
+    key = cache_key(operation)
+    if key is None:
+        return None, None
+
+    now = timezone.now()
+    entry = (
+        OperationCacheEntry.objects.select_related("output_file")
+        .filter(key=key, expires_at__gt=now, output_file__expires_at__gt=now)
+        .first()
+    )
+    output_file = None
+    if entry is not None and entry.output_file.file_exists:
+        try:
+            output_file = share_temporary_file(entry.output_file)
+        except OSError as e:
+            logger.warning(f"Could not reuse cache entry {key[:12]}: {str(e)}")
+    if output_file is None:
+        OperationCacheCounter.increment(OperationCacheCounter.MISSES)
+        return key, None
+
+    OperationCacheEntry.objects.filter(key=key).update(
+        hit_count=F("hit_count") + 1, last_used_at=now
+    )
+    OperationCacheCounter.increment(OperationCacheCounter.HITS)
+    logger.info(f"Operation {operation.id} served from cache entry {key[:12]}")
+    return key, (output_file, entry.result)
+
+
+def store(key, operation, output_file, result):
+    """Remember the output of a completed operation and evict old entries"""
+    now = timezone.now()
+    expires_at = min(
+        now + timedelta(seconds=settings.PDF_RESULT_CACHE_TTL), output_file.expires_at
+    )
+    OperationCacheEntry.objects.update_or_create(
+        key=key,
+        defaults={
+            "operation_type": operation.operation_type,
+            "output_file": output_file,
+            "result": result,
+            "hit_count": 0,
+            "last_used_at": now,
+            "expires_at": expires_at,
+        },
+    )
+    evict()
+
+
+def evict():
+    """
+    Drop expired entries, then the least recently used ones above
+    PDF_RESULT_CACHE_MAX_ENTRIES. Returns the number of entries removed.
+    """
+    removed, _ = OperationCacheEntry.objects.filter(
+        expires_at__lte=timezone.now()
+    ).delete()
+
+    excess = OperationCacheEntry.objects.count() - settings.PDF_RESULT_CACHE_MAX_ENTRIES
+    if excess > 0:
+        keys = list(
+            OperationCacheEntry.objects.order_by("last_used_at").values_list(
+                "key", flat=True
+            )[:excess]
+        )
+        removed += OperationCacheEntry.objects.filter(key__in=keys).delete()[0]
+    return removed
+
+
+def get_cache_stats():
+    """Hit/miss totals and current size of the result cache"""
+    totals = OperationCacheCounter.totals()
+    lookups = totals["hits"] + totals["misses"]
+    return {
+        "enabled": settings.PDF_RESULT_CACHE,
+        "hits": totals["hits"],
+        "misses": totals["misses"],
+        "hit_rate": round(totals["hits"] / lookups, 3) if lookups else 0.0,
+        "entries": OperationCacheEntry.objects.filter(
+            expires_at__gt=timezone.now()
+        ).count(),
+        "max_entries": settings.PDF_RESULT_CACHE_MAX_ENTRIES,
+        "ttl_seconds": settings.PDF_RESULT_CACHE_TTL,
+    }
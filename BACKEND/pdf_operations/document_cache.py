@@ -0,0 +1,164 @@
+"""
+Per-process LRU cache of parsed PDF documents.
+
+Consecutive operations on the same upload (split, then pdf-to-images, ...)
+reuse the engine's parsed document instead of opening the file and
+parsing its xref again. Entries are keyed by engine, TemporaryFile id and
+the file's mtime and size, bounded by PDF_DOCUMENT_CACHE_MAX_ENTRIES and
+by PDF_DOCUMENT_CACHE_MAX_BYTES of estimated memory (the file size), and
+dropped when their TemporaryFile is deleted (file_manager's
+temporary_files_deleted signal).
+
+A document is used by one thread at a time; a thread that finds it busy
+opens its own, uncached copy.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .engines import check_not_encrypted
+from .timing import count, stage
+
+
+class CachedDocument:
+    def __init__(self, engine, document, size):
+        self.engine = engine
+        self.document = document
+        self.size = size
+        self.in_use = False
+        self.evicted = False
+
+    def close(self):
+        self.engine.close(self.document)
+
+
+class DocumentCache:
+    def __init__(self, max_entries=None, max_bytes=None):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_entries(self):
+        if self._max_entries is None:
+            return settings.PDF_DOCUMENT_CACHE_MAX_ENTRIES
+        return self._max_entries
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is None:
+            return settings.PDF_DOCUMENT_CACHE_MAX_BYTES
+        return self._max_bytes
+
+    @contextmanager
+    def open(self, engine, temp_file, action=None):
+        """
+        Yield the parsed document of a PDF TemporaryFile for exclusive use.
+        With an action ("merged", ...) encrypted documents raise ValueError.
+        Callers must not leave the document modified.
+        """
+        path = temp_file.full_file_path
+        stat = os.stat(path)
+        key = (engine.name, str(temp_file.id), stat.st_mtime_ns, stat.st_size)
+
+        entry = self._acquire(key)
+        if entry is None:
+            count("parsed_documents")
+            with stage("parse"):
+                document = engine.load(path)
+            entry = self._insert(key, CachedDocument(engine, document, stat.st_size))
+        else:
+            count("cached_documents")
+
+        try:
+            if action is not None:
+                check_not_encrypted(
+                    engine, entry.document, temp_file.original_filename, action
+                )
+            yield entry.document
+        finally:
+            self._release(entry)
+
+    def _acquire(self, key):
+        """The cached entry for key marked in use, None on a miss or if busy"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.in_use:
+                self.misses += 1
+                return None
+            entry.in_use = True
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _insert(self, key, entry):
+        """Add a freshly loaded entry (in use) unless it cannot fit"""
+        entry.in_use = True
+        if not settings.PDF_DOCUMENT_CACHE or entry.size > self.max_bytes:
+            entry.evicted = True
+            return entry
+
+        with self.lock:
+            if key in self.entries:
+                # Another thread cached the same file meanwhile
+                entry.evicted = True
+                return entry
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+            self._trim()
+        return entry
+
+    def _release(self, entry):
+        with self.lock:
+            entry.in_use = False
+            close = entry.evicted
+        if close:
+            entry.close()
+
+    def _trim(self):
+        """Evict least recently used entries beyond the limits (lock held)"""
+        while self.entries and (
+            len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            key = next(iter(self.entries))
+            self._discard(key)
+
+    def _discard(self, key):
+        """Remove an entry; it is closed now, or by its user when released (lock held)"""
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry.size
+        entry.evicted = True
+        if not entry.in_use:
+            entry.close()
+
+    def evict_files(self, file_ids):
+        """Drop every cached document of the given TemporaryFile ids"""
+        file_ids = {str(file_id) for file_id in file_ids}
+        with self.lock:
+            for key in [key for key in self.entries if key[1] in file_ids]:
+                self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self._discard(key)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "estimated_bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+document_cache = DocumentCache()
@@ -0,0 +1,197 @@
+"""
+Stored PDF structure (PDFDocumentInfo).
+
+The info is read with PyMuPDF when a PDF is uploaded (see signals.py)
+and read back by the validators and the split info endpoint, which
+therefore never open the file. Operation outputs, and files uploaded
+before the info existed, get it on first use. Every read runs in one of
+PDF_INSPECT_WORKERS reader processes (inspection.py), with
+PDF_INSPECT_TIMEOUT.
+"""
+
+import logging
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .inspection import ReaderPool
+from .models import PDFDocumentInfo
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_readers = None
+_read_executor = None
+_lock = threading.Lock()
+
+
+def _reader_pool():
+    """The process's reader processes and the threads that wait on them"""
+    global _readers, _read_executor
+    with _lock:
+        if _readers is None:
+            workers = settings.PDF_INSPECT_WORKERS
+            _readers = ReaderPool(workers)
+            _read_executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="pdf-inspect"
+            )
+    return _readers, _read_executor
+
+
+def document_info_fields(temp_file, timeout, deadline=None):
+    """
+    PDFDocumentInfo fields of a PDF temporary file, with error set if
+    unreadable. The file is read by a reader process (inspection.py);
+    TimeoutError is raised if that takes longer than timeout seconds or,
+    with deadline (a time.monotonic() value), if it ends after it.
+    """
+    readers, _ = _reader_pool()
+    wait = None
+    if deadline is not None:
+        wait = max(0.0, deadline - time.monotonic())
+        timeout = min(timeout, wait)
+    try:
+        fields = readers.read(temp_file.full_file_path, timeout, wait)
+        fields["error"] = None
+    except TimeoutError:
+        raise
+    except Exception as e:
+        # MuPDF messages name the storage path, show the file name instead
+        error = str(e).replace(temp_file.full_file_path, temp_file.original_filename)
+        fields = {
+            "page_count": None,
+            "encrypted": False,
+            "pdf_version": "",
+            "pages": [],
+            "metadata": {},
+            "error": error,
+        }
+    return fields
+
+
+def store_document_info(temp_file, fields):
+    info, _ = PDFDocumentInfo.objects.update_or_create(
+        temporary_file=temp_file, defaults=fields
+    )
+    return info
+
+
+def record_document_info(temp_file):
+    """
+    Read and store the info of a PDF temporary file. Returns PDFDocumentInfo;
+    raises TimeoutError after PDF_INSPECT_TIMEOUT seconds, or if no reader
+    becomes free within PDF_INSPECT_DEADLINE.
+    """
+    deadline = time.monotonic() + settings.PDF_INSPECT_DEADLINE
+    fields = document_info_fields(temp_file, settings.PDF_INSPECT_TIMEOUT, deadline)
+    return store_document_info(temp_file, fields)
+
+
+def get_document_info(temp_file):
+    """Stored info of a PDF temporary file, reading it now if it is missing"""
+    return inspect_documents([temp_file])[0]
+
+
+def _record_document_info(temp_file):
+    try:
+        record_document_info(temp_file)
+    except Exception as e:
+        # Left without info, inspect_documents reads it again when needed
+        logger.warning(f"Could not read PDF info of {temp_file.id}: {str(e)}")
+
+
+def _record_in_background(temp_file):
+    try:
+        _record_document_info(temp_file)
+    finally:
+        close_old_connections()
+
+
+def schedule_document_info(temp_file):
+    """
+    Record the info of an uploaded PDF, from the calling thread or, with
+    PDF_DOCUMENT_INFO_IN_BACKGROUND, from a background thread. Either way
+    the thread only waits for a reader process (inspection.py), which
+    does the PyMuPDF work within PDF_INSPECT_TIMEOUT.
+    """
+    global _executor
+    if not settings.PDF_DOCUMENT_INFO_IN_BACKGROUND:
+        _record_document_info(temp_file)
+        return
+
+    if _executor is None:
+        # Uploads are read one at a time, leaving readers free for requests
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-info")
+    _executor.submit(_record_in_background, temp_file)
+
+
+def inspect_documents(temp_files, check=None, timeout=None, deadline=None):
+    """
+    Document info of each PDF temporary file, in order. Stored info is used
+    as is; files without it are read at the same time by the reader
+    processes, each given timeout seconds (PDF_INSPECT_TIMEOUT). Raises
+    ValueError if a read takes longer or if all of them have not finished
+    within deadline seconds (PDF_INSPECT_DEADLINE), waiting for a free
+    reader included.
+
+    check(temp_file, info) may raise to stop at the first hard failure:
+    stored info is checked in order before anything is read, then each
+    file as soon as it has been read.
+    """
+    if timeout is None:
+        timeout = settings.PDF_INSPECT_TIMEOUT
+    if deadline is None:
+        deadline = settings.PDF_INSPECT_DEADLINE
+
+    infos = {}
+    missing = []
+    for temp_file in temp_files:
+        if temp_file.id in infos:
+            continue
+        try:
+            infos[temp_file.id] = temp_file.pdf_info
+        except PDFDocumentInfo.DoesNotExist:
+            missing.append(temp_file)
+            infos[temp_file.id] = None
+            continue
+        if check is not None:
+            check(temp_file, infos[temp_file.id])
+
+    if missing:
+        ends_at = time.monotonic() + deadline
+        _, read_executor = _reader_pool()
+        reads = {
+            read_executor.submit(document_info_fields, temp_file, timeout, ends_at): (
+                temp_file
+            )
+            for temp_file in missing
+        }
+        try:
+            for read in futures.as_completed(
+                reads, timeout=max(0.0, ends_at - time.monotonic())
+            ):
+                temp_file = reads[read]
+                try:
+                    fields = read.result()
+                except TimeoutError:
+                    if time.monotonic() < ends_at:
+                        raise ValueError(
+                            f"Reading PDF {temp_file.original_filename} took longer "
+                            f"than {timeout} seconds"
+                        )
+                    raise futures.TimeoutError()
+                infos[temp_file.id] = store_document_info(temp_file, fields)
+                if check is not None:
+                    check(temp_file, infos[temp_file.id])
+        except futures.TimeoutError:
+            raise ValueError(f"Reading the PDFs took longer than {deadline} seconds")
+        finally:
+            # Reads not started yet are dropped; started ones end within timeout
+            for read in reads:
+                read.cancel()
+
+    return [infos[temp_file.id] for temp_file in temp_files]
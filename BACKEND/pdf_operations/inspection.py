@@ -0,0 +1,191 @@
+"""
+Reading the structure of PDFs (page count, page sizes, encryption,
+metadata) for documents.py.
+
+DocumentReader reads in a child process, one file at a time: PyMuPDF is
+not thread-safe, and a read that runs past its timeout can be stopped by
+killing the process. ReaderPool shares a few of them between the threads
+of a process, so several files are read at once. Like rendering.py, this
+module does not import Django so that the children start quickly.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+
+import fitz  # PyMuPDF
+
+# PyMuPDF metadata key -> name stored in PDFDocumentInfo.metadata
+METADATA_KEYS = {
+    "title": "title",
+    "author": "author",
+    "subject": "subject",
+    "keywords": "keywords",
+    "creator": "creator",
+    "producer": "producer",
+    "creationDate": "creation_date",
+    "modDate": "modification_date",
+}
+
+
+class ReadError(Exception):
+    """The reader process could not read a PDF (message from PyMuPDF)"""
+
+
+def read_document_info(path):
+    """Read the structure of the PDF at path into PDFDocumentInfo fields"""
+    with fitz.open(path, filetype="pdf") as document:
+        metadata = document.metadata or {}
+        info = {
+            "encrypted": bool(document.is_encrypted or metadata.get("encryption")),
+            "pdf_version": (metadata.get("format") or "").replace("PDF ", ""),
+            "metadata": {
+                name: metadata[key]
+                for key, name in METADATA_KEYS.items()
+                if metadata.get(key)
+            },
+            "page_count": None,
+            "pages": [],
+        }
+
+        if not document.needs_pass:
+            info["page_count"] = document.page_count
+            info["pages"] = [
+                [
+                    round(page.cropbox.width, 2),
+                    round(page.cropbox.height, 2),
+                    page.rotation,
+                ]
+                for page in document
+            ]
+
+    return info
+
+
+def _serve(connection):
+    """Reader process: answer each path sent with ("ok", info) or ("error", message)"""
+    # Imports are done, reads can be timed from now on
+    connection.send(("ready", None))
+    while True:
+        try:
+            path = connection.recv()
+        except EOFError:
+            return
+        try:
+            connection.send(("ok", read_document_info(path)))
+        except Exception as e:
+            connection.send(("error", str(e)))
+
+
+class DocumentReader:
+    """
+    A child process reading PDFs for every thread of this process, one
+    file at a time. It is started on first use, and again after a read
+    timed out (the process is killed) or the process died.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.process = None
+        self.connection = None
+        if hasattr(os, "register_at_fork"):
+            # A forked child must start its own reader
+            os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        self.lock = threading.Lock()
+        self.process = None
+        self.connection = None
+
+    def _start(self):
+        # spawn: never fork a process that may be running threads
+        context = multiprocessing.get_context("spawn")
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(child_connection,), name="pdf-reader", daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        try:
+            self.connection.recv()
+        except EOFError:
+            self._stop()
+            raise ReadError("The PDF reader process could not start")
+
+    def _stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.connection.close()
+        self.process = None
+        self.connection = None
+
+    def read(self, path, timeout):
+        """
+        read_document_info(path) in the reader process. Raises TimeoutError
+        if it takes longer than timeout seconds (counted once the read
+        starts) and ReadError if the PDF cannot be read.
+        """
+        with self.lock:
+            if self.process is None or not self.process.is_alive():
+                self._stop()
+                self._start()
+            try:
+                self.connection.send(path)
+                ready = self.connection.poll(timeout)
+                if ready:
+                    status, value = self.connection.recv()
+            except (EOFError, OSError):
+                self._stop()
+                raise ReadError("The PDF reader process stopped unexpectedly")
+            if not ready:
+                self._stop()
+                raise TimeoutError(f"Reading took longer than {timeout} seconds")
+
+        if status == "error":
+            raise ReadError(value)
+        return value
+
+    def close(self):
+        with self.lock:
+            self._stop()
+
+
+class ReaderPool:
+    """
+    size DocumentReaders shared by the threads of this process. A thread
+    borrows a free one for each read and waits for one when all are busy.
+    """
+
+    def __init__(self, size):
+        self.readers = [DocumentReader() for _ in range(max(1, size))]
+        self._forget()
+        if hasattr(os, "register_at_fork"):
+            # Readers forget their processes on their own; the queue's lock
+            # may have been held by another thread
+            os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        self.idle = queue.Queue()
+        for reader in self.readers:
+            self.idle.put(reader)
+
+    def read(self, path, timeout, wait=None):
+        """
+        DocumentReader.read on a free reader, waiting at most wait seconds
+        (None: as long as it takes) for one. Raises TimeoutError if none
+        became free or if reading took longer than timeout seconds.
+        """
+        try:
+            reader = self.idle.get(timeout=wait)
+        except queue.Empty:
+            raise TimeoutError(f"No PDF reader became free within {wait} seconds")
+        try:
+            return reader.read(path, timeout)
+        finally:
+            self.idle.put(reader)
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
@@ -0,0 +1,189 @@
+import logging
+import threading
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from . import cache as result_cache
+from .metrics import OPERATIONS_IN_FLIGHT, record_operation
+from .profiling import profile_operation, should_profile
+from .timing import collect_metrics, stage
+from .utils import (convert_images_to_pdf, convert_pdf_to_images,
+                    merge_pdf_files, rotate_pdf_file, split_pdf_by_pages)
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """The operation was re-claimed by another worker while this one ran it"""
+
+
+# Each runner rebuilds the call from what the view stored on the operation
+# and returns (output TemporaryFile, result details)
+
+
+def run_merge(operation):
+    params = operation.parameters
+    merged_file = merge_pdf_files(operation.input_files, params["output_filename"])
+    return merged_file, {}
+
+
+def run_split(operation):
+    split_result, file_count, is_single_file = split_pdf_by_pages(
+        operation.input_files[0], operation.parameters
+    )
+    return split_result, {
+        "file_count": file_count,
+        "is_single_file": is_single_file,
+        "file_type": "PDF" if is_single_file else settings.PDF_ARCHIVE_FORMAT.upper(),
+    }
+
+
+def run_pdf_to_images(operation):
+    params = operation.parameters
+    pages_range = params.get("pages_range")
+    converted_file = convert_pdf_to_images(
+        file_id=operation.input_files[0],
+        output_format=params["output_format"],
+        quality=params["quality"],
+        dpi=params["dpi"],
+        output_filename=params.get("output_filename"),
+        pages_range=tuple(pages_range) if pages_range else None,
+    )
+    return converted_file, {}
+
+
+def run_images_to_pdf(operation):
+    params = operation.parameters
+    converted_file = convert_images_to_pdf(
+        file_ids=operation.input_files,
+        output_filename=params["output_filename"],
+        page_size=params["page_size"],
+        orientation=params["orientation"],
+    )
+    return converted_file, {}
+
+
+def run_rotate(operation):
+    params = operation.parameters
+    pages = params["pages"]
+    if pages != "all":
+        pages = [int(page) for page in pages.split(",")]
+    rotated_file = rotate_pdf_file(
+        operation.input_files[0],
+        params["rotation_angle"],
+        pages,
+        params["output_filename"],
+    )
+    return rotated_file, {}
+
+
+OPERATION_RUNNERS = {
+    "merge": run_merge,
+    "split": run_split,
+    "convert_to_image": run_pdf_to_images,
+    "convert_from_image": run_images_to_pdf,
+    "rotate": run_rotate,
+}
+
+
+def run_operation(operation):
+    """
+    Run an operation and record its output, reusing the output of an
+    identical earlier operation when the result cache has one. Raises on
+    failure (ValueError for invalid input) and leaves marking the failure
+    to the caller. Raises LeaseLost, after deleting the output, if the
+    operation was re-claimed meanwhile. Returns (output TemporaryFile,
+    result details).
+    """
+    runner = OPERATION_RUNNERS.get(operation.operation_type)
+    if runner is None:
+        raise ValueError(f"Unsupported operation type: {operation.operation_type}")
+
+    # Profiled runs do the work even when the result is cached
+    profiling = should_profile(operation)
+    profiler = profile_operation(operation) if profiling else nullcontext()
+
+    outcome = "failure"
+    in_flight = OPERATIONS_IN_FLIGHT.track_in_progress(
+        operation_type=operation.operation_type
+    )
+    with profiler, in_flight, collect_metrics() as metrics:
+        try:
+            key, cached = None, None
+            if not profiling:
+                with stage("cache_lookup"):
+                    key, cached = result_cache.lookup(operation)
+            if cached is None:
+                output_file, result = runner(operation)
+            outcome = "success" if cached is None else "cached"
+        finally:
+            # Saved with the operation, also by the caller's mark_as_failed
+            operation.metrics = metrics.as_dict()
+            record_operation(operation, outcome)
+
+    if cached is not None:
+        output_file, result = cached
+        result = {**result, "cached": True}
+
+    if not operation.mark_as_completed(str(output_file.id), result):
+        # The new owner's run produces its own output
+        output_file.delete()
+        raise LeaseLost(f"Operation {operation.id} was taken over by another worker")
+
+    if key is not None and cached is None:
+        try:
+            result_cache.store(key, operation, output_file, result)
+        except Exception as e:
+            logger.warning(f"Could not cache operation {operation.id}: {str(e)}")
+    return output_file, result
+
+
+class LeaseKeeper(threading.Thread):
+    """Extend a claimed operation's lease every lease_seconds / 3"""
+
+    def __init__(self, operation, lease_seconds):
+        super().__init__(daemon=True)
+        self.operation = operation
+        self.lease_seconds = lease_seconds
+        self.finished = threading.Event()
+
+    def run(self):
+        from django.db import connection
+
+        try:
+            while not self.finished.wait(self.lease_seconds / 3):
+                if not self.operation.extend_lease(self.lease_seconds):
+                    logger.warning(
+                        f"Lost the lease on operation {self.operation.id}"
+                    )
+                    return
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+def execute_operation(operation, lease_seconds):
+    """
+    Run an operation claimed by a background worker, keeping its lease
+    alive meanwhile. Failures are recorded on the operation, not raised.
+    Returns True if it completed.
+    """
+    keeper = LeaseKeeper(operation, lease_seconds)
+    keeper.start()
+    try:
+        run_operation(operation)
+        return True
+    except LeaseLost as e:
+        logger.warning(str(e))
+        return False
+    except Exception as e:
+        logger.error(f"Operation {operation.id} failed: {str(e)}")
+        if not operation.mark_as_failed(str(e)):
+            logger.warning(f"Operation {operation.id} was taken over, failure dropped")
+        return False
+    finally:
+        keeper.stop()
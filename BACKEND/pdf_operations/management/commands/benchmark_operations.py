@@ -0,0 +1,201 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from pdf_operations.benchmarks import memory
+from pdf_operations.benchmarks.corpus import build_corpus
+from pdf_operations.benchmarks.suite import (NOISE_FLOOR, compare, run_suite,
+                                             select_cases)
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every PDF operation with every engine on a synthetic corpus "
+        "(or measure its peak memory with --memory), optionally comparing "
+        "with a baseline results file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--memory",
+            action="store_true",
+            help="Measure peak RSS and Python heap on growing inputs instead of time",
+        )
+        parser.add_argument(
+            "--corpus-dir",
+            help="Keep the generated corpus here and reuse it (default: temporary)",
+        )
+        parser.add_argument(
+            "--quick",
+            action="store_true",
+            help="Smaller corpus (120 instead of 1200 pages...) for a fast check",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Runs per case, the fastest is reported (default: 3)",
+        )
+        parser.add_argument(
+            "--case",
+            action="append",
+            dest="cases",
+            help="Only cases whose name/engine contains this (repeatable)",
+        )
+        parser.add_argument(
+            "--engine",
+            action="append",
+            dest="engines",
+            help="Only this engine: pypdf2, pymupdf, pillow (repeatable)",
+        )
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument(
+            "--baseline", help="Results file of an earlier run to compare with"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.15,
+            help="Slowdown or memory growth flagged as a regression (default: 0.15, i.e. 15%%)",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline: {e}")
+
+        if options["memory"]:
+            selected = memory.select_series(options["cases"], options["engines"])
+            names = {
+                name
+                for series, _ in selected
+                for case in series.cases
+                for name in case.inputs
+            }
+        else:
+            selected = select_cases(options["cases"], options["engines"])
+            names = {name for case, _ in selected for name in case.inputs}
+        if not selected:
+            raise CommandError("No benchmark case matches")
+
+        with tempfile.TemporaryDirectory() as scratch:
+            corpus_dir = options["corpus_dir"] or scratch
+            self.stdout.write(f"Generating corpus in {corpus_dir}...")
+            corpus = build_corpus(corpus_dir, quick=options["quick"], names=names)
+
+            if options["memory"]:
+                self.stdout.write(
+                    f"{'case':<48} {'units':>9} {'RSS MB':>8} {'heap MB':>8} "
+                    f"{'RSS/unit':>14} {'heap/unit':>14}"
+                )
+                results = memory.run_memory_suite(
+                    corpus, selected, on_result=self.report_memory
+                )
+                self.report_scaling(results["scaling"])
+            else:
+                self.stdout.write(
+                    f"{'case':<48} {'seconds':>9} {'pages/s':>9} {'MB/s':>8}"
+                )
+                results = run_suite(
+                    corpus, selected, repeat=options["repeat"], on_result=self.report
+                )
+
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            if baseline.get("kind") != results.get("kind"):
+                raise CommandError("The baseline is not from the same kind of run")
+            if options["memory"]:
+                metrics = [
+                    ("peak_rss_bytes", memory.NOISE_FLOOR, self.megabytes),
+                    ("peak_heap_bytes", memory.NOISE_FLOOR, self.megabytes),
+                ]
+            else:
+                metrics = [("seconds", NOISE_FLOOR, lambda seconds: f"{seconds:.3f}s")]
+            self.compare(results, baseline, options["threshold"], metrics)
+
+    def report(self, result):
+        key = f"{result['case']}/{result['engine']}"
+        pages_per_second = result["pages_per_second"] or 0
+        megabytes_per_second = (result["bytes_per_second"] or 0) / MB
+        self.stdout.write(
+            f"{key:<48} {result['seconds']:>9.3f} {pages_per_second:>9.1f} "
+            f"{megabytes_per_second:>8.1f}"
+        )
+
+    def report_memory(self, result):
+        key = f"{result['case']}/{result['engine']}"
+        if "error" in result:
+            self.stdout.write(self.style.ERROR(f"{key:<48} {result['error']}"))
+            return
+        per_unit = f"/{result['unit']}"
+        self.stdout.write(
+            f"{key:<48} {result['units']:>9g} "
+            f"{(result['peak_rss_bytes'] or 0) / MB:>8.1f} "
+            f"{result['peak_heap_bytes'] / MB:>8.1f} "
+            f"{self.kilobytes(result['rss_per_unit']) + per_unit:>14} "
+            f"{self.kilobytes(result['heap_per_unit']) + per_unit:>14}"
+        )
+
+    def report_scaling(self, scaling):
+        self.stdout.write(self.style.MIGRATE_HEADING("Memory scaling (least squares)"))
+        for key, fit in scaling.items():
+            if fit["rss_per_unit"] is None and fit["heap_per_unit"] is None:
+                self.stdout.write(f"  {key:<46} not enough points")
+                continue
+            unit = fit["unit"]
+            self.stdout.write(
+                f"  {key:<46} RSS {self.kilobytes(fit['rss_per_unit'])}/{unit} "
+                f"+ {self.megabytes(fit['rss_fixed_bytes'])}, "
+                f"heap {self.kilobytes(fit['heap_per_unit'])}/{unit} "
+                f"+ {self.megabytes(fit['heap_fixed_bytes'])}"
+            )
+
+    @staticmethod
+    def kilobytes(value):
+        return "-" if value is None else f"{value / 1024:.1f}KB"
+
+    @staticmethod
+    def megabytes(value):
+        return "-" if value is None else f"{value / MB:.1f}MB"
+
+    def compare(self, results, baseline, threshold, metrics):
+        self.stdout.write(self.style.MIGRATE_HEADING("Compared with the baseline"))
+
+        regressions = []
+        for metric, noise_floor, display in metrics:
+            comparison = compare(results, baseline, threshold, metric, noise_floor)
+
+            for key, (value, base_value, change, regressed) in comparison.items():
+                line = (
+                    f"  {key:<46} {display(base_value):>9} -> {display(value):>9}  "
+                    f"{change:+7.1%}"
+                )
+                if len(metrics) > 1:
+                    line += f"  {metric}"
+                if regressed:
+                    regressions.append(key)
+                    self.stdout.write(self.style.ERROR(f"{line}  REGRESSION"))
+                elif change < -threshold:
+                    self.stdout.write(self.style.SUCCESS(f"{line}  better"))
+                else:
+                    self.stdout.write(line)
+
+        missing = set(results["results"]) - set(baseline.get("results", {}))
+        for key in sorted(missing):
+            self.stdout.write(f"  {key:<46} not in the baseline")
+
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} case(s) worse than the baseline by more "
+                f"than {threshold:.0%}: {', '.join(dict.fromkeys(regressions))}"
+            )
@@ -0,0 +1,128 @@
+import io
+import os
+import tempfile
+import time
+from contextlib import ExitStack
+
+import fitz  # PyMuPDF
+from django.core.management.base import BaseCommand
+from pdf_operations.engines import ENGINES
+
+
+def make_document(path, page_count, label):
+    """Write a synthetic PDF with some text and vector content on each page"""
+    with fitz.open() as document:
+        for page_num in range(page_count):
+            page = document.new_page()
+            page.insert_text((72, 72), f"{label} page {page_num + 1}", fontsize=14)
+            for line in range(30):
+                page.insert_text(
+                    (72, 100 + line * 20), f"Line {line} of page {page_num + 1}"
+                )
+            page.draw_rect(fitz.Rect(300, 600, 500, 750), color=(0, 0, 1), fill=(1, 0, 0))
+        document.save(path)
+
+
+def describe(data):
+    """(rotation, text) of every page of a PDF, used to compare engine outputs"""
+    with fitz.open(stream=data, filetype="pdf") as document:
+        return [(page.rotation, page.get_text().strip()) for page in document]
+
+
+class Command(BaseCommand):
+    help = "Time merge, split and rotate with every PDF engine and check their outputs match"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--files", type=int, default=4, help="Documents to merge (default: 4)"
+        )
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=250,
+            help="Pages per document (default: 250)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Runs per measurement, the best is reported (default: 3)",
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for index in range(options["files"]):
+                path = os.path.join(directory, f"document_{index}.pdf")
+                make_document(path, options["pages"], f"Document {index}")
+                paths.append(path)
+
+            self.stdout.write(
+                f"{options['files']} documents of {options['pages']} pages\n"
+            )
+
+            results = {}
+            for name, engine in ENGINES.items():
+                results[name] = self.run_engine(engine, paths, options["repeat"])
+
+        self.report(results)
+
+    def run_engine(self, engine, paths, repeat):
+        """Return {case: (best seconds, output description)}"""
+        cases = {
+            "merge": lambda documents, stream: engine.merge(documents, stream),
+            "split (every page)": lambda documents, stream: self.split_pages(
+                engine, documents[0], stream
+            ),
+            "rotate (all pages)": lambda documents, stream: engine.rotate(
+                documents[0],
+                90,
+                range(engine.page_count(documents[0])),
+                stream,
+            ),
+        }
+
+        measurements = {}
+        for case, run in cases.items():
+            best = None
+            for _ in range(repeat):
+                with ExitStack() as stack:
+                    start = time.perf_counter()
+                    documents = [
+                        stack.enter_context(
+                            engine.open_document(path, os.path.basename(path), "read")
+                        )
+                        for path in paths
+                    ]
+                    stream = io.BytesIO()
+                    outputs = run(documents, stream)
+                    elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            if outputs is None:
+                outputs = [stream.getvalue()]
+            measurements[case] = (best, [describe(data) for data in outputs])
+        return measurements
+
+    def split_pages(self, engine, document, stream):
+        """Split into one PDF per page, returning the parts"""
+        parts = []
+        for page_num in range(engine.page_count(document)):
+            part = io.BytesIO()
+            engine.extract_pages(document, range(page_num, page_num + 1), part)
+            parts.append(part.getvalue())
+        return parts
+
+    def report(self, results):
+        baseline = results["pypdf2"]
+        for case in baseline:
+            self.stdout.write(self.style.MIGRATE_HEADING(case))
+            for name, measurements in results.items():
+                elapsed, outputs = measurements[case]
+                speedup = baseline[case][0] / elapsed if elapsed else 0
+                same = outputs == baseline[case][1]
+                line = f"  {name:<8} {elapsed:8.3f}s  x{speedup:5.1f}"
+                if same:
+                    self.stdout.write(f"{line}  output matches pypdf2")
+                else:
+                    self.stdout.write(self.style.ERROR(f"{line}  OUTPUT DIFFERS"))
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pdf_operations.workers import WorkerPool
+
+
+class Command(BaseCommand):
+    help = "Run a pool of worker processes for queued (async) PDF operations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.PDF_WORKER_CONCURRENCY,
+            help="Number of worker processes (default: PDF_WORKER_CONCURRENCY)",
+        )
+
+        parser.add_argument(
+            "--lease-timeout",
+            type=int,
+            default=settings.PDF_WORKER_LEASE_SECONDS,
+            help="Seconds before an operation of an unresponsive worker is retried",
+        )
+
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.PDF_WORKER_POLL_INTERVAL,
+            help="Seconds an idle worker waits before looking for work again",
+        )
+
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=settings.PDF_WORKER_MAX_ATTEMPTS,
+            help="Times an operation is tried before it is marked as failed",
+        )
+
+        parser.add_argument(
+            "--render-workers",
+            type=int,
+            default=1,
+            help="Render processes of each worker for PDF to images (PDF_RENDER_WORKERS)",
+        )
+
+        parser.add_argument(
+            "--shutdown-timeout",
+            type=int,
+            default=60,
+            help="Seconds to wait for running operations on SIGINT/SIGTERM",
+        )
+
+    def handle(self, *args, **options):
+        pool = WorkerPool(
+            concurrency=options["concurrency"],
+            options={
+                "lease_seconds": options["lease_timeout"],
+                "poll_interval": options["poll_interval"],
+                "max_attempts": options["max_attempts"],
+                "render_workers": options["render_workers"],
+            },
+            shutdown_timeout=options["shutdown_timeout"],
+        )
+        pool.run(on_event=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS("All workers stopped"))
@@ -0,0 +1,47 @@
+from ilovepdf_clone.metrics import Counter, Gauge, Histogram
+
+OPERATION_REQUESTS = Counter(
+    "pdf_operation_requests_total", "PDF operations requested", ["operation_type"]
+)
+OPERATIONS = Counter(
+    "pdf_operations_total",
+    "PDF operations run, by outcome (success, cached, failure)",
+    ["operation_type", "outcome"],
+)
+OPERATION_DURATION = Histogram(
+    "pdf_operation_duration_seconds", "Time to run a PDF operation", ["operation_type"]
+)
+OPERATION_INPUT_BYTES = Counter(
+    "pdf_operation_input_bytes_total", "Bytes read by PDF operations", ["operation_type"]
+)
+OPERATION_OUTPUT_BYTES = Counter(
+    "pdf_operation_output_bytes_total",
+    "Bytes written by PDF operations",
+    ["operation_type"],
+)
+OPERATION_PAGES = Counter(
+    "pdf_operation_pages_total",
+    "Pages produced by PDF operations (merged, split, rotated, rendered)",
+    ["operation_type"],
+)
+OPERATIONS_IN_FLIGHT = Gauge(
+    "pdf_operations_in_flight", "PDF operations running now", ["operation_type"]
+)
+
+
+def record_operation(operation, outcome):
+    """Add a finished run to the metrics, from its stage metrics (timing.py)"""
+    operation_type = operation.operation_type
+    metrics = operation.metrics
+    counts = metrics.get("counts", {})
+
+    OPERATIONS.inc(operation_type=operation_type, outcome=outcome)
+    OPERATION_DURATION.observe(
+        metrics.get("total_ms", 0) / 1000, operation_type=operation_type
+    )
+    if counts.get("input_bytes"):
+        OPERATION_INPUT_BYTES.inc(counts["input_bytes"], operation_type=operation_type)
+    if counts.get("output_bytes"):
+        OPERATION_OUTPUT_BYTES.inc(counts["output_bytes"], operation_type=operation_type)
+    if counts.get("output_pages"):
+        OPERATION_PAGES.inc(counts["output_pages"], operation_type=operation_type)
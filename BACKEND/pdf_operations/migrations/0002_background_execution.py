@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf_operations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfoperation',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfoperation',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pdfoperation',
+            name='result',
+            field=models.JSONField(blank=True, default=dict, help_text='Operation-specific output details'),
+        ),
+        migrations.AddField(
+            model_name='pdfoperation',
+            name='worker_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='pdfoperation',
+            index=models.Index(fields=['status', 'created_at'], name='pdf_ops_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_manager', '0006_temporaryfile_file_present'),
+        ('pdf_operations', '0002_background_execution'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperationCacheCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'pdf_operation_cache_counters',
+            },
+        ),
+        migrations.CreateModel(
+            name='OperationCacheEntry',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('operation_type', models.CharField(choices=[('merge', 'Merge PDFs'), ('split', 'Split PDF'), ('compress', 'Compress PDF'), ('convert_to_image', 'Convert PDF to Image'), ('convert_from_image', 'Convert Image to PDF'), ('rotate', 'Rotate PDF'), ('protect', 'Protect PDF'), ('unlock', 'Unlock PDF')], max_length=20)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('output_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cache_entries', to='file_manager.temporaryfile')),
+            ],
+            options={
+                'db_table': 'pdf_operation_cache',
+            },
+        ),
+    ]
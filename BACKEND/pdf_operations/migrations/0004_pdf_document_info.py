@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_manager', '0006_temporaryfile_file_present'),
+        ('pdf_operations', '0003_operation_result_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PDFDocumentInfo',
+            fields=[
+                ('temporary_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pdf_info', serialize=False, to='file_manager.temporaryfile')),
+                ('page_count', models.PositiveIntegerField(blank=True, help_text='None when the PDF needs a password', null=True)),
+                ('encrypted', models.BooleanField(default=False)),
+                ('pdf_version', models.CharField(blank=True, max_length=20)),
+                ('pages', models.JSONField(blank=True, default=list, help_text='[width, height, rotation] of each page')),
+                ('metadata', models.JSONField(blank=True, default=dict, help_text='Document Info dictionary')),
+                ('error', models.TextField(blank=True, help_text='Why the PDF could not be read', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'pdf_document_info',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf_operations', '0004_pdf_document_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfoperation',
+            name='metrics',
+            field=models.JSONField(blank=True, default=dict, help_text='Time per stage, byte and page counts of the last run (see timing.py)'),
+        ),
+    ]
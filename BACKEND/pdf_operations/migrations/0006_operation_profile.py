@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf_operations', '0005_operation_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfoperation',
+            name='profile',
+            field=models.BooleanField(default=False, help_text='Profile the next run'),
+        ),
+        migrations.AddField(
+            model_name='pdfoperation',
+            name='profile_file',
+            field=models.CharField(blank=True, help_text='Profile archive file UUID', max_length=100, null=True),
+        ),
+    ]
@@ -2,6 +2,7 @@ import uuid
 from datetime import timedelta
 
 from django.db import models
+from django.db.models import F, Q
 from django.utils import timezone
 
 
@@ -41,6 +42,25 @@ class PDFOperation(models.Model):
         default=dict, help_text="Operation-specific parameters"
     )
     error_message = models.TextField(blank=True, null=True)
+    result = models.JSONField(
+        default=dict, blank=True, help_text="Operation-specific output details"
+    )
+    metrics = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Time per stage, byte and page counts of the last run (see timing.py)",
+    )
+
+    # Profiling (see profiling.py)
+    profile = models.BooleanField(default=False, help_text="Profile the next run")
+    profile_file = models.CharField(
+        max_length=100, blank=True, null=True, help_text="Profile archive file UUID"
+    )
+
+    # Background execution (see jobs.py and the run_operation_workers command)
+    worker_id = models.CharField(max_length=100, blank=True, null=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -53,6 +73,10 @@ class PDFOperation(models.Model):
     class Meta:
         db_table = "pdf_operations"
         ordering = ["-created_at"]
+        indexes = [
+            # Queue scans: pending and lease-expired operations, oldest first
+            models.Index(fields=["status", "created_at"], name="pdf_ops_queue_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.expires_at:
@@ -75,17 +99,190 @@ class PDFOperation(models.Model):
         self.started_at = timezone.now()
         self.save()
 
-    def mark_as_completed(self, output_file_uuid):
-        self.status = "completed"
-        self.completed_at = timezone.now()
-        self.output_file = output_file_uuid
-        self.save()
+    def mark_as_completed(self, output_file_uuid, result=None):
+        """Returns False if the run no longer owns the operation (see finish)"""
+        return self.finish(
+            status="completed", output_file=output_file_uuid, result=result or {}
+        )
 
     def mark_as_failed(self, error_message):
-        self.status = "failed"
-        self.completed_at = timezone.now()
-        self.error_message = error_message
-        self.save()
+        """Returns False if the run no longer owns the operation (see finish)"""
+        return self.finish(status="failed", error_message=error_message)
+
+    def finish(self, **fields):
+        """
+        Record the end of this run with a conditional UPDATE, like
+        extend_lease: only while the operation is still processing under
+        our worker_id. A worker whose lease expired and was re-claimed must
+        not overwrite the new run, so nothing is written then and False is
+        returned.
+        """
+        fields.update(
+            completed_at=timezone.now(),
+            lease_expires_at=None,
+            # Set on the instance during the run
+            metrics=self.metrics,
+            profile_file=self.profile_file,
+        )
+        finished = PDFOperation.objects.filter(
+            id=self.id, status="processing", worker_id=self.worker_id
+        ).update(**fields)
+        if not finished:
+            return False
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+    @classmethod
+    def claimable(cls, now, max_attempts):
+        """Pending operations, and processing ones whose worker lease ran out"""
+        return cls.objects.filter(
+            Q(status="pending") | Q(status="processing", lease_expires_at__lt=now),
+            attempts__lt=max_attempts,
+        )
+
+    @classmethod
+    def claim_next(cls, worker_id, lease_seconds, max_attempts):
+        """
+        Atomically take the oldest claimable operation for worker_id. The
+        claim is a conditional UPDATE, so two workers racing for the same
+        row cannot both win. Returns the operation or None.
+        """
+        now = timezone.now()
+        candidates = list(
+            cls.claimable(now, max_attempts)
+            .order_by("created_at")
+            .values_list("id", flat=True)[:10]
+        )
+        for operation_id in candidates:
+            claimed = (
+                cls.claimable(now, max_attempts)
+                .filter(id=operation_id)
+                .update(
+                    status="processing",
+                    worker_id=worker_id,
+                    started_at=now,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    attempts=F("attempts") + 1,
+                )
+            )
+            if claimed:
+                return cls.objects.get(id=operation_id)
+        return None
+
+    def extend_lease(self, lease_seconds):
+        """Push the lease forward while this worker still owns the operation"""
+        return (
+            PDFOperation.objects.filter(
+                id=self.id, status="processing", worker_id=self.worker_id
+            ).update(lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds))
+            > 0
+        )
+
+    @classmethod
+    def fail_abandoned(cls, max_attempts):
+        """Fail operations whose workers died on every allowed attempt"""
+        return cls.objects.filter(
+            status="processing",
+            lease_expires_at__lt=timezone.now(),
+            attempts__gte=max_attempts,
+        ).update(
+            status="failed",
+            completed_at=timezone.now(),
+            lease_expires_at=None,
+            error_message="Operation was abandoned by its worker too many times",
+        )
 
     def __str__(self):
         return f"{self.get_operation_type_display()} - {self.status} ({self.id})"
+
+
+class OperationCacheEntry(models.Model):
+    """
+    Output of a completed operation, reused by later operations with the
+    same input contents, operation type and parameters (see cache.py)
+    """
+
+    key = models.CharField(max_length=64, primary_key=True)
+    operation_type = models.CharField(
+        max_length=20, choices=PDFOperation.OPERATION_TYPES
+    )
+    output_file = models.ForeignKey(
+        "file_manager.TemporaryFile",
+        on_delete=models.CASCADE,
+        related_name="cache_entries",
+    )
+    result = models.JSONField(default=dict, blank=True)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = "pdf_operation_cache"
+
+    def __str__(self):
+        return f"{self.operation_type} {self.key[:12]} ({self.hit_count} hits)"
+
+
+class OperationCacheCounter(models.Model):
+    """Hit and miss totals of the operation result cache"""
+
+    HITS = "hits"
+    MISSES = "misses"
+
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "pdf_operation_cache_counters"
+
+    @classmethod
+    def increment(cls, name):
+        if not cls.objects.filter(name=name).update(value=F("value") + 1):
+            cls.objects.get_or_create(name=name)
+            cls.objects.filter(name=name).update(value=F("value") + 1)
+
+    @classmethod
+    def totals(cls):
+        values = dict(cls.objects.values_list("name", "value"))
+        return {name: values.get(name, 0) for name in (cls.HITS, cls.MISSES)}
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class PDFDocumentInfo(models.Model):
+    """
+    Structure of a PDF temporary file (pages, encryption, metadata), read
+    once when the file is uploaded or produced so validators do not parse
+    the PDF again (see documents.py)
+    """
+
+    temporary_file = models.OneToOneField(
+        "file_manager.TemporaryFile",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="pdf_info",
+    )
+    page_count = models.PositiveIntegerField(
+        blank=True, null=True, help_text="None when the PDF needs a password"
+    )
+    encrypted = models.BooleanField(default=False)
+    pdf_version = models.CharField(max_length=20, blank=True)
+    pages = models.JSONField(
+        default=list, blank=True, help_text="[width, height, rotation] of each page"
+    )
+    metadata = models.JSONField(
+        default=dict, blank=True, help_text="Document Info dictionary"
+    )
+    error = models.TextField(
+        blank=True, null=True, help_text="Why the PDF could not be read"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "pdf_document_info"
+
+    def __str__(self):
+        return f"{self.temporary_file_id}: {self.page_count} pages"
@@ -0,0 +1,123 @@
+"""
+Opt-in profiling of PDF operations.
+
+An operation is profiled when the request asks for it (staff users only,
+see views._wants_profile) or, with PDF_PROFILE_SAMPLE_RATE, at random.
+The run is wrapped in cProfile and in a thread sampling the operation's
+call stack every PDF_PROFILE_SAMPLE_INTERVAL seconds. The results are
+stored as an archive attached to the operation (PDFOperation.profile_file):
+
+    profile.pstats     cProfile data (python -m pstats, snakeviz...)
+    profile.collapsed  sampled stacks, one "a;b;c count" line per stack
+                       (flamegraph.pl, speedscope, inferno)
+    profile.txt        functions by cumulative time
+
+Operations that are not profiled are not wrapped at all.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from file_manager.utils import open_download_file
+
+from .archives import archive_filename, create_archive
+
+logger = logging.getLogger(__name__)
+
+
+def should_profile(operation):
+    """
+    Whether to profile this run: requested, or picked by the sample rate.
+    A sampled run is not recorded as requested (operation.profile), so a
+    retry draws again.
+    """
+    if operation.profile:
+        return True
+    rate = settings.PDF_PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+class StackSampler(threading.Thread):
+    """Count the call stacks of one thread, sampled every interval seconds"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                # co_qualname (Class.method) is only there from Python 3.11
+                name = getattr(code, "co_qualname", code.co_name)
+                names.append(f"{module}.{name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def save_profile(operation, profiler, sampler):
+    """Store the profile archive and attach it to the operation (not saved yet)"""
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(settings.PDF_PROFILE_TOP)
+
+    # pstats only dumps to a path
+    fd, stats_path = tempfile.mkstemp(dir=settings.FILE_UPLOAD_TEMP_DIR, suffix=".pstats")
+    try:
+        os.close(fd)
+        stats.dump_stats(stats_path)
+        with open(stats_path, "rb") as stats_file:
+            stats_data = stats_file.read()
+    finally:
+        os.remove(stats_path)
+
+    with open_download_file(archive_filename(f"profile_{operation.id}.zip")) as output:
+        with create_archive(output.file) as archive:
+            archive.add("profile.pstats", stats_data)
+            archive.add("profile.collapsed", sampler.collapsed().encode("utf-8"))
+            archive.add("profile.txt", summary.getvalue().encode("utf-8"))
+
+    operation.profile_file = str(output.temp_file.id)
+    return output.temp_file
+
+
+@contextmanager
+def profile_operation(operation):
+    """Profile the block and attach the profile to operation, even if it fails"""
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), settings.PDF_PROFILE_SAMPLE_INTERVAL)
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        try:
+            save_profile(operation, profiler, sampler)
+        except Exception as e:
+            logger.warning(f"Could not save profile of {operation.id}: {str(e)}")
@@ -0,0 +1,182 @@
+"""
+Page rasterisation for convert_pdf_to_images.
+
+This module does not import Django so that the worker processes of the
+render pool start quickly and never touch the database.
+"""
+
+import io
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Output format -> file extension
+IMAGE_EXTENSIONS = {
+    "JPEG": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+    "TIFF": "tiff",
+}
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def page_filename(page_num, output_format):
+    """Name of the archive entry for a 0-indexed page"""
+    return f"page_{page_num + 1:03d}.{IMAGE_EXTENSIONS[output_format]}"
+
+
+def render_page(document, page_num, output_format, quality, dpi):
+    """
+    Render one page of an open fitz document and return the encoded image.
+
+    PNG is encoded by MuPDF straight from the pixmap; the other formats
+    wrap the pixmap samples as a PIL image without copying them. The
+    page is rendered without alpha since the outputs are opaque, and the
+    pixmap is released as soon as the page is encoded.
+    """
+    page = document[page_num]
+
+    mat = fitz.Matrix(dpi / 72, dpi / 72)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+
+    try:
+        if output_format == "PNG":
+            return pix.tobytes("png")
+
+        mode = "L" if pix.n == 1 else "RGB"
+        image = Image.frombuffer(
+            mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1
+        )
+        img_buffer = io.BytesIO()
+        if output_format == "JPEG":
+            image.save(img_buffer, format="JPEG", quality=quality, optimize=True)
+        elif output_format == "WEBP":
+            image.save(img_buffer, format="WEBP", quality=quality)
+        else:
+            image.save(img_buffer, format="TIFF")
+        return img_buffer.getvalue()
+    finally:
+        # The PIL image only borrows the samples, drop both right away
+        image = None
+        pix = None
+
+
+def render_page_range(path, start_page, end_page, output_format, quality, dpi):
+    """
+    Open the document once and render pages [start_page, end_page).
+    Runs in a pool worker; returns a list of (page_num, image bytes).
+    """
+    with fitz.open(path) as document:
+        return [
+            (page_num, render_page(document, page_num, output_format, quality, dpi))
+            for page_num in range(start_page, end_page)
+        ]
+
+
+def get_render_pool(workers):
+    """
+    Process pool shared by all conversions of this process, created on
+    first use (and again if a worker crashed and broke it)
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: never fork a process that may be running threads
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def renders_serially(page_count, workers):
+    """Whether iter_rendered_pages renders in the calling process"""
+    return workers <= 1 or page_count <= 1
+
+
+def iter_rendered_pages(
+    path,
+    start_page,
+    end_page,
+    output_format,
+    quality,
+    dpi,
+    workers=1,
+    chunk_size=4,
+    document=None,
+):
+    """
+    Yield (page_num, image bytes) for pages [start_page, end_page) in page
+    order. With more than one worker and more than one page, ranges of
+    chunk_size pages are rendered in parallel on the render pool; at most
+    2 * workers ranges are in flight so finished pages do not pile up in
+    memory while the consumer writes them out. An already open PyMuPDF
+    document of path is used for serial rendering instead of opening it.
+    """
+    if output_format not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+    page_count = end_page - start_page
+    if renders_serially(page_count, workers):
+        # Serial fast path: no inter-process overhead
+        if document is not None:
+            for page_num in range(start_page, end_page):
+                yield page_num, render_page(
+                    document, page_num, output_format, quality, dpi
+                )
+            return
+        with fitz.open(path) as document:
+            for page_num in range(start_page, end_page):
+                yield page_num, render_page(
+                    document, page_num, output_format, quality, dpi
+                )
+        return
+
+    chunk_size = max(1, min(chunk_size, -(-page_count // workers)))
+    chunks = deque(
+        (chunk_start, min(chunk_start + chunk_size, end_page))
+        for chunk_start in range(start_page, end_page, chunk_size)
+    )
+    pool = get_render_pool(workers)
+    in_flight = deque()
+
+    try:
+        while chunks or in_flight:
+            while chunks and len(in_flight) < 2 * workers:
+                chunk_start, chunk_end = chunks.popleft()
+                in_flight.append(
+                    pool.submit(
+                        render_page_range,
+                        path,
+                        chunk_start,
+                        chunk_end,
+                        output_format,
+                        quality,
+                        dpi,
+                    )
+                )
+            yield from in_flight.popleft().result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        for future in in_flight:
+            future.cancel()
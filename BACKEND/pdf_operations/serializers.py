@@ -16,7 +16,12 @@ class PDFOperationSerializer(serializers.ModelSerializer):
             "input_files",
             "output_file",
             "parameters",
+            "result",
+            "metrics",
+            "profile",
+            "profile_file",
             "error_message",
+            "attempts",
             "created_at",
             "started_at",
             "completed_at",
@@ -28,7 +33,12 @@ class PDFOperationSerializer(serializers.ModelSerializer):
             "id",
             "status",
             "output_file",
+            "result",
+            "metrics",
+            "profile",
+            "profile_file",
             "error_message",
+            "attempts",
             "created_at",
             "started_at",
             "completed_at",
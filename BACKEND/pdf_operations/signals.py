@@ -0,0 +1,32 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from file_manager.signals import (temporary_file_uploaded,
+                                  temporary_files_deleted)
+
+from .document_cache import document_cache
+from .documents import schedule_document_info
+from .metrics import OPERATION_REQUESTS
+from .models import PDFOperation
+
+
+@receiver(temporary_file_uploaded)
+def record_pdf_info(sender, temp_file, **kwargs):
+    """
+    Read the structure of every uploaded PDF once its row is committed.
+    Operation outputs are read only if they are used as inputs.
+    """
+    if temp_file.mime_type == "application/pdf":
+        transaction.on_commit(lambda: schedule_document_info(temp_file))
+
+
+@receiver(temporary_files_deleted)
+def evict_cached_documents(sender, file_ids, **kwargs):
+    """Close the parsed documents of deleted files"""
+    document_cache.evict_files(file_ids)
+
+
+@receiver(post_save, sender=PDFOperation)
+def count_operation_request(sender, instance, created, **kwargs):
+    if created:
+        OPERATION_REQUESTS.inc(operation_type=instance.operation_type)
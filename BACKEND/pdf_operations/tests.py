@@ -1,3 +1,416 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from file_manager.models import TemporaryFile
+from file_manager.utils import create_download_file
+
+from . import cache, jobs
+from .archives import ArchiveBuilder
+from .models import OperationCacheEntry, PDFOperation
+
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+
+class OperationQueueTests(TestCase):
+    """Claiming, lease expiry and finishing of background operations"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            FILE_UPLOAD_TEMP_DIR=f"{self.media_root}/tmp",
+            PDF_RESULT_CACHE=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_operation(self, **fields):
+        return PDFOperation.objects.create(
+            operation_type="rotate",
+            status="pending",
+            input_files=[],
+            parameters={},
+            **fields,
+        )
+
+    def claim(self, worker_id):
+        return PDFOperation.claim_next(worker_id, LEASE_SECONDS, MAX_ATTEMPTS)
+
+    def expire_lease(self, operation):
+        PDFOperation.objects.filter(id=operation.id).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_claim_takes_oldest_pending(self):
+        first = self.create_operation()
+        self.create_operation()
+
+        claimed = self.claim("worker-a")
+
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual(claimed.status, "processing")
+        self.assertEqual(claimed.worker_id, "worker-a")
+        self.assertEqual(claimed.attempts, 1)
+        self.assertGreater(claimed.lease_expires_at, timezone.now())
+
+    def test_claimed_operation_is_not_claimed_again(self):
+        self.create_operation()
+
+        self.assertIsNotNone(self.claim("worker-a"))
+        self.assertIsNone(self.claim("worker-b"))
+
+    def test_claim_race_has_a_single_winner(self):
+        operation = self.create_operation()
+        claimable = PDFOperation.claimable.__func__
+        calls = []
+
+        def racing_claimable(cls, now, max_attempts):
+            calls.append(now)
+            if len(calls) == 2:
+                # worker-b has listed its candidates; worker-a claims the
+                # row before worker-b's conditional UPDATE runs
+                self.assertEqual(self.claim("worker-a").id, operation.id)
+            return claimable(cls, now, max_attempts)
+
+        with mock.patch.object(
+            PDFOperation, "claimable", classmethod(racing_claimable)
+        ):
+            self.assertIsNone(self.claim("worker-b"))
+
+        operation.refresh_from_db()
+        self.assertEqual(operation.worker_id, "worker-a")
+        self.assertEqual(operation.attempts, 1)
+
+    def test_expired_lease_is_claimed_by_another_worker(self):
+        self.create_operation()
+        stale = self.claim("worker-a")
+        self.expire_lease(stale)
+
+        claimed = self.claim("worker-b")
+
+        self.assertEqual(claimed.id, stale.id)
+        self.assertEqual(claimed.worker_id, "worker-b")
+        self.assertEqual(claimed.attempts, 2)
+        self.assertFalse(stale.extend_lease(LEASE_SECONDS))
+        self.assertTrue(claimed.extend_lease(LEASE_SECONDS))
+
+    def test_stale_worker_cannot_complete_reclaimed_operation(self):
+        self.create_operation()
+        stale = self.claim("worker-a")
+        self.expire_lease(stale)
+        current = self.claim("worker-b")
+
+        self.assertFalse(stale.mark_as_completed("stale-output", {"stale": True}))
+
+        current.refresh_from_db()
+        self.assertEqual(current.status, "processing")
+        self.assertEqual(current.worker_id, "worker-b")
+        self.assertIsNone(current.output_file)
+        self.assertEqual(current.attempts, 2)
+
+        self.assertTrue(current.mark_as_completed("output", {}))
+        current.refresh_from_db()
+        self.assertEqual(current.status, "completed")
+        self.assertEqual(current.output_file, "output")
+        self.assertIsNone(current.lease_expires_at)
+
+    def test_stale_worker_cannot_fail_reclaimed_operation(self):
+        self.create_operation()
+        stale = self.claim("worker-a")
+        self.expire_lease(stale)
+        current = self.claim("worker-b")
+
+        self.assertFalse(stale.mark_as_failed("timed out"))
+
+        current.refresh_from_db()
+        self.assertEqual(current.status, "processing")
+        self.assertIsNone(current.error_message)
+
+    def test_finished_operation_cannot_be_finished_again(self):
+        self.create_operation()
+        operation = self.claim("worker-a")
+
+        self.assertTrue(operation.mark_as_failed("broken"))
+        self.assertFalse(operation.mark_as_completed("output"))
+
+        operation.refresh_from_db()
+        self.assertEqual(operation.status, "failed")
+
+    def test_exhausted_operations_are_not_claimed_and_get_failed(self):
+        operation = self.create_operation()
+        for attempt in range(MAX_ATTEMPTS):
+            self.assertIsNotNone(self.claim(f"worker-{attempt}"))
+            self.expire_lease(operation)
+
+        self.assertIsNone(self.claim("worker-last"))
+        self.assertEqual(PDFOperation.fail_abandoned(MAX_ATTEMPTS), 1)
+
+        operation.refresh_from_db()
+        self.assertEqual(operation.status, "failed")
+        self.assertEqual(operation.attempts, MAX_ATTEMPTS)
+
+    def test_run_drops_output_when_lease_was_lost(self):
+        self.create_operation()
+        stale = self.claim("worker-a")
+        outputs = []
+
+        def run_rotate(operation):
+            # Another worker takes the operation over while this one runs
+            self.expire_lease(operation)
+            self.claim("worker-b")
+            outputs.append(create_download_file(b"%PDF-1.4", "rotated.pdf"))
+            return outputs[0], {}
+
+        with mock.patch.dict(jobs.OPERATION_RUNNERS, {"rotate": run_rotate}):
+            self.assertFalse(jobs.execute_operation(stale, LEASE_SECONDS))
+
+        self.assertFalse(TemporaryFile.objects.filter(id=outputs[0].id).exists())
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, "processing")
+        self.assertEqual(stale.worker_id, "worker-b")
+        self.assertIsNone(stale.output_file)
+
+
+class ResultCacheTests(TestCase):
+    """Reuse of the output of an identical earlier operation"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            FILE_UPLOAD_TEMP_DIR=f"{self.media_root}/tmp",
+            PDF_RESULT_CACHE=True,
+            PDF_RESULT_CACHE_MAX_ENTRIES=10,
+            PDF_PROFILE_SAMPLE_RATE=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.runs = []
+        runners = mock.patch.dict(jobs.OPERATION_RUNNERS, {"rotate": self.run_rotate})
+        runners.start()
+        self.addCleanup(runners.stop)
+        self.input_file = create_download_file(b"%PDF-1.4 input", "input.pdf")
+
+    def run_rotate(self, operation):
+        self.runs.append(operation.id)
+        output_file = create_download_file(
+            f"%PDF-1.4 run {len(self.runs)}".encode(), "rotated.pdf"
+        )
+        return output_file, {"pages": 1}
+
+    def run_rotate_operation(self, input_file=None, **parameters):
+        parameters = parameters or {"rotation": 90}
+        PDFOperation.objects.create(
+            operation_type="rotate",
+            status="pending",
+            input_files=[str((input_file or self.input_file).id)],
+            parameters=parameters,
+        )
+        operation = PDFOperation.claim_next("worker", LEASE_SECONDS, MAX_ATTEMPTS)
+        return jobs.run_operation(operation)
+
+    def read(self, temp_file):
+        with open(temp_file.full_file_path, "rb") as f:
+            return f.read()
+
+    def test_identical_operation_hits(self):
+        first_output, first_result = self.run_rotate_operation()
+        second_output, second_result = self.run_rotate_operation()
+
+        self.assertEqual(len(self.runs), 1)
+        self.assertNotIn("cached", first_result)
+        self.assertEqual(second_result, {"pages": 1, "cached": True})
+        self.assertEqual(self.read(second_output), self.read(first_output))
+        self.assertEqual(OperationCacheEntry.objects.get().hit_count, 1)
+
+    def test_identical_contents_under_another_file_hit(self):
+        self.run_rotate_operation()
+        copy = create_download_file(b"%PDF-1.4 input", "copy.pdf")
+
+        self.run_rotate_operation(copy)
+
+        self.assertEqual(len(self.runs), 1)
+
+    def test_hit_gets_its_own_output_file(self):
+        first_output, _ = self.run_rotate_operation()
+        second_output, _ = self.run_rotate_operation()
+        content = self.read(first_output)
+
+        self.assertNotEqual(first_output.id, second_output.id)
+        first_output.delete()
+        self.assertEqual(self.read(second_output), content)
+
+        # The entry went with its output file: the next run does the work
+        self.assertFalse(OperationCacheEntry.objects.exists())
+        self.run_rotate_operation()
+        self.assertEqual(len(self.runs), 2)
+
+    def test_changed_parameters_miss(self):
+        self.run_rotate_operation(rotation=90)
+        self.run_rotate_operation(rotation=180)
+        self.run_rotate_operation(rotation=90, pages=None)
+
+        self.assertEqual(len(self.runs), 2)
+
+    def test_changed_input_misses(self):
+        self.run_rotate_operation()
+        self.run_rotate_operation(create_download_file(b"%PDF-1.4 other", "other.pdf"))
+
+        self.assertEqual(len(self.runs), 2)
+
+    def test_changed_archive_settings_miss(self):
+        self.run_rotate_operation()
+        with self.settings(PDF_ARCHIVE_FORMAT="tar"):
+            self.run_rotate_operation()
+        with self.settings(PDF_ARCHIVE_COMPRESSION="store"):
+            self.run_rotate_operation()
+        with self.settings(PDF_ARCHIVE_COMPRESSLEVEL=9):
+            self.run_rotate_operation()
+
+        self.assertEqual(len(self.runs), 4)
+
+    def test_expired_entry_misses(self):
+        self.run_rotate_operation()
+        OperationCacheEntry.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.run_rotate_operation()
+
+        self.assertEqual(len(self.runs), 2)
+        # Storing the new result dropped the expired entry
+        self.assertEqual(OperationCacheEntry.objects.count(), 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with self.settings(PDF_RESULT_CACHE_MAX_ENTRIES=2):
+            self.run_rotate_operation(rotation=90)
+            self.run_rotate_operation(rotation=180)
+            # A hit makes rotation=90 the most recently used entry
+            self.run_rotate_operation(rotation=90)
+            self.run_rotate_operation(rotation=270)
+
+            self.assertEqual(OperationCacheEntry.objects.count(), 2)
+            self.run_rotate_operation(rotation=90)
+            self.run_rotate_operation(rotation=180)
+
+        self.assertEqual(len(self.runs), 4)
+
+    def test_disabled_cache_always_runs(self):
+        with self.settings(PDF_RESULT_CACHE=False):
+            self.run_rotate_operation()
+            self.run_rotate_operation()
+
+        self.assertEqual(len(self.runs), 2)
+        self.assertFalse(OperationCacheEntry.objects.exists())
+        self.assertEqual(cache.get_cache_stats()["hits"], 0)
+
+
+class ArchiveBuilderTests(SimpleTestCase):
+    """ZIP archives written by ArchiveBuilder, read back with zipfile"""
+
+    text = b"page text " * 10000
+    noise = os.urandom(100000)
+
+    def build(self, entries, streamed=(), **options):
+        output = io.BytesIO()
+        with ArchiveBuilder(output, **options) as archive:
+            for name, data in entries:
+                if name in streamed:
+                    with archive.open(name) as entry:
+                        for start in range(0, len(data), 4096):
+                            entry.write(data[start : start + 4096])
+                else:
+                    archive.add(name, data)
+        output.seek(0)
+        zip_file = zipfile.ZipFile(output)
+        self.assertIsNone(zip_file.testzip())
+        self.assertEqual(
+            [(info.filename, zip_file.read(info)) for info in zip_file.infolist()],
+            list(entries),
+        )
+        return zip_file
+
+    def compress_types(self, zip_file):
+        return {info.filename: info.compress_type for info in zip_file.infolist()}
+
+    def test_auto_deflates_only_entries_that_shrink(self):
+        entries = [("text.txt", self.text), ("noise.bin", self.noise)]
+        for streamed in ((), ("text.txt", "noise.bin")):
+            with self.subTest(streamed=streamed):
+                zip_file = self.build(entries, streamed)
+
+                self.assertEqual(
+                    self.compress_types(zip_file),
+                    {"text.txt": zipfile.ZIP_DEFLATED, "noise.bin": zipfile.ZIP_STORED},
+                )
+
+    def test_auto_decides_from_the_beginning_of_an_entry(self):
+        zip_file = self.build([("mixed.bin", self.noise + self.text)])
+
+        entry = zip_file.getinfo("mixed.bin")
+        self.assertEqual(entry.compress_type, zipfile.ZIP_STORED)
+
+    def test_fixed_compression(self):
+        entries = [("text.txt", self.text), ("noise.bin", self.noise)]
+        for compression, compress_type in (
+            ("deflate", zipfile.ZIP_DEFLATED),
+            ("store", zipfile.ZIP_STORED),
+        ):
+            with self.subTest(compression=compression):
+                zip_file = self.build(entries, ("noise.bin",), compression=compression)
+
+                self.assertEqual(
+                    set(self.compress_types(zip_file).values()), {compress_type}
+                )
+
+    def test_unsupported_compression(self):
+        with self.assertRaises(ValueError):
+            ArchiveBuilder(io.BytesIO(), compression="bzip2")
+
+    def test_parallel_compression_keeps_entry_order(self):
+        entries = [
+            (f"page-{number}.txt", self.text + str(number).encode())
+            for number in range(12)
+        ]
+        entries.insert(5, ("streamed.bin", self.noise))
+
+        zip_file = self.build(entries, ("streamed.bin",), workers=3)
+
+        self.assertEqual(len(zip_file.infolist()), 13)
+
+    def test_non_ascii_names(self):
+        self.build([("página 1.pdf", self.text)])
+
+    def test_zip64_entry_count(self):
+        entries = [(f"{number}.txt", b"x") for number in range(12)]
+        with mock.patch.object(zipfile, "ZIP_FILECOUNT_LIMIT", 10):
+            zip_file = self.build(entries)
+
+        zip_file.fp.seek(0)
+        self.assertIn(b"PK\x06\x06", zip_file.fp.read())
+
+    def test_zip64_sizes_and_offsets(self):
+        entries = [("text.txt", self.text), ("noise.bin", self.noise)]
+        with mock.patch.object(zipfile, "ZIP64_LIMIT", 1000):
+            zip_file = self.build(entries, ("noise.bin",), force_zip64=True)
+            self.build(entries, workers=2)
+
+        zip_file.fp.seek(0)
+        self.assertIn(b"PK\x06\x06", zip_file.fp.read())
+
+    def test_large_streamed_entry_needs_force_zip64(self):
+        with mock.patch.object(zipfile, "ZIP64_LIMIT", 1000):
+            with self.assertRaises(zipfile.LargeZipFile):
+                with ArchiveBuilder(io.BytesIO()) as archive:
+                    with archive.open("noise.bin") as entry:
+                        entry.write(self.noise)
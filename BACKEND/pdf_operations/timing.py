@@ -0,0 +1,87 @@
+"""
+Stage timers and counters of the PDF operation being run.
+
+run_operation (jobs.py) collects them with collect_metrics() and stores
+them on PDFOperation.metrics; the operations wrap each phase in
+stage("name") and report sizes with count(). Outside of an operation
+(validate endpoints, management commands) both do nothing.
+
+Stage times are exclusive: the time of a nested stage is not counted
+again in the stage around it, so the stages add up to at most the total.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("pdf_operation_metrics", default=None)
+
+
+class OperationMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stages = {}
+        self.counts = {}
+        # Time spent in nested stages, one slot per open stage
+        self.nested = [0.0]
+
+    def as_dict(self):
+        finished = self.finished or time.perf_counter()
+        return {
+            "total_ms": round((finished - self.started) * 1000, 2),
+            "stages_ms": {
+                name: round(seconds * 1000, 2) for name, seconds in self.stages.items()
+            },
+            "counts": dict(self.counts),
+        }
+
+
+@contextmanager
+def collect_metrics():
+    """Collect the stages and counts of the code run inside the block"""
+    metrics = OperationMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        metrics.finished = time.perf_counter()
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the block to stage name"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    metrics.nested.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = metrics.nested.pop()
+        metrics.nested[-1] += elapsed
+        metrics.stages[name] = metrics.stages.get(name, 0.0) + elapsed - nested
+
+
+def count(name, value=1):
+    """Add value to counter name"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.counts[name] = metrics.counts.get(name, 0) + value
+
+
+def timed_iter(iterable, name):
+    """Iterate over iterable, adding the time spent producing items to stage name"""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
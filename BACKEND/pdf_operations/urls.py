@@ -32,6 +32,8 @@ urlpatterns = [
         views.get_operation_result,
         name="get_operation_result",
     ),
+    # Result cache statistics
+    path("cache/stats/", views.cache_stats, name="cache_stats"),
     # General info endpoint
     path("", views.pdf_operations_info, name="pdf_operations_info"),
     # Future endpoints:
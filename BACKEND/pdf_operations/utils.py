@@ -1,14 +1,34 @@
-import io
 import os
 import zipfile
-from io import BytesIO
+from contextlib import ExitStack
 
-import fitz  # PyMuPDF
+from django.conf import settings
 from django.core.files.base import ContentFile
 from file_manager.models import TemporaryFile
-from file_manager.utils import create_download_file
+from file_manager.utils import DownloadFileWriter, resolve_temporary_files
 from PIL import Image
-from PyPDF2 import PdfReader, PdfWriter
+
+from .archives import archive_filename, create_archive
+from .document_cache import document_cache
+from .documents import get_document_info, inspect_documents
+from .engines import ENGINES, get_engine
+from .rendering import iter_rendered_pages, page_filename, renders_serially
+from .timing import count, stage, timed_iter
+
+
+class OperationOutputFile(DownloadFileWriter):
+    """DownloadFileWriter that times storing the output and counts its size"""
+
+    def commit(self):
+        with stage("store"):
+            temp_file = super().commit()
+        count("output_bytes", temp_file.file_size)
+        return temp_file
+
+
+def count_inputs(temp_files):
+    count("input_files", len(temp_files))
+    count("input_bytes", sum(temp_file.file_size for temp_file in temp_files))
 
 
 def validate_pdf_files(file_ids):
@@ -16,33 +36,23 @@ def validate_pdf_files(file_ids):
     Validate that all file IDs exist, are PDFs, and are not expired
     Returns list of TemporaryFile objects or raises ValueError
     """
-    files = []
-
-    for file_id in file_ids:
-        try:
-            temp_file = TemporaryFile.objects.get(id=file_id)
-        except TemporaryFile.DoesNotExist:
-            raise ValueError(f"File with ID {file_id} not found")
-
-        # Check if file is expired
-        if temp_file.is_expired:
-            raise ValueError(f"File {temp_file.original_filename} has expired")
 
-        # Check if physical file exists
-        if not temp_file.file_exists:
-            raise ValueError(
-                f"Physical file {temp_file.original_filename} not found on storage"
-            )
-
-        # Check if file is PDF
+    def check_is_pdf(temp_file):
         if temp_file.mime_type != "application/pdf":
             raise ValueError(
                 f"File {temp_file.original_filename} is not a PDF (type: {temp_file.mime_type})"
             )
 
-        files.append(temp_file)
-
-    return files
+    # One query for every file (with its stored document info) and
+    # concurrent existence checks, whatever the number of files
+    with stage("validate"):
+        pdf_files = resolve_temporary_files(
+            file_ids,
+            check=check_is_pdf,
+            queryset=TemporaryFile.objects.select_related("pdf_info"),
+        )
+    count_inputs(pdf_files)
+    return pdf_files
 
 
 def merge_pdf_files(file_ids, output_filename="merged_document.pdf"):
@@ -63,83 +73,69 @@ def merge_pdf_files(file_ids, output_filename="merged_document.pdf"):
 
     # Validate input files
     pdf_files = validate_pdf_files(file_ids)
-
-    # Create PDF writer for output
-    pdf_writer = PdfWriter()
+    engine = get_engine("merge")
 
     try:
-        # Process each PDF file
-        for temp_file in pdf_files:
-            # Read the PDF file
-            with open(temp_file.full_file_path, "rb") as pdf_file:
-                pdf_reader = PdfReader(pdf_file)
-
-                # Check if PDF is encrypted
-                if pdf_reader.is_encrypted:
-                    raise ValueError(
-                        f"PDF {temp_file.original_filename} is encrypted and cannot be merged"
-                    )
-
-                # Add all pages to the writer
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    pdf_writer.add_page(page)
-
-        # Create output buffer
-        output_buffer = io.BytesIO()
-        pdf_writer.write(output_buffer)
-        output_buffer.seek(0)
-
-        # Create temporary file for the merged PDF
-        merged_file = create_download_file(
-            file_content=output_buffer.getvalue(), filename=output_filename
-        )
-
-        return merged_file
+        with ExitStack() as stack:
+            # Open every PDF, refusing encrypted ones
+            documents = [
+                stack.enter_context(document_cache.open(engine, temp_file, "merged"))
+                for temp_file in pdf_files
+            ]
+            total_pages = sum(engine.page_count(document) for document in documents)
+            count("input_pages", total_pages)
+
+            # Write the merged PDF straight to its temporary file
+            with OperationOutputFile(output_filename) as output:
+                engine.merge(documents, output.file, output.path)
+            count("output_pages", total_pages)
+
+        return output.temp_file
 
     except Exception as e:
         raise Exception(f"Failed to merge PDFs: {str(e)}")
 
 
-def get_pdf_info(temp_file):
+def get_pdf_info(temp_file, document_info=None):
     """
-    Get information about a PDF file
+    Get information about a PDF file from its stored document info
 
     Args:
         temp_file: TemporaryFile object
+        document_info: Its PDFDocumentInfo, when already loaded
 
     Returns:
         dict with PDF information
     """
-    try:
-        with open(temp_file.full_file_path, "rb") as pdf_file:
-            pdf_reader = PdfReader(pdf_file)
-
-            info = {
-                "filename": temp_file.original_filename,
-                "pages": len(pdf_reader.pages),
-                "encrypted": pdf_reader.is_encrypted,
-                "size_bytes": temp_file.file_size,
-                "size_mb": round(temp_file.file_size / (1024 * 1024), 2),
-            }
-
-            # Try to get metadata
-            if pdf_reader.metadata:
-                info["title"] = pdf_reader.metadata.get("/Title", "")
-                info["author"] = pdf_reader.metadata.get("/Author", "")
-                info["subject"] = pdf_reader.metadata.get("/Subject", "")
-                info["creator"] = pdf_reader.metadata.get("/Creator", "")
-                info["producer"] = pdf_reader.metadata.get("/Producer", "")
+    if document_info is None:
+        document_info = get_document_info(temp_file)
 
-            return info
-
-    except Exception as e:
+    error = document_info.error
+    if error is None and document_info.page_count is None:
+        error = "PDF is encrypted and requires a password"
+    if error is not None:
         return {
             "filename": temp_file.original_filename,
-            "error": str(e),
+            "error": error,
             "size_bytes": temp_file.file_size,
         }
 
+    info = {
+        "filename": temp_file.original_filename,
+        "pages": document_info.page_count,
+        "encrypted": document_info.encrypted,
+        "size_bytes": temp_file.file_size,
+        "size_mb": round(temp_file.file_size / (1024 * 1024), 2),
+    }
+
+    # Add metadata when the document has any
+    metadata = document_info.metadata
+    if metadata:
+        for key in ("title", "author", "subject", "creator", "producer"):
+            info[key] = metadata.get(key, "")
+
+    return info
+
 
 def validate_merge_operation(file_ids):
     """
@@ -151,16 +147,29 @@ def validate_merge_operation(file_ids):
     Returns:
         dict with validation results and file information
     """
+
+    def check_can_merge(temp_file, document_info):
+        # Stop at the first encrypted file instead of inspecting the rest
+        if document_info.encrypted or (
+            document_info.error is None and document_info.page_count is None
+        ):
+            raise ValueError(
+                f"PDF {temp_file.original_filename} is encrypted and cannot be merged"
+            )
+
     try:
         pdf_files = validate_pdf_files(file_ids)
 
+        # Files whose info is not stored yet are read concurrently
+        documents_info = inspect_documents(pdf_files, check=check_can_merge)
+
         # Get info for each file
         files_info = []
         total_pages = 0
         total_size = 0
 
-        for temp_file in pdf_files:
-            file_info = get_pdf_info(temp_file)
+        for temp_file, document_info in zip(pdf_files, documents_info):
+            file_info = get_pdf_info(temp_file, document_info)
             files_info.append(file_info)
 
             if "pages" in file_info:
@@ -191,6 +200,62 @@ def validate_merge_operation(file_ids):
         return {"valid": False, "error": str(e), "files_info": []}
 
 
+def plan_split(split_options, total_pages):
+    """
+    Work out the files a split produces, without producing them
+
+    Returns:
+        List of (filename, range of 0-indexed pages)
+
+    Raises:
+        ValueError: If the split options are invalid for the document
+    """
+    mode = split_options.get("mode", "all_pages")
+    output_prefix = split_options.get("output_prefix", "page")
+    parts = []
+
+    if mode == "all_pages":
+        # Split into individual pages
+        for page_num in range(total_pages):
+            filename = f"{output_prefix}_{page_num + 1}.pdf"
+            parts.append((filename, range(page_num, page_num + 1)))
+
+    elif mode == "page_ranges":
+        # Split by specified page ranges
+        ranges = split_options.get("ranges", [])
+        if not ranges:
+            raise ValueError("No page ranges specified")
+
+        for page_range in ranges:
+            start_page = page_range.get("start", 1) - 1  # Convert to 0-indexed
+            end_page = page_range.get("end", total_pages) - 1  # Convert to 0-indexed
+
+            # Validate range
+            if start_page < 0 or end_page >= total_pages or start_page > end_page:
+                raise ValueError(f"Invalid page range: {start_page + 1}-{end_page + 1}")
+
+            filename = f"{output_prefix}_{start_page + 1}_{end_page + 1}.pdf"
+            parts.append((filename, range(start_page, end_page + 1)))
+
+    elif mode == "every_n_pages":
+        # Split every N pages
+        pages_per_split = split_options.get("pages_per_split", 1)
+        if pages_per_split <= 0:
+            raise ValueError("Pages per split must be greater than 0")
+
+        for split_num, start_page in enumerate(
+            range(0, total_pages, pages_per_split), start=1
+        ):
+            end_page = min(start_page + pages_per_split, total_pages)
+            filename = f"{output_prefix}_parte_{split_num}.pdf"
+            parts.append((filename, range(start_page, end_page)))
+
+    else:
+        raise ValueError(f"Invalid split mode: {mode}")
+
+    return parts
+
+
 def split_pdf_by_pages(file_id, split_options):
     """
     Split a PDF file by pages based on different options
@@ -206,145 +271,54 @@ def split_pdf_by_pages(file_id, split_options):
     Returns:
         Tuple of (TemporaryFile object, file_count, is_single_file)
         - Single PDF if only one output file
-        - ZIP file if multiple output files
+        - Archive (PDF_ARCHIVE_FORMAT) if multiple output files
     """
 
     # Validate input file
     pdf_files = validate_pdf_files([file_id])
     source_file = pdf_files[0]
 
-    try:
-        # Read the source PDF
-        with open(source_file.full_file_path, "rb") as pdf_file:
-            pdf_reader = PdfReader(pdf_file)
-
-            # Check if PDF is encrypted
-            if pdf_reader.is_encrypted:
-                raise ValueError(
-                    f"PDF {source_file.original_filename} is encrypted and cannot be split"
-                )
+    engine = get_engine("split")
 
-            total_pages = len(pdf_reader.pages)
+    try:
+        # Read the source PDF, refusing it if encrypted
+        with document_cache.open(engine, source_file, "split") as document:
+            total_pages = engine.page_count(document)
+            count("input_pages", total_pages)
 
             if total_pages == 1:
                 raise ValueError("PDF has only 1 page, cannot split")
 
-            # Generate split files based on mode
-            split_files = []
-            mode = split_options.get("mode", "all_pages")
+            # Plan the output files before producing any of them
             output_prefix = split_options.get("output_prefix", "page")
-
-            if mode == "all_pages":
-                # Split into individual pages
-                for page_num in range(total_pages):
-                    pdf_writer = PdfWriter()
-                    pdf_writer.add_page(pdf_reader.pages[page_num])
-
-                    # Create output buffer
-                    output_buffer = io.BytesIO()
-                    pdf_writer.write(output_buffer)
-                    output_buffer.seek(0)
-
-                    filename = f"{output_prefix}_{page_num + 1}.pdf"
-                    split_files.append(
-                        {"filename": filename, "content": output_buffer.getvalue()}
-                    )
-
-            elif mode == "page_ranges":
-                # Split by specified page ranges
-                ranges = split_options.get("ranges", [])
-                if not ranges:
-                    raise ValueError("No page ranges specified")
-
-                for i, page_range in enumerate(ranges):
-                    start_page = page_range.get("start", 1) - 1  # Convert to 0-indexed
-                    end_page = (
-                        page_range.get("end", total_pages) - 1
-                    )  # Convert to 0-indexed
-
-                    # Validate range
-                    if (
-                        start_page < 0
-                        or end_page >= total_pages
-                        or start_page > end_page
-                    ):
-                        raise ValueError(
-                            f"Invalid page range: {start_page + 1}-{end_page + 1}"
-                        )
-
-                    pdf_writer = PdfWriter()
-                    for page_num in range(start_page, end_page + 1):
-                        pdf_writer.add_page(pdf_reader.pages[page_num])
-
-                    # Create output buffer
-                    output_buffer = io.BytesIO()
-                    pdf_writer.write(output_buffer)
-                    output_buffer.seek(0)
-
-                    filename = f"{output_prefix}_{start_page + 1}_{end_page + 1}.pdf"
-                    split_files.append(
-                        {"filename": filename, "content": output_buffer.getvalue()}
-                    )
-
-            elif mode == "every_n_pages":
-                # Split every N pages
-                pages_per_split = split_options.get("pages_per_split", 1)
-                if pages_per_split <= 0:
-                    raise ValueError("Pages per split must be greater than 0")
-
-                split_num = 1
-                for start_page in range(0, total_pages, pages_per_split):
-                    end_page = min(start_page + pages_per_split - 1, total_pages - 1)
-
-                    pdf_writer = PdfWriter()
-                    for page_num in range(start_page, end_page + 1):
-                        pdf_writer.add_page(pdf_reader.pages[page_num])
-
-                    # Create output buffer
-                    output_buffer = io.BytesIO()
-                    pdf_writer.write(output_buffer)
-                    output_buffer.seek(0)
-
-                    filename = f"{output_prefix}_parte_{split_num}.pdf"
-                    split_files.append(
-                        {"filename": filename, "content": output_buffer.getvalue()}
-                    )
-                    split_num += 1
-
-            else:
-                raise ValueError(f"Invalid split mode: {mode}")
-
-            # Determine output format based on number of files
-            file_count = len(split_files)
+            parts = plan_split(split_options, total_pages)
+            file_count = len(parts)
+            count("output_files", file_count)
+            count("output_pages", sum(len(page_indices) for _, page_indices in parts))
 
             if file_count == 1:
                 # Single PDF output
-                split_file = split_files[0]
-                output_temp_file = create_download_file(
-                    file_content=split_file["content"],
-                    filename=split_file["filename"],
-                    original_temp_file=source_file,
-                )
-                return output_temp_file, file_count, True
+                filename, page_indices = parts[0]
+                with OperationOutputFile(filename) as output:
+                    engine.extract_pages(
+                        document, page_indices, output.file, output.path
+                    )
+                return output.temp_file, file_count, True
 
             else:
-                # Multiple files - create ZIP
-                zip_buffer = io.BytesIO()
-                with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                    for split_file in split_files:
-                        zip_file.writestr(split_file["filename"], split_file["content"])
-
-                zip_buffer.seek(0)
-
-                # Create temporary file for the ZIP
-                zip_filename = f"{output_prefix}_split.zip"
-                zip_temp_file = create_download_file(
-                    file_content=zip_buffer.getvalue(),
-                    filename=zip_filename,
-                    original_temp_file=source_file,
-                )
-
-                return zip_temp_file, file_count, False
+                # Multiple files - each part is added to the archive as it is written
+                archive_name = archive_filename(f"{output_prefix}_split")
+                with OperationOutputFile(archive_name) as output:
+                    # A part can only exceed 4GB if the source does
+                    with stage("archive"), create_archive(
+                        output.file,
+                        force_zip64=source_file.file_size > zipfile.ZIP64_LIMIT,
+                    ) as archive:
+                        for filename, page_indices in parts:
+                            with archive.open(filename) as entry:
+                                engine.extract_pages(document, page_indices, entry)
+
+                return output.temp_file, file_count, False
 
     except Exception as e:
         raise Exception(f"Failed to split PDF: {str(e)}")
@@ -364,30 +338,34 @@ def get_pdf_split_info(file_id):
         pdf_files = validate_pdf_files([file_id])
         temp_file = pdf_files[0]
 
-        with open(temp_file.full_file_path, "rb") as pdf_file:
-            pdf_reader = PdfReader(pdf_file)
+        # Read from the stored document info, the file is not opened
+        file_info = get_pdf_info(temp_file)
+        if "error" in file_info:
+            raise ValueError(file_info["error"])
 
-            total_pages = len(pdf_reader.pages)
+        total_pages = file_info["pages"]
+        encrypted = file_info["encrypted"]
 
-            info = {
-                "filename": temp_file.original_filename,
-                "total_pages": total_pages,
-                "can_split": total_pages > 1,
-                "encrypted": pdf_reader.is_encrypted,
-                "size_bytes": temp_file.file_size,
-                "size_mb": round(temp_file.file_size / (1024 * 1024), 2),
-            }
+        info = {
+            "filename": temp_file.original_filename,
+            "total_pages": total_pages,
+            # Encrypted PDFs that open without a password are still refused
+            "can_split": total_pages > 1 and not encrypted,
+            "encrypted": encrypted,
+            "size_bytes": temp_file.file_size,
+            "size_mb": file_info["size_mb"],
+        }
 
-            # Add split suggestions
-            if total_pages > 1:
-                info["split_suggestions"] = {
-                    "all_pages": f"Split into {total_pages} individual pages",
-                    "every_2_pages": f"Split every 2 pages ({(total_pages + 1) // 2} files)",
-                    "every_5_pages": f"Split every 5 pages ({(total_pages + 4) // 5} files)",
-                    "every_10_pages": f"Split every 10 pages ({(total_pages + 9) // 10} files)",
-                }
+        # Add split suggestions
+        if info["can_split"]:
+            info["split_suggestions"] = {
+                "all_pages": f"Split into {total_pages} individual pages",
+                "every_2_pages": f"Split every 2 pages ({(total_pages + 1) // 2} files)",
+                "every_5_pages": f"Split every 5 pages ({(total_pages + 4) // 5} files)",
+                "every_10_pages": f"Split every 10 pages ({(total_pages + 9) // 10} files)",
+            }
 
-            return info
+        return info
 
     except Exception as e:
         return {"filename": "Unknown", "error": str(e), "can_split": False}
@@ -461,7 +439,6 @@ def validate_split_operation(file_id, split_options):
 
 import zipfile
 
-import fitz  # PyMuPDF
 from PIL import Image
 
 
@@ -470,7 +447,6 @@ def validate_image_files(file_ids):
     Validate that all file IDs exist, are images, and are not expired
     Returns list of TemporaryFile objects or raises ValueError
     """
-    files = []
     allowed_image_types = [
         "image/jpeg",
         "image/jpg",
@@ -481,27 +457,16 @@ def validate_image_files(file_ids):
         "image/webp",
     ]
 
-    for file_id in file_ids:
-        try:
-            temp_file = TemporaryFile.objects.get(id=file_id)
-        except TemporaryFile.DoesNotExist:
-            raise ValueError(f"File with ID {file_id} not found")
-
-        if temp_file.is_expired:
-            raise ValueError(f"File {temp_file.original_filename} has expired")
-
-        if not temp_file.file_exists:
-            raise ValueError(
-                f"Physical file {temp_file.original_filename} not found on storage"
-            )
-
+    def check_is_image(temp_file):
         if temp_file.mime_type not in allowed_image_types:
             raise ValueError(
                 f"File {temp_file.original_filename} is not a supported image (type: {temp_file.mime_type})"
             )
 
-        files.append(temp_file)
-    return files
+    with stage("validate"):
+        image_files = resolve_temporary_files(file_ids, check=check_is_image)
+    count_inputs(image_files)
+    return image_files
 
 
 def convert_pdf_to_images(
@@ -524,7 +489,7 @@ def convert_pdf_to_images(
         pages_range: Tuple (start, end) for page range, None for all pages
 
     Returns:
-        TemporaryFile object of the ZIP file containing images
+        TemporaryFile object of the archive (PDF_ARCHIVE_FORMAT) of images
     """
 
     pdf_files = validate_pdf_files([file_id])
@@ -532,11 +497,16 @@ def convert_pdf_to_images(
 
     if not output_filename:
         base_name = os.path.splitext(pdf_file.original_filename)[0]
-        output_filename = f"{base_name}_images.zip"
+        output_filename = f"{base_name}_images"
+    output_filename = archive_filename(output_filename)
 
     try:
-        pdf_document = fitz.open(pdf_file.full_file_path)
-        total_pages = len(pdf_document)
+        document_info = get_document_info(pdf_file)
+        if document_info.page_count is None:
+            raise ValueError(
+                document_info.error or "PDF is encrypted and requires a password"
+            )
+        total_pages = document_info.page_count
 
         if pages_range:
             start_page, end_page = pages_range
@@ -549,54 +519,35 @@ def convert_pdf_to_images(
         if start_page >= end_page:
             raise ValueError("Invalid page range")
 
-        zip_buffer = io.BytesIO()
-
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            for page_num in range(start_page, end_page):
-                page = pdf_document[page_num]
-
-                mat = fitz.Matrix(dpi / 72, dpi / 72)
-                pix = page.get_pixmap(matrix=mat)
-
-                img_data = pix.tobytes("png")
-                image = Image.open(io.BytesIO(img_data))
-
-                img_buffer = io.BytesIO()
-
-                if output_format.upper() == "JPEG":
-                    if image.mode == "RGBA":
-                        background = Image.new("RGB", image.size, (255, 255, 255))
-                        background.paste(image, mask=image.split()[-1])
-                        image = background
-                    image.save(
-                        img_buffer, format="JPEG", quality=quality, optimize=True
-                    )
-                    file_ext = "jpg"
-                elif output_format.upper() == "PNG":
-                    image.save(img_buffer, format="PNG", optimize=True)
-                    file_ext = "png"
-                elif output_format.upper() == "WEBP":
-                    image.save(
-                        img_buffer, format="WEBP", quality=quality, optimize=True
-                    )
-                    file_ext = "webp"
-                elif output_format.upper() == "TIFF":
-                    image.save(img_buffer, format="TIFF", optimize=True)
-                    file_ext = "tiff"
-                else:
-                    raise ValueError(f"Unsupported output format: {output_format}")
-
-                img_filename = f"page_{page_num + 1:03d}.{file_ext}"
-                zip_file.writestr(img_filename, img_buffer.getvalue())
-
-        pdf_document.close()
+        output_format = output_format.upper()
+        with ExitStack() as stack:
+            document = None
+            if renders_serially(end_page - start_page, settings.PDF_RENDER_WORKERS):
+                # Rendering happens here, reuse the cached parsed document
+                document = stack.enter_context(
+                    document_cache.open(ENGINES["pymupdf"], pdf_file)
+                )
+            rendered_pages = iter_rendered_pages(
+                pdf_file.full_file_path,
+                start_page,
+                end_page,
+                output_format,
+                quality,
+                dpi,
+                workers=settings.PDF_RENDER_WORKERS,
+                chunk_size=settings.PDF_RENDER_CHUNK_SIZE,
+                document=document,
+            )
+            count("input_pages", total_pages)
+            count("output_pages", end_page - start_page)
 
-        zip_buffer.seek(0)
-        converted_file = create_download_file(
-            file_content=zip_buffer.getvalue(), filename=output_filename
-        )
+            # Write the archive straight to its temporary file, pages in order
+            with OperationOutputFile(output_filename) as output:
+                with stage("archive"), create_archive(output.file) as archive:
+                    for page_num, img_data in timed_iter(rendered_pages, "render"):
+                        archive.add(page_filename(page_num, output_format), img_data)
 
-        return converted_file
+        return output.temp_file
 
     except Exception as e:
         raise Exception(f"Failed to convert PDF to images: {str(e)}")
@@ -640,46 +591,47 @@ def convert_images_to_pdf(
         if orientation.lower() == "landscape":
             page_width, page_height = page_height, page_width
 
-        pdf_buffer = io.BytesIO()
         pdf_images = []
 
-        for temp_file in image_files:
-            image = Image.open(temp_file.full_file_path)
-
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-
-            img_width, img_height = image.size
+        with stage("load_images"):
+            for temp_file in image_files:
+                image = Image.open(temp_file.full_file_path)
 
-            scale_x = (page_width - 40) / img_width
-            scale_y = (page_height - 40) / img_height
-            scale = min(scale_x, scale_y)
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
 
-            if scale < 1:
-                new_width = int(img_width * scale)
-                new_height = int(img_height * scale)
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                img_width, img_height = image.size
 
-            pdf_images.append(image)
+                scale_x = (page_width - 40) / img_width
+                scale_y = (page_height - 40) / img_height
+                scale = min(scale_x, scale_y)
 
-        if pdf_images:
-            first_image = pdf_images[0]
-            other_images = pdf_images[1:] if len(pdf_images) > 1 else []
-
-            first_image.save(
-                pdf_buffer,
-                format="PDF",
-                save_all=True,
-                append_images=other_images,
-                resolution=150.0,
-            )
+                if scale < 1:
+                    new_width = int(img_width * scale)
+                    new_height = int(img_height * scale)
+                    image = image.resize(
+                        (new_width, new_height), Image.Resampling.LANCZOS
+                    )
 
-        pdf_buffer.seek(0)
-        converted_file = create_download_file(
-            file_content=pdf_buffer.getvalue(), filename=output_filename
-        )
+                pdf_images.append(image)
+        count("output_pages", len(pdf_images))
+
+        # Write the PDF straight to its temporary file
+        with OperationOutputFile(output_filename) as output:
+            if pdf_images:
+                first_image = pdf_images[0]
+                other_images = pdf_images[1:] if len(pdf_images) > 1 else []
+
+                with stage("serialize"):
+                    first_image.save(
+                        output.file,
+                        format="PDF",
+                        save_all=True,
+                        append_images=other_images,
+                        resolution=150.0,
+                    )
 
-        return converted_file
+        return output.temp_file
 
     except Exception as e:
         raise Exception(f"Failed to convert images to PDF: {str(e)}")
@@ -757,21 +709,13 @@ def rotate_pdf_file(
     if rotation_angle not in valid_angles:
         raise ValueError(f"Invalid rotation angle. Must be one of: {valid_angles}")
 
-    # Create PDF writer for output
-    pdf_writer = PdfWriter()
+    engine = get_engine("rotate")
 
     try:
-        # Read the PDF file
-        with open(temp_file.full_file_path, "rb") as pdf_file:
-            pdf_reader = PdfReader(pdf_file)
-
-            # Check if PDF is encrypted
-            if pdf_reader.is_encrypted:
-                raise ValueError(
-                    f"PDF {temp_file.original_filename} is encrypted and cannot be rotated"
-                )
-
-            total_pages = len(pdf_reader.pages)
+        # Read the PDF file, refusing it if encrypted
+        with document_cache.open(engine, temp_file, "rotated") as document:
+            total_pages = engine.page_count(document)
+            count("input_pages", total_pages)
 
             # Determine which pages to rotate
             if pages == "all":
@@ -786,27 +730,14 @@ def rotate_pdf_file(
                         )
                     pages_to_rotate.append(page_num - 1)
 
-            # Process each page
-            for page_index in range(total_pages):
-                page = pdf_reader.pages[page_index]
-
-                # Rotate the page if it's in the list
-                if page_index in pages_to_rotate:
-                    page.rotate(rotation_angle)
-
-                pdf_writer.add_page(page)
-
-        # Create output buffer
-        output_buffer = io.BytesIO()
-        pdf_writer.write(output_buffer)
-        output_buffer.seek(0)
-
-        # Create temporary file for the rotated PDF
-        rotated_file = create_download_file(
-            file_content=output_buffer.getvalue(), filename=output_filename
-        )
+            # Write the rotated PDF straight to its temporary file
+            with OperationOutputFile(output_filename) as output:
+                engine.rotate(
+                    document, rotation_angle, pages_to_rotate, output.file, output.path
+                )
+            count("output_pages", total_pages)
 
-        return rotated_file
+        return output.temp_file
 
     except Exception as e:
         raise Exception(f"Failed to rotate PDF: {str(e)}")
@@ -1,26 +1,84 @@
 import logging
 
+from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from .cache import get_cache_stats
+from .jobs import run_operation
 from .models import PDFOperation
 from .serializers import (ImagesToPDFSerializer, MergePDFSerializer,
                           PDFOperationResultSerializer, PDFOperationSerializer,
                           PDFSplitInfoSerializer, PDFToImagesSerializer,
                           RotatePDFSerializer, SplitPDFSerializer,
                           SplitValidationSerializer)
-from .utils import (convert_images_to_pdf, convert_pdf_to_images,
-                    get_pdf_split_info, merge_pdf_files, rotate_pdf_file,
-                    split_pdf_by_pages, validate_merge_operation,
+from .utils import (get_pdf_split_info, validate_merge_operation,
                     validate_pdf_to_images_operation,
                     validate_rotate_operation, validate_split_operation)
 
 logger = logging.getLogger(__name__)
 
 
+def _wants_async(request):
+    """
+    Whether the operation should be queued for the background workers:
+    an "async" body/query parameter, else a "Prefer: respond-async" header,
+    else PDF_OPERATIONS_ASYNC_DEFAULT
+    """
+    value = request.data.get("async", request.query_params.get("async"))
+    if value is None:
+        if "respond-async" in request.META.get("HTTP_PREFER", ""):
+            return True
+        return settings.PDF_OPERATIONS_ASYNC_DEFAULT
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def _wants_profile(request):
+    """
+    Whether to profile the operation: a "profile" query parameter or an
+    X-Profile header, honoured for staff users only
+    """
+    if not request.user.is_staff:
+        return False
+    value = request.query_params.get("profile", request.META.get("HTTP_X_PROFILE"))
+    return value is not None and value.lower() in ("1", "true", "yes")
+
+
+def _queued_response(request, operation):
+    """202 Accepted answer for an operation left to the background workers"""
+    status_url = request.build_absolute_uri(
+        reverse("get_operation_status", args=[operation.id])
+    )
+    return Response(
+        {
+            "success": True,
+            "message": "Operation queued",
+            "operation": {
+                "id": operation.id,
+                "status": operation.status,
+                "status_url": status_url,
+                "result_url": request.build_absolute_uri(
+                    reverse("get_operation_result", args=[operation.id])
+                ),
+            },
+        },
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": status_url},
+    )
+
+
+@api_view(["GET"])
+def cache_stats(request):
+    """Hit/miss statistics of the operation result cache"""
+    return Response({"success": True, "stats": get_cache_stats()})
+
+
 @api_view(["GET"])
 def pdf_operations_info(request):
     """General information about PDF operations API"""
@@ -142,9 +200,13 @@ def merge_pdfs(request):
         file_ids = serializer.validated_data["file_ids"]
         output_filename = serializer.validated_data["output_filename"]
 
+        run_async = _wants_async(request)
+
         # Create operation record
         operation = PDFOperation.objects.create(
             operation_type="merge",
+            status="pending" if run_async else "processing",
+            profile=_wants_profile(request),
             input_files=[str(fid) for fid in file_ids],
             parameters={
                 "output_filename": output_filename,
@@ -152,15 +214,15 @@ def merge_pdfs(request):
             },
         )
 
+        if run_async:
+            return _queued_response(request, operation)
+
         try:
             # Mark as processing
             operation.mark_as_processing()
 
             # Perform the merge
-            merged_file = merge_pdf_files(file_ids, output_filename)
-
-            # Mark as completed
-            operation.mark_as_completed(str(merged_file.id))
+            merged_file, _ = run_operation(operation)
 
             # Return success response
             return Response(
@@ -315,32 +377,35 @@ def split_pdf(request):
                 "pages_per_split"
             )
 
+        run_async = _wants_async(request)
+
         # Create operation record
         operation = PDFOperation.objects.create(
             operation_type="split",
+            status="pending" if run_async else "processing",
+            profile=_wants_profile(request),
             input_files=[str(file_id)],
             parameters=split_options,
         )
 
+        if run_async:
+            return _queued_response(request, operation)
+
         try:
             # Mark as processing
             operation.mark_as_processing()
 
             # Perform the split
-            split_result, file_count, is_single_file = split_pdf_by_pages(
-                file_id, split_options
-            )
-
-            # Mark as completed
-            operation.mark_as_completed(str(split_result.id))
+            split_result, result = run_operation(operation)
+            file_count = result["file_count"]
+            is_single_file = result["is_single_file"]
 
             # Determine response message based on output type
+            file_type = result["file_type"]
             if is_single_file:
                 message = f"Successfully extracted pages as single PDF"
-                file_type = "PDF"
             else:
-                message = f"Successfully split PDF into {file_count} files (ZIP)"
-                file_type = "ZIP"
+                message = f"Successfully split PDF into {file_count} files ({file_type})"
 
             # Return success response
             return Response(
@@ -519,9 +584,13 @@ def pdf_to_images(request):
         if validated_data.get("start_page") and validated_data.get("end_page"):
             pages_range = (validated_data["start_page"], validated_data["end_page"])
 
+        run_async = _wants_async(request)
+
         # Create operation record
         operation = PDFOperation.objects.create(
             operation_type="convert_to_image",
+            status="pending" if run_async else "processing",
+            profile=_wants_profile(request),
             input_files=[str(file_id)],
             parameters={
                 "output_format": output_format,
@@ -532,20 +601,14 @@ def pdf_to_images(request):
             },
         )
 
+        if run_async:
+            return _queued_response(request, operation)
+
         try:
             operation.mark_as_processing()
 
             # Perform the conversion
-            converted_file = convert_pdf_to_images(
-                file_id=file_id,
-                output_format=output_format,
-                quality=quality,
-                dpi=dpi,
-                output_filename=output_filename,
-                pages_range=pages_range,
-            )
-
-            operation.mark_as_completed(str(converted_file.id))
+            converted_file, _ = run_operation(operation)
 
             return Response(
                 {
@@ -611,9 +674,13 @@ def images_to_pdf(request):
         page_size = validated_data["page_size"]
         orientation = validated_data["orientation"]
 
+        run_async = _wants_async(request)
+
         # Create operation record
         operation = PDFOperation.objects.create(
             operation_type="convert_from_image",
+            status="pending" if run_async else "processing",
+            profile=_wants_profile(request),
             input_files=[str(fid) for fid in file_ids],
             parameters={
                 "output_filename": output_filename,
@@ -623,18 +690,14 @@ def images_to_pdf(request):
             },
         )
 
+        if run_async:
+            return _queued_response(request, operation)
+
         try:
             operation.mark_as_processing()
 
             # Perform the conversion
-            converted_file = convert_images_to_pdf(
-                file_ids=file_ids,
-                output_filename=output_filename,
-                page_size=page_size,
-                orientation=orientation,
-            )
-
-            operation.mark_as_completed(str(converted_file.id))
+            converted_file, _ = run_operation(operation)
 
             return Response(
                 {
@@ -800,9 +863,13 @@ def rotate_pdf(request):
         pages = serializer.validated_data["pages"]
         output_filename = serializer.validated_data["output_filename"]
 
+        run_async = _wants_async(request)
+
         # Create operation record
         operation = PDFOperation.objects.create(
             operation_type="rotate",
+            status="pending" if run_async else "processing",
+            profile=_wants_profile(request),
             input_files=[str(file_id)],
             parameters={
                 "rotation_angle": rotation_angle,
@@ -811,17 +878,15 @@ def rotate_pdf(request):
             },
         )
 
+        if run_async:
+            return _queued_response(request, operation)
+
         try:
             # Mark as processing
             operation.mark_as_processing()
 
             # Perform the rotation
-            rotated_file = rotate_pdf_file(
-                file_id, rotation_angle, pages, output_filename
-            )
-
-            # Mark as completed
-            operation.mark_as_completed(str(rotated_file.id))
+            rotated_file, _ = run_operation(operation)
 
             # Return success response
             return Response(
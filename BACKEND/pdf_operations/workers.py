@@ -0,0 +1,140 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StopFlag:
+    """
+    Set from a signal handler. Only a plain attribute is touched there:
+    setting a multiprocessing/threading Event from a handler can deadlock
+    on the lock the interrupted main thread is holding.
+    """
+
+    def __init__(self):
+        self.requested = False
+
+    def set(self, signum=None, frame=None):
+        self.requested = True
+
+
+def worker_main(index, stop_event, options):
+    """
+    Entry point of a worker process: claim pending operations from the
+    database and run them until stop_event is set or SIGTERM is received.
+    The operation being run when the stop is requested is finished first.
+    """
+    # Ctrl+C reaches the whole process group; the supervisor decides
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    stop_flag = StopFlag()
+    signal.signal(signal.SIGTERM, stop_flag.set)
+
+    # Read by the settings: each of the pool's workers is already a process
+    os.environ["PDF_RENDER_WORKERS"] = str(options["render_workers"])
+
+    import django
+
+    django.setup()
+
+    from django.db import close_old_connections
+    from ilovepdf_clone.metrics import REGISTRY
+
+    from .jobs import execute_operation
+    from .models import PDFOperation
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    logger.info(f"Worker {worker_id} started")
+
+    def stopping():
+        return stop_flag.requested or stop_event.is_set()
+
+    while not stopping():
+        close_old_connections()
+        try:
+            operation = PDFOperation.claim_next(
+                worker_id, options["lease_seconds"], options["max_attempts"]
+            )
+        except Exception as e:
+            # Typically a locked database; try again on the next poll
+            logger.warning(f"Worker {worker_id} could not claim work: {str(e)}")
+            operation = None
+
+        if operation is None:
+            time.sleep(options["poll_interval"])
+            continue
+
+        logger.info(f"Worker {worker_id} running operation {operation.id}")
+        execute_operation(operation, options["lease_seconds"])
+
+    # A spawned process ends with os._exit(), which skips the atexit flush
+    REGISTRY.flush()
+    logger.info(f"Worker {worker_id} stopped")
+
+
+class WorkerPool:
+    """
+    Supervise `concurrency` worker processes. Crashed workers are replaced;
+    their operations are picked up again once the lease expires.
+    """
+
+    def __init__(self, concurrency, options, shutdown_timeout=60):
+        # spawn: children start clean instead of inheriting DB connections
+        self.context = multiprocessing.get_context("spawn")
+        self.concurrency = concurrency
+        self.options = options
+        self.shutdown_timeout = shutdown_timeout
+        self.stop_event = self.context.Event()
+        self.stop_flag = StopFlag()
+        self.processes = {}
+
+    def start_worker(self, index):
+        process = self.context.Process(
+            target=worker_main,
+            args=(index, self.stop_event, self.options),
+            name=f"pdf-worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+
+    def run(self, on_event=None):
+        """Run until SIGINT/SIGTERM, then wait for workers to finish their job"""
+        from .models import PDFOperation
+
+        notify = on_event or logger.info
+        signal.signal(signal.SIGINT, self.stop_flag.set)
+        signal.signal(signal.SIGTERM, self.stop_flag.set)
+
+        for index in range(self.concurrency):
+            self.start_worker(index)
+        notify(f"Started {self.concurrency} workers")
+
+        while not self.stop_flag.requested:
+            for index, process in list(self.processes.items()):
+                if not process.is_alive() and not self.stop_flag.requested:
+                    notify(
+                        f"Worker {index} exited with code {process.exitcode}, restarting"
+                    )
+                    self.start_worker(index)
+
+            failed = PDFOperation.fail_abandoned(self.options["max_attempts"])
+            if failed:
+                notify(f"Marked {failed} abandoned operations as failed")
+
+            time.sleep(self.options["poll_interval"])
+
+        notify("Shutting down, waiting for running operations to finish")
+        self.stop_event.set()
+        deadline = time.monotonic() + self.shutdown_timeout
+        for process in self.processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+
+        for index, process in self.processes.items():
+            if process.is_alive():
+                # Its operation is retried by another worker after the lease
+                notify(f"Worker {index} did not stop in time, terminating")
+                process.terminate()
+                process.join()